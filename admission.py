@@ -0,0 +1,118 @@
+"""Control de admisión de pedidos nuevos.
+
+Dos comprobaciones baratas antes de crear un pedido:
+
+- Límite por cliente: un token bucket por cliente (IP; detrás de proxies la
+  de X-Forwarded-For, según PROXY_FIX_HOPS) con ORDER_RATE_LIMIT pedidos por
+  minuto y una ráfaga de ORDER_RATE_BURST; al agotarse se responde 429.
+- Carga de cocina: la espera estimada para un pedido nuevo es
+  pedidos en curso / estaciones * mediana de preparación. Si supera
+  ADMISSION_MAX_WAIT_MINUTES (o hay más de ADMISSION_MAX_IN_FLIGHT pedidos
+  en curso) se responde 503 indicando en cuántos minutos volver a intentar.
+
+El conteo de pedidos en curso se guarda IN_FLIGHT_TTL segundos, así que la
+mayoría de las peticiones no consultan la base de datos. Los buckets viven en
+la memoria de cada worker.
+"""
+import math
+import threading
+import time
+
+IN_FLIGHT_TTL = 2
+# Clientes recordados antes de descartar buckets inactivos
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, message, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+
+class AdmissionController:
+    def __init__(self, max_wait_minutes=45, max_in_flight=None, rate_per_minute=6, burst=3, estimator=None):
+        self.max_wait_minutes = max_wait_minutes
+        self.max_in_flight = max_in_flight
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.estimator = estimator
+        self._buckets = {}
+        self._in_flight = (0, -IN_FLIGHT_TTL)
+        self._lock = threading.Lock()
+
+    def configure(self, max_wait_minutes, max_in_flight, rate_per_minute, burst, estimator):
+        self.max_wait_minutes = max_wait_minutes
+        self.max_in_flight = max_in_flight
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.estimator = estimator
+
+    def in_flight(self):
+        """Pedidos pendientes o en preparación (en caché IN_FLIGHT_TTL segundos)."""
+        count, loaded_at = self._in_flight
+        now = time.monotonic()
+        if now - loaded_at > IN_FLIGHT_TTL:
+            from models import Order
+            count = Order.query.filter(Order.status.in_(('pending', 'preparing'))).count()
+            self._in_flight = (count, now)
+        return count
+
+    def take_token(self, client_id):
+        """Consume un token del cliente; devuelve los segundos a esperar si no hay."""
+        if not self.rate_per_minute:
+            return 0
+        now = time.monotonic()
+        rate = self.rate_per_minute / 60.0
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._prune(now)
+                bucket = self._buckets[client_id] = TokenBucket(self.burst, now)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0
+            return math.ceil((1 - bucket.tokens) / rate)
+
+    def _prune(self, now):
+        # Un bucket lleno equivale a no tener bucket
+        full_after = self.burst / (self.rate_per_minute / 60.0)
+        self._buckets = {client_id: bucket for client_id, bucket in self._buckets.items()
+                         if now - bucket.updated < full_after}
+
+    def estimated_wait(self):
+        """(pedidos en curso, espera estimada en segundos para un pedido nuevo)."""
+        in_flight = self.in_flight()
+        prep_seconds = self.estimator.prep_seconds()[1]
+        stations = self.estimator.stations
+        return in_flight, in_flight / stations * prep_seconds
+
+    def check(self, client_id):
+        """Lanza AdmissionRejected si el pedido no debe aceptarse ahora."""
+        in_flight, wait = self.estimated_wait()
+        max_wait = self.max_wait_minutes * 60
+        over_capacity = self.max_in_flight is not None and in_flight >= self.max_in_flight
+        if wait > max_wait or over_capacity:
+            # Tiempo hasta que la cola baje al límite a la velocidad actual de la cocina
+            retry_after = math.ceil(max(60, wait - max_wait))
+            minutes = math.ceil(retry_after / 60)
+            raise AdmissionRejected(503, f"Kitchen is busy, try again in {minutes} minutes", retry_after)
+
+        # Los pedidos rechazados por carga no consumen tokens del cliente
+        retry_after = self.take_token(client_id)
+        if retry_after:
+            raise AdmissionRejected(429, "Too many orders, please wait a moment", retry_after)
+
+
+admission_controller = AdmissionController()
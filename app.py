@@ -1,18 +1,26 @@
 import os
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+import click
+from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask_socketio import SocketIO, join_room
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from database import db
-from datetime import datetime
+from shared_state import shared_state_url, socketio_queue_options
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, event, or_
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, joinedload, selectinload
+import base64
 import json
 import logging
+import math
+import time
 
 # Configuración de logging
 logging.basicConfig(level=logging.DEBUG)
 
 # Crear la aplicación Flask
 app = Flask(__name__)
-socketio = SocketIO(app)
 
 # Configuración
 app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
@@ -22,13 +30,127 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Cola de mensajes de Socket.IO (redis://...) para repartir eventos entre workers
+app.config["SOCKETIO_MESSAGE_QUEUE"] = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+# threading, eventlet o gevent; por defecto Flask-SocketIO elige el disponible
+app.config["SOCKETIO_ASYNC_MODE"] = os.environ.get("SOCKETIO_ASYNC_MODE")
+# Imágenes de productos: archivos con nombre por hash servidos con caché larga
+app.config["PRODUCT_IMAGE_DIR"] = os.environ.get("PRODUCT_IMAGE_DIR") or os.path.join(app.root_path, "uploads", "products")
+app.config["PRODUCT_IMAGE_MAX_BYTES"] = 5 * 1024 * 1024
+app.config["PRODUCT_IMAGE_MAX_AGE"] = 365 * 24 * 3600
+# Workers de la cola de trabajos en cada proceso web (0 = sólo 'flask run-jobs')
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+# Avisos a clientes: fake (sólo log) o twilio
+app.config["NOTIFICATION_TRANSPORT"] = os.environ.get("NOTIFICATION_TRANSPORT", "fake")
+app.config["TWILIO_ACCOUNT_SID"] = os.environ.get("TWILIO_ACCOUNT_SID")
+app.config["TWILIO_AUTH_TOKEN"] = os.environ.get("TWILIO_AUTH_TOKEN")
+app.config["TWILIO_FROM_NUMBER"] = os.environ.get("TWILIO_FROM_NUMBER")
+# Transiciones de un pedido dentro de esta ventana se avisan una sola vez
+app.config["NOTIFY_COALESCE_SECONDS"] = int(os.environ.get("NOTIFY_COALESCE_SECONDS", 10))
+# Envíos simultáneos y por segundo hacia el proveedor de SMS
+app.config["NOTIFY_MAX_CONCURRENCY"] = int(os.environ.get("NOTIFY_MAX_CONCURRENCY", 8))
+app.config["NOTIFY_RATE_PER_SECOND"] = float(os.environ.get("NOTIFY_RATE_PER_SECOND", 10))
+# Estaciones de cocina que preparan pedidos en paralelo (para estimar entregas)
+app.config["KITCHEN_STATIONS"] = int(os.environ.get("KITCHEN_STATIONS", 4))
+# Control de admisión: espera máxima estimada y límite de pedidos por cliente
+app.config["ADMISSION_MAX_WAIT_MINUTES"] = int(os.environ.get("ADMISSION_MAX_WAIT_MINUTES", 45))
+app.config["ADMISSION_MAX_IN_FLIGHT"] = int(os.environ["ADMISSION_MAX_IN_FLIGHT"]) if os.environ.get("ADMISSION_MAX_IN_FLIGHT") else None
+app.config["ORDER_RATE_LIMIT"] = int(os.environ.get("ORDER_RATE_LIMIT", 6))
+app.config["ORDER_RATE_BURST"] = int(os.environ.get("ORDER_RATE_BURST", 3))
+# Proxies de confianza delante de la app: el límite por cliente usa la IP de
+# X-Forwarded-For que agregó el último de ellos (0 = conexión directa)
+app.config["PROXY_FIX_HOPS"] = int(os.environ.get("PROXY_FIX_HOPS", 0))
+app.config["SHARED_STATE_URL"] = shared_state_url(
+    os.environ.get("SHARED_STATE_URL"), app.config["SOCKETIO_MESSAGE_QUEUE"]
+)
+
+socketio = SocketIO(
+    app,
+    async_mode=app.config["SOCKETIO_ASYNC_MODE"],
+    **socketio_queue_options(app.config["SOCKETIO_MESSAGE_QUEUE"])
+)
+
+if app.config["PROXY_FIX_HOPS"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_HOPS"], x_proto=app.config["PROXY_FIX_HOPS"])
 
 # Inicializar la app con la extensión
 db.init_app(app)
 migrate = Migrate(app, db)
 
 # Importar modelos
-from models import Product, Order, OrderItem, Inventory, ProductIngredient, UserPreferences, Feedback, SalesStats, Category
+from models import Product, Order, OrderItem, OrderItemModifier, ModifierGroup, ModifierOption, ModifierIngredient, Inventory, ProductIngredient, UserPreferences, CustomerOrderLog, CustomerCategoryCount, CustomerCustomization, CustomerRecommendation, Feedback, Category, InsufficientInventoryError, ProductAvailability, legacy_customizations, DailySales, SalesRollup, KitchenLatency, OrderNotification, CookQueueItem, STATS_SETTLE_SECONDS, PROFILE_FOLD_DELAY
+import jobs
+import notifications
+import realtime
+from catalog import catalog_cache
+from eta import kitchen_estimator
+from admission import admission_controller, AdmissionRejected
+from recommendations import build_recommendations
+from images import ImageStore, decode_data_uri
+realtime.configure(app.config["SHARED_STATE_URL"])
+jobs.init_app(app, socketio)
+notifications.configure(notifications.make_transport(
+    app.config["NOTIFICATION_TRANSPORT"], app.config["TWILIO_ACCOUNT_SID"],
+    app.config["TWILIO_AUTH_TOKEN"], app.config["TWILIO_FROM_NUMBER"]
+), app.config["NOTIFY_MAX_CONCURRENCY"], app.config["NOTIFY_RATE_PER_SECOND"])
+catalog_cache.configure(app.config["SHARED_STATE_URL"])
+kitchen_estimator.configure(app.config["KITCHEN_STATIONS"])
+admission_controller.configure(
+    app.config["ADMISSION_MAX_WAIT_MINUTES"], app.config["ADMISSION_MAX_IN_FLIGHT"],
+    app.config["ORDER_RATE_LIMIT"], app.config["ORDER_RATE_BURST"], kitchen_estimator
+)
+image_store = ImageStore(
+    app.config["PRODUCT_IMAGE_DIR"], "/media/products", app.config["PRODUCT_IMAGE_MAX_BYTES"]
+)
+
+# La disponibilidad calculada forma parte del menú: al confirmar un cambio se invalida
+@event.listens_for(Session, 'after_commit')
+def invalidate_catalog_on_availability_change(session):
+    if session.info.pop('availability_changed', None):
+        catalog_cache.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_availability_changes(session):
+    session.info.pop('availability_changed', None)
+
+def resolve_product_image(value):
+    # Las imágenes en línea se guardan en disco; el producto sólo conserva la URL
+    if value and value.startswith('data:'):
+        return image_store.save(decode_data_uri(value))
+    return value, None
+
+# Paginación del listado de pedidos
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+# updated_at se fija al hacer flush, no al confirmar: una transacción lenta puede
+# confirmar con una marca anterior al cursor del cliente. La sincronización
+# vuelve a leer esta ventana anterior al cursor; el cliente reemplaza por id.
+SYNC_SETTLE_SECONDS = 5
+# Cursor de sincronización de una tienda sin pedidos
+SYNC_EPOCH = datetime(1970, 1, 1)
+
+def encode_cursor(timestamp, order_id, exact=False):
+    # exact: continuación de una página, se sigue desde el cursor sin volver a leer
+    raw = json.dumps([timestamp.isoformat(), order_id] + ([1] if exact else []))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor, with_exact=False):
+    try:
+        timestamp, order_id, *exact = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        decoded = (datetime.fromisoformat(timestamp), int(order_id))
+        return decoded + (bool(exact),) if with_exact else decoded
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def parse_date_arg(name, end_of_day=False):
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    # Una fecha sin hora en 'to' incluye el día completo
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
 
 # Rutas del panel de administración
 @app.route('/admin')
@@ -130,8 +252,11 @@ def update_inventory_stock(item_id):
     try:
         item = Inventory.query.get_or_404(item_id)
         data = request.json
-        item.quantity += float(data['quantity'])
+        # Incremento en SQL para no pisar reservas concurrentes de pedidos
+        item.quantity = Inventory.quantity + float(data['quantity'])
         item.last_restock = datetime.utcnow()
+        db.session.flush()
+        ProductAvailability.refresh(inventory_ids=[item.id])
         db.session.commit()
         return jsonify({
             'id': item.id,
@@ -147,12 +272,13 @@ def update_inventory_stock(item_id):
 @app.route('/api/products/all', methods=['GET'])
 def get_all_products():
     try:
-        products = Product.query.all()
+        products = Product.query.options(joinedload(Product.category)).all()
         return jsonify([{
             'id': p.id,
             'name': p.name,
             'description': p.description,
             'image': p.image,
+            'thumbnail': p.thumbnail,
             'price': p.price,
             'category': p.category.name,
             'available': p.available,
@@ -166,10 +292,12 @@ def get_all_products():
 def create_product():
     try:
         data = request.json
+        image, thumbnail = resolve_product_image(data.get('image', ''))
         product = Product(
             name=data['name'],
             description=data.get('description', ''),
-            image = data.get('image', ''),
+            image=image,
+            thumbnail=thumbnail,
             price=float(data['price']),
             category_id=int(data.get('category')),
             available=data.get('available', True),
@@ -177,16 +305,21 @@ def create_product():
         )
         db.session.add(product)
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify({
             'id': product.id,
             'name': product.name,
             'image': product.image,
+            'thumbnail': product.thumbnail,
             'description': product.description,
             'price': product.price,
             'category': product.category.name,
             'available': product.available,
             'stock': product.stock
         })
+    except ValueError as ve:
+        db.session.rollback()
+        return jsonify({'error': str(ve)}), 400
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error creating product: {str(e)}")
@@ -200,23 +333,30 @@ def update_product(product_id):
         
         product.name = data['name']
         product.description = data.get('description', '')
-        product.image = data.get('image', '')
+        # El formulario de administración no envía la imagen: se conserva la actual
+        if 'image' in data:
+            product.image, product.thumbnail = resolve_product_image(data['image'])
         product.price = float(data['price'])
         product.category_id = int(data['category'])
         product.available = data.get('available', True)
         product.stock = int(data.get('stock', 0))
         
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify({
             'id': product.id,
             'name': product.name,
             'description': product.description,
             'image': product.image,
+            'thumbnail': product.thumbnail,
             'price': product.price,
             'category': product.category.name,
             'available': product.available,
             'stock': product.stock
         })
+    except ValueError as ve:
+        db.session.rollback()
+        return jsonify({'error': str(ve)}), 400
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error updating product: {str(e)}")
@@ -228,25 +368,68 @@ def delete_product(product_id):
         product = Product.query.get_or_404(product_id)
         db.session.delete(product)
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify({'message': 'Product deleted successfully'})
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error deleting product: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/products/<int:product_id>/image', methods=['POST'])
+def upload_product_image(product_id):
+    try:
+        product = Product.query.get_or_404(product_id)
+        upload = request.files.get('image')
+        if not upload:
+            return jsonify({'error': 'Image file is required'}), 400
+        try:
+            product.image, product.thumbnail = image_store.save(upload.read(image_store.max_bytes + 1))
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 400
+        db.session.commit()
+        catalog_cache.invalidate()
+        return jsonify({
+            'id': product.id,
+            'image': product.image,
+            'thumbnail': product.thumbnail
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error uploading product image: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/media/products/<path:filename>')
+def product_image(filename):
+    # El nombre depende del contenido, así que la respuesta nunca cambia
+    max_age = app.config["PRODUCT_IMAGE_MAX_AGE"]
+    response = send_from_directory(image_store.root, filename, max_age=max_age)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    return response
+
 @app.route('/api/orders/<int:order_id>/status', methods=['PUT'])
 def update_order_status(order_id):
     try:
         data = request.json
-        order = Order.query.get_or_404(order_id)
+        # Bloquear el pedido: dos cocineros no pueden aceptarlo (y reservar) a la vez.
+        # Items y modificadores se cargan con el pedido: la cola de cocción los recorre
+        order = Order.query_with_items().filter_by(id=order_id).with_for_update(of=Order).first_or_404()
         
         try:
             order.update_status(data['status'])
+            enqueue_order_jobs(order)
+            jobs.after_commit(push_order_etas)
+            cook_queue = CookQueueItem.changes()
             db.session.commit()
+        except InsufficientInventoryError as ie:
+            db.session.rollback()
+            return jsonify({'error': str(ie), 'shortages': ie.shortages}), 400
         except ValueError as ve:
+            db.session.rollback()
             return jsonify({'error': str(ve)}), 400
             
-        socketio.emit('order_status_changed', order.to_dict())
+        order = Order.load_with_items(order_id)
+        realtime.emit_status_change(socketio, order)
+        realtime.emit_cook_queue(socketio, cook_queue)
         return jsonify(order.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -255,42 +438,336 @@ def update_order_status(order_id):
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
+    """Listado paginado de pedidos.
+
+    Parámetros opcionales:
+      status  lista separada por comas (pending,preparing,...)
+      from/to rango de fechas ISO sobre created_at ('to' es inclusivo)
+      limit   tamaño de página (máximo ORDERS_MAX_PAGE_SIZE)
+      cursor  valor 'nextCursor' de la página anterior
+      since   valor 'syncCursor' de una respuesta previa; devuelve sólo
+              los pedidos creados o modificados después de ese punto
+    """
     try:
-        orders = Order.query.order_by(Order.created_at.desc()).all()
-        return jsonify([order.to_dict() for order in orders])
+        limit = max(1, min(request.args.get('limit', ORDERS_PAGE_SIZE, type=int), ORDERS_MAX_PAGE_SIZE))
+        try:
+            date_from = parse_date_arg('from')
+            date_to = parse_date_arg('to', end_of_day=True)
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            since = decode_cursor(request.args['since'], with_exact=True) if request.args.get('since') else None
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 400
+
+        query = Order.query_with_items()
+        statuses = request.args.get('status')
+        if statuses:
+            query = query.filter(Order.status.in_(statuses.split(',')))
+        if date_from:
+            query = query.filter(Order.created_at >= date_from)
+        if date_to:
+            query = query.filter(Order.created_at < date_to)
+
+        if since:
+            # Modo incremental: cambios posteriores al cursor en orden de modificación.
+            # La primera página repite los últimos SYNC_SETTLE_SECONDS; las
+            # siguientes continúan exactamente donde terminó la anterior.
+            since_at, since_id, exact = since
+            if exact:
+                query = query.filter(or_(
+                    Order.updated_at > since_at,
+                    and_(Order.updated_at == since_at, Order.id > since_id)
+                ))
+            else:
+                # Sin bajar de SYNC_EPOCH: cursores antiguos de tiendas vacías usaban datetime.min
+                settle_from = max(since_at, SYNC_EPOCH + timedelta(seconds=SYNC_SETTLE_SECONDS))
+                query = query.filter(Order.updated_at > settle_from - timedelta(seconds=SYNC_SETTLE_SECONDS))
+            orders = query.order_by(Order.updated_at, Order.id).limit(limit + 1).all()
+            has_more = len(orders) > limit
+            orders = orders[:limit]
+            if orders:
+                sync_cursor = encode_cursor(orders[-1].updated_at, orders[-1].id, exact=has_more)
+            else:
+                sync_cursor = encode_cursor(since_at, since_id)
+            return jsonify({
+                'orders': [order.to_dict() for order in orders],
+                'syncCursor': sync_cursor,
+                'hasMore': has_more
+            })
+
+        # El punto de sincronización se toma antes de leer la página para no
+        # perder cambios que ocurran mientras se sirve la respuesta
+        latest = db.session.query(Order.updated_at, Order.id).order_by(
+            Order.updated_at.desc().nullslast(), Order.id.desc()
+        ).first()
+        if latest and latest.updated_at:
+            sync_cursor = encode_cursor(latest.updated_at, latest.id)
+        else:
+            sync_cursor = encode_cursor(SYNC_EPOCH, 0)
+
+        if cursor:
+            cursor_at, cursor_id = cursor
+            query = query.filter(or_(
+                Order.created_at < cursor_at,
+                and_(Order.created_at == cursor_at, Order.id < cursor_id)
+            ))
+        orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+
+        return jsonify({
+            'orders': [order.to_dict() for order in orders],
+            'nextCursor': encode_cursor(orders[-1].created_at, orders[-1].id) if has_more else None,
+            'syncCursor': sync_cursor
+        })
     except Exception as e:
         app.logger.error(f"Error getting orders: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Seguimiento de pedidos de un cliente con GET condicional y long-poll
+CUSTOMER_ORDERS_LIMIT = 20
+LONG_POLL_MAX_SECONDS = 30
+LONG_POLL_INTERVAL = 0.5
+
+def orders_version(*criteria):
+    """(ETag, Last-Modified) de los pedidos que cumplen 'criteria', sin cargarlos."""
+    count, last_modified = db.session.query(
+        db.func.count(Order.id), db.func.max(Order.updated_at)
+    ).filter(*criteria).one()
+    if last_modified is None:
+        return f"orders-{count}-0", None
+    return f"orders-{count}-{last_modified.timestamp()}", last_modified.replace(tzinfo=timezone.utc)
+
+def wait_for_change(version):
+    """Long-poll: si el cliente ya tiene la versión actual, espera hasta 'wait'
+    segundos a que cambie. Sólo se vuelve a consultar la base de datos cuando
+    avanza la secuencia de eventos de pedidos, y no se retiene la conexión
+    mientras se espera."""
+    etag, last_modified = version()
+    wait = min(max(request.args.get('wait', 0, type=float), 0), LONG_POLL_MAX_SECONDS)
+    if not wait or not request.if_none_match.contains(etag):
+        return etag, last_modified
+    db.session.close()
+    seq = realtime.current_sequence()
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        socketio.sleep(LONG_POLL_INTERVAL)
+        if realtime.current_sequence() == seq:
+            continue
+        seq = realtime.current_sequence()
+        etag, last_modified = version()
+        db.session.close()
+        if not request.if_none_match.contains(etag):
+            break
+    return etag, last_modified
+
+def not_modified(etag, last_modified):
+    """Respuesta 304 si el cliente ya tiene esta versión; si no, None."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified.replace(microsecond=0) <= request.if_modified_since)
+    if not fresh:
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def versioned_json(payload, etag, last_modified):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/customers/<customer_name>/orders', methods=['GET'])
+def get_customer_orders(customer_name):
+    """Últimos pedidos de un cliente, con 'eta' (hora estimada) en los activos.
+
+    Responde 304 si coincide If-None-Match / If-Modified-Since; con
+    ?wait=N (segundos, máximo LONG_POLL_MAX_SECONDS) espera a que algo
+    cambie antes de responder 304.
+    """
+    try:
+        limit = max(1, min(request.args.get('limit', CUSTOMER_ORDERS_LIMIT, type=int), ORDERS_MAX_PAGE_SIZE))
+        etag, last_modified = wait_for_change(lambda: orders_version(Order.customer_name == customer_name))
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
+        orders = Order.query_with_items().filter(Order.customer_name == customer_name).order_by(
+            Order.created_at.desc(), Order.id.desc()
+        ).limit(limit).all()
+        etas = kitchen_estimator.estimate_by_customer().get(customer_name, {})
+        payload = [dict(order.to_dict(), eta=etas.get(order.id)) for order in orders]
+        return versioned_json({'orders': payload}, etag, last_modified)
+    except Exception as e:
+        app.logger.error(f"Error getting customer orders: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+def get_order(order_id):
+    """Un pedido, con las mismas reglas de GET condicional y ?wait= que la lista."""
+    try:
+        if db.session.get(Order, order_id) is None:
+            return jsonify({'error': 'Order not found'}), 404
+        etag, last_modified = wait_for_change(lambda: orders_version(Order.id == order_id))
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
+        order = Order.load_with_items(order_id)
+        return versioned_json(order.to_dict(), etag, last_modified)
+    except Exception as e:
+        app.logger.error(f"Error getting order {order_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def catalog_response(key, build):
+    # Respuesta del catálogo en caché con ETag; devuelve 304 si el cliente ya la tiene
+    body, etag = catalog_cache.get(key, build)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def build_products_payload():
+    products = Product.query.options(
+        joinedload(Product.category), joinedload(Product.availability), selectinload(Product.modifier_groups)
+    ).filter_by(available=True).all()
+    app.logger.debug(f"Found {len(products)} available products")
+    result = []
+    for p in products:
+        max_units = p.availability.max_units if p.availability else None
+        # Agotado según recetas e inventario: se oculta sin tocar 'available'
+        if max_units == 0:
+            continue
+        try:
+            product_dict = {
+                'id': p.id,
+                'name': p.name,
+                'description': p.description,
+                'image': p.image,
+                'thumbnail': p.thumbnail,
+                'price': float(p.price),
+                'category_id': p.category_id,
+                'available': p.available,
+                'stock': p.stock,
+                'max_units': max_units,
+                'category': p.category.to_dict() if p.category else None,
+                'modifierGroups': [group.id for group in p.modifier_groups]
+            }
+            result.append(product_dict)
+        except Exception as product_error:
+            app.logger.error(f"Error serializing product {p.id}: {str(product_error)}")
+            continue
+    return result
+
+def build_products_index():
+    return {product['id']: product for product in build_products_payload()}
+
+def build_modifiers_payload():
+    groups = ModifierGroup.query.options(selectinload(ModifierGroup.options)).order_by(ModifierGroup.sort_order).all()
+    return [group.to_dict() for group in groups]
+
+def build_categories_payload():
+    categories = Category.query.order_by(Category.order).all()
+    return [category.to_dict() for category in categories]
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
     try:
-        products = Product.query.filter_by(available=True).all()
-        app.logger.debug(f"Found {len(products)} available products")
-        result = []
-        for p in products:
-            try:
-                product_dict = {
-                    'id': p.id,
-                    'name': p.name,
-                    'description': p.description,
-                    'image': p.image,
-                    'price': float(p.price),
-                    'category_id': p.category_id,
-                    'available': p.available,
-                    'stock': p.stock,
-                    'category': p.category.to_dict() if p.category else None
-                }
-                result.append(product_dict)
-            except Exception as product_error:
-                app.logger.error(f"Error serializing product {p.id}: {str(product_error)}")
-                continue
-                
-        return jsonify(result)
+        return catalog_response('products', build_products_payload)
     except Exception as e:
         app.logger.error(f"Error getting products: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/modifiers', methods=['GET'])
+def get_modifiers():
+    try:
+        return catalog_response('modifiers', build_modifiers_payload)
+    except Exception as e:
+        app.logger.error(f"Error getting modifiers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/modifiers', methods=['POST'])
+def create_modifier_group():
+    try:
+        data = request.json
+        group = ModifierGroup(
+            code=data['code'],
+            name=data['name'],
+            min_selections=data.get('minSelections', 0),
+            max_selections=data.get('maxSelections'),
+            sort_order=data.get('sortOrder', 0),
+            options=[ModifierOption(
+                code=option['code'],
+                name=option['name'],
+                price_delta=float(option.get('priceDelta', 0)),
+                available=option.get('available', True),
+                sort_order=position
+            ) for position, option in enumerate(data.get('options', []))]
+        )
+        db.session.add(group)
+        db.session.commit()
+        catalog_cache.invalidate()
+        return jsonify(group.to_dict())
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating modifier group: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/modifier-options/<int:option_id>', methods=['PUT'])
+def update_modifier_option(option_id):
+    try:
+        option = ModifierOption.query.get_or_404(option_id)
+        data = request.json
+        option.name = data.get('name', option.name)
+        option.price_delta = float(data.get('priceDelta', option.price_delta))
+        option.available = data.get('available', option.available)
+        db.session.commit()
+        catalog_cache.invalidate()
+        return jsonify(option.to_dict())
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error updating modifier option: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/modifier-options/<int:option_id>/ingredients', methods=['POST'])
+def update_modifier_ingredients(option_id):
+    """Cambios de receta de la opción: cantidad por unidad, negativa si quita ingrediente."""
+    try:
+        ModifierOption.query.get_or_404(option_id)
+        data = request.json
+        ModifierIngredient.query.filter_by(option_id=option_id).delete()
+        for ing_data in data['ingredients']:
+            db.session.add(ModifierIngredient(
+                option_id=option_id,
+                inventory_id=ing_data['ingredientId'],
+                quantity=float(ing_data['quantity'])
+            ))
+        db.session.commit()
+        return jsonify({'message': 'Modifier ingredients updated successfully'})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error updating modifier ingredients: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<int:product_id>/modifier-groups', methods=['PUT'])
+def update_product_modifier_groups(product_id):
+    try:
+        product = Product.query.get_or_404(product_id)
+        group_ids = request.json.get('groupIds', [])
+        groups = ModifierGroup.query.filter(ModifierGroup.id.in_(group_ids)).all()
+        if len(groups) != len(set(group_ids)):
+            return jsonify({'error': 'Unknown modifier group'}), 400
+        product.modifier_groups = groups
+        db.session.commit()
+        catalog_cache.invalidate()
+        return jsonify({'id': product.id, 'modifierGroups': [group.id for group in groups]})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error updating product modifier groups: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # API Routes for Loyalty System
 @app.route('/api/recommendations', methods=['GET'])
 def get_recommendations():
@@ -299,32 +776,48 @@ def get_recommendations():
         return jsonify({'error': 'Customer name is required'}), 400
         
     try:
-        # Get or create user preferences
-        user_prefs = UserPreferences.query.filter_by(customer_name=customer_name).first()
-        if not user_prefs:
-            user_prefs = UserPreferences(customer_name=customer_name)
-            db.session.add(user_prefs)
-            db.session.commit()
-        
-        # Get available products
-        products = Product.query.filter_by(available=True).all()
-        
-        # Get personalized recommendations
-        recommendations = user_prefs.get_recommendations(products)
+        limit = max(1, min(request.args.get('limit', 3, type=int), 10))
+        # Recomendaciones precalculadas; se descarta lo que no está en el menú ahora
+        recommended, popular = CustomerRecommendation.lookup(customer_name)
+        products = catalog_cache.lookup('products_by_id', build_products_index)
+        recommendations, seen = [], set()
+        for product_id in recommended + popular:
+            product = products.get(product_id)
+            if product and product_id not in seen:
+                seen.add(product_id)
+                recommendations.append(product)
+                if len(recommendations) == limit:
+                    break
         
         return jsonify({
             'recommendations': [{
-                'id': p.id,
-                'name': p.name,
-                'description': p.description,
-                'price': p.price,
-                'category': p.category
+                'id': p['id'],
+                'name': p['name'],
+                'description': p['description'],
+                'price': p['price'],
+                'category': p['category']['name'] if p['category'] else None
             } for p in recommendations]
         })
     except Exception as e:
         app.logger.error(f"Error getting recommendations: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/recommendations/rebuild', methods=['POST'])
+def rebuild_recommendations():
+    socketio.start_background_task(run_recommendations_build)
+    return jsonify({'message': 'Recommendations rebuild started'}), 202
+
+def run_recommendations_build():
+    with app.app_context():
+        try:
+            count = build_recommendations()
+            app.logger.info(f"Recomendaciones calculadas para {count} clientes")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error building recommendations: {str(e)}")
+        finally:
+            db.session.remove()
+
 @app.route('/api/loyalty/stats/<customer_name>', methods=['GET'])
 def get_loyalty_stats(customer_name):
     try:
@@ -347,86 +840,166 @@ def get_loyalty_stats(customer_name):
         app.logger.error(f"Error getting loyalty stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Trabajos posteriores al pedido (fuera de la petición, ver jobs.py)
+# Los trabajos se encolan con un pequeño retraso (PROFILE_FOLD_DELAY,
+# STATS_SETTLE_SECONDS) para que una sola ejecución procese los pedidos que
+# llegan juntos
+@jobs.handler('customer_profiles')
+def update_customer_profiles(order_id=None):
+    folded = 0
+    while True:
+        count = UserPreferences.fold_order_log()
+        if not count:
+            break
+        folded += count
+    app.logger.debug(f"Customer profiles updated: {folded} orders folded")
+
+@jobs.handler('sales_stats')
+def update_sales_stats(order_id):
+    processed = DailySales.fold_completed_orders()
+    app.logger.debug(f"Sales stats updated after order {order_id}: {processed} orders folded")
+
+@jobs.handler('send_notifications')
+def send_notifications():
+    """Envía en paralelo los avisos vencidos, por lotes, hasta vaciar la cola."""
+    sent = 0
+    while True:
+        claimed, lease_until = OrderNotification.claim_due()
+        if not claimed:
+            db.session.commit()
+            break
+        # Si este worker muere antes de registrar los resultados, el envío
+        # agendado al vencer la reserva los retoma
+        schedule_notification_dispatch(lease_until)
+        db.session.commit()
+        orders = {order.id: order for order in Order.query.filter(Order.id.in_([order_id for order_id, _ in claimed]))}
+        messages, pending, results = [], [], []
+        for order_id, status in claimed:
+            order = orders.get(order_id)
+            body = notifications.status_message(order, status) if order else None
+            if not body or not order.customer_phone:
+                results.append((order_id, status, None))
+                continue
+            messages.append((order.customer_phone, body))
+            pending.append((order_id, status))
+        db.session.rollback()
+        errors = notifications.get_dispatcher().send_all(messages)
+        results += [(order_id, status, error) for (order_id, status), error in zip(pending, errors)]
+        next_retry = OrderNotification.record_results(results)
+        if next_retry:
+            schedule_notification_dispatch(next_retry)
+            db.session.commit()
+        sent += sum(1 for error in errors if error is None)
+    app.logger.debug(f"Notifications sent: {sent}")
+
+def schedule_notification_dispatch(due_at):
+    # Un solo trabajo de envío por ventana de NOTIFY_COALESCE_SECONDS
+    window = app.config["NOTIFY_COALESCE_SECONDS"]
+    slot = math.ceil(due_at.timestamp() / window)
+    delay = max(0, slot * window - datetime.utcnow().timestamp())
+    jobs.enqueue('send_notifications', key=f"send_notifications:{slot}", delay=delay)
+
+def enqueue_order_jobs(order):
+    """Trabajos en segundo plano que dispara un pedido nuevo o un cambio de estado."""
+    if order.status == 'pending':
+        jobs.enqueue('customer_profiles', {'order_id': order.id},
+                     key=f"customer_profiles:{order.id}", delay=PROFILE_FOLD_DELAY)
+    if order.status == 'completed':
+        jobs.enqueue('sales_stats', {'order_id': order.id},
+                     key=f"sales_stats:{order.id}", delay=STATS_SETTLE_SECONDS)
+    if order.customer_phone:
+        due_at = OrderNotification.schedule(order.id, order.status, app.config["NOTIFY_COALESCE_SECONDS"])
+        schedule_notification_dispatch(due_at)
+
+def push_order_etas():
+    # Sólo lee los pedidos activos, así que es barato tras cada cambio de estado
+    realtime.emit_etas(socketio, kitchen_estimator.estimate_by_customer())
+
+@app.route('/api/orders/eta', methods=['GET'])
+def get_order_etas():
+    """Hora estimada de entrega de los pedidos pendientes y en preparación (sin nombres de clientes)."""
+    try:
+        return jsonify({'etas': kitchen_estimator.estimate(), 'stations': kitchen_estimator.stations})
+    except Exception as e:
+        app.logger.error(f"Error estimating order times: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # Regular API Routes
 @app.route('/api/orders', methods=['POST'])
 def create_order():
     data = request.json
     app.logger.debug(f"Received order data: {data}")
     
+    try:
+        admission_controller.check(request.remote_addr)
+    except AdmissionRejected as ar:
+        app.logger.warning(f"Order from {request.remote_addr} rejected: {str(ar)}")
+        return jsonify({'error': str(ar), 'retryAfter': ar.retry_after}), ar.status_code, {'Retry-After': str(ar.retry_after)}
+
     try:
         app.logger.debug(f"Creating order for customer: {data['customerName']}")
-        # Crear la orden
+        # Todos los productos del pedido en una sola consulta
+        product_ids = {item_data['productId'] for item_data in data['items']}
+        products = {p.id: p for p in Product.query.options(
+            selectinload(Product.modifier_groups).selectinload(ModifierGroup.options)
+        ).filter(Product.id.in_(product_ids))}
+
         order = Order(
             customer_name=data['customerName'],
             customer_phone=data.get('customerPhone', ''),
             status='pending'
         )
-        db.session.add(order)
-        db.session.flush()  # Obtener el ID de la orden
         
         # Añadir items a la orden
         total_amount = 0
         for item_data in data['items']:
-            app.logger.debug(f"Processing item: {item_data}")
-            product = Product.query.get(item_data['productId'])
+            product = products.get(item_data['productId'])
             if not product:
                 app.logger.error(f"Product not found with ID: {item_data['productId']}")
-                db.session.rollback()
                 return jsonify({'error': f"Product {item_data['productId']} not found"}), 404
             
             # Verificar disponibilidad
             if not product.available:
-                db.session.rollback()
                 return jsonify({'error': f"Product {product.name} is not available"}), 400
                 
-            customizations = item_data.get('customizations', {})
-            if 'extras' in customizations and isinstance(customizations['extras'], list):
-                customizations['extras'] = ','.join(customizations['extras'])
+            try:
+                options, instructions = ModifierOption.resolve(product, item_data)
+            except ValueError as ve:
+                return jsonify({'error': str(ve)}), 400
             
-            order_item = OrderItem(
-                order=order,
+            # Precios fijados al momento del pedido
+            unit_price = product.price + sum(option.price_delta for option in options)
+            line_total = unit_price * item_data['quantity']
+            order.items.append(OrderItem(
                 product=product,
                 quantity=item_data['quantity'],
-                customizations=json.dumps(customizations) if customizations else None
-            )
-            db.session.add(order_item)
-            total_amount += product.price * item_data['quantity']
-        
-        db.session.commit()  # Commit the order and items first
-        app.logger.debug(f"Order {order.id} created successfully")
-        
-        try:
-            # Update user preferences
-            user_prefs = UserPreferences.query.filter_by(customer_name=data['customerName']).first()
-            if not user_prefs:
-                user_prefs = UserPreferences(customer_name=data['customerName'])
-                db.session.add(user_prefs)
-            
-            user_prefs.update_preferences(order)
-            db.session.commit()
-            app.logger.debug(f"User preferences updated for order {order.id}")
-        except Exception as e:
-            app.logger.error(f"Error updating user preferences: {str(e)}")
-            # Continue if user preferences update fails
+                instructions=instructions,
+                unit_price=unit_price,
+                line_total=line_total,
+                modifiers=[OrderItemModifier(option=option, price_delta=option.price_delta) for option in options]
+            ))
+            total_amount += line_total
+        order.total_amount = total_amount
         
-        try:
-            # Actualizar estadísticas de ventas
-            stats = SalesStats.create_or_update_daily_stats(order)
-            db.session.add(stats)
-            db.session.commit()
-            app.logger.debug(f"Sales stats updated for order {order.id}")
-        except Exception as e:
-            app.logger.error(f"Error updating sales stats: {str(e)}")
-            # Continue if stats update fails
+        # Pedido e items se insertan en lote y se confirman en una sola transacción
+        db.session.add(order)
+        db.session.flush()
+        order_dict = order.to_dict()
+        db.session.add(CustomerOrderLog(order_id=order.id))
+        CookQueueItem.apply(order, 1)
+        enqueue_order_jobs(order)
+        jobs.after_commit(push_order_etas)
+        cook_queue = CookQueueItem.changes()
+        db.session.commit()
+        app.logger.debug(f"Order {order_dict['id']} created successfully")
         
         # Emitir eventos de WebSocket
-        order_dict = order.to_dict()
-        app.logger.debug(f"Emitting WebSocket events for order {order.id}")
-        socketio.emit('order_update', order_dict)
-        socketio.emit('new_order', order_dict)
+        app.logger.debug(f"Emitting WebSocket events for order {order_dict['id']}")
+        realtime.emit_new_order(socketio, order_dict)
+        realtime.emit_cook_queue(socketio, cook_queue)
         
         # Logging adicional para debug
-        app.logger.info(f"Orden {order.id} creada y eventos WebSocket emitidos")
+        app.logger.info(f"Orden {order_dict['id']} creada y eventos WebSocket emitidos")
         
         return jsonify(order_dict)
         
@@ -473,7 +1046,9 @@ def update_product_ingredients(product_id):
             )
             db.session.add(ingredient)
         
-        # Actualizar stock del producto basado en los ingredientes
+        # Recalcular cuántas unidades se pueden preparar con la nueva receta
+        db.session.flush()
+        ProductAvailability.refresh(product_ids=[product_id])
         db.session.commit()
         return jsonify({'message': 'Ingredients updated successfully'})
     except Exception as e:
@@ -483,30 +1058,25 @@ def update_product_ingredients(product_id):
 
 @app.route('/api/stats/regenerate', methods=['POST'])
 def regenerate_stats():
+    """Actualiza las estadísticas.
+
+    Sin parámetros incorpora sólo los pedidos completados desde la última
+    ejecución. Con from/to (fechas ISO) recalcula desde cero ese rango de días.
+    """
     try:
-        app.logger.info("Starting stats regeneration...")
-        from models import Order, SalesStats
-        # Limpiar estadísticas existentes
-        SalesStats.query.delete()
-        db.session.commit()
-        
-        # Obtener todas las órdenes completadas
-        completed_orders = Order.query.filter_by(status='completed').order_by(Order.created_at).all()
-        app.logger.info(f"Found {len(completed_orders)} completed orders")
-        
-        # Regenerar estadísticas por cada orden
-        for order in completed_orders:
+        from datetime import date
+        if request.args.get('from') or request.args.get('to'):
             try:
-                stats = SalesStats.create_or_update_daily_stats(order)
-                db.session.add(stats)
-                app.logger.info(f"Updated stats for order {order.id}")
-            except Exception as e:
-                app.logger.error(f"Error processing order {order.id}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        app.logger.info("Stats regeneration completed successfully")
-        return jsonify({'message': 'Sales statistics regenerated successfully'})
+                start_date = date.fromisoformat(request.args['from'])
+                end_date = date.fromisoformat(request.args.get('to') or date.today().isoformat())
+            except (KeyError, ValueError):
+                return jsonify({'error': 'from and to must be ISO dates'}), 400
+            app.logger.info(f"Rebuilding stats from {start_date} to {end_date}")
+            processed = DailySales.rebuild(start_date, end_date)
+        else:
+            processed = DailySales.fold_completed_orders()
+        app.logger.info(f"Stats regeneration completed: {processed} orders processed")
+        return jsonify({'message': 'Sales statistics regenerated successfully', 'processed': processed})
     except Exception as e:
         app.logger.error(f"Error regenerating stats: {str(e)}")
         db.session.rollback()
@@ -515,51 +1085,23 @@ def regenerate_stats():
 @app.route('/api/stats/daily', methods=['GET'])
 def get_daily_stats():
     try:
-        from datetime import date, timedelta
-        from models import SalesStats # Import added here
+        from datetime import date
         today = date.today()
         
-        # Intentar obtener estadísticas del día
-        stats = SalesStats.query.filter_by(date=today).first()
-        print(stats)
-        if not stats:
-            # Si no hay estadísticas para hoy, crear un nuevo registro
-            stats = SalesStats(
-                date=today,
-                total_sales=0.0,
-                order_count=0,
-                avg_order_value=0.0,
-                popular_items=json.dumps({}),
-                category_sales=json.dumps({}),
-                peak_hours=json.dumps({})
-            )
-            db.session.add(stats)
-            db.session.commit()
-        
-        # Asegurarse de que todos los campos JSON sean válidos
-        try:
-            popular_items = json.loads(stats.popular_items) if stats.popular_items else {}
-        except json.JSONDecodeError:
-            popular_items = {}
-            
-        try:
-            category_sales = json.loads(stats.category_sales) if stats.category_sales else {}
-        except json.JSONDecodeError:
-            category_sales = {}
-            
-        try:
-            peak_hours = json.loads(stats.peak_hours) if stats.peak_hours else {}
-        except json.JSONDecodeError:
-            peak_hours = {}
+        report = DailySales.report(today, today)
+        if not report:
+            return jsonify({
+                'total_sales': 0.0,
+                'order_count': 0,
+                'avg_order_value': 0.0,
+                'popular_items': {},
+                'category_sales': {},
+                'peak_hours': {}
+            })
         
-        return jsonify({
-            'total_sales': float(stats.total_sales or 0),
-            'order_count': int(stats.order_count or 0),
-            'avg_order_value': float(stats.avg_order_value or 0),
-            'popular_items': popular_items,
-            'category_sales': category_sales,
-            'peak_hours': peak_hours
-        })
+        stats = report[0]
+        stats.pop('date')
+        return jsonify(stats)
     except Exception as e:
         app.logger.error(f"Error getting daily stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -568,8 +1110,7 @@ def get_daily_stats():
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     try:
-        categories = Category.query.order_by(Category.order).all()
-        return jsonify([category.to_dict() for category in categories])
+        return catalog_response('categories', build_categories_payload)
     except Exception as e:
         app.logger.error(f"Error getting categories: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -587,6 +1128,7 @@ def create_category():
         )
         db.session.add(category)
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify(category.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -606,6 +1148,7 @@ def update_category(category_id):
         category.active = data.get('active', category.active)
         
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify(category.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -618,6 +1161,7 @@ def delete_category(category_id):
         category = Category.query.get_or_404(category_id)
         db.session.delete(category)
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify({'message': 'Category deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -627,34 +1171,238 @@ def delete_category(category_id):
 def get_weekly_stats():
     try:
         from datetime import date, timedelta
-        from models import SalesStats # Import added here
         end_date = date.today()
         start_date = end_date - timedelta(days=7)
         
-        stats = SalesStats.query.filter(
-            SalesStats.date.between(start_date, end_date)
-        ).all()
-        
-        return jsonify([{
-            'date': stat.date.isoformat(),
-            'total_sales': stat.total_sales,
-            'order_count': stat.order_count,
-            'avg_order_value': stat.avg_order_value,
-            'popular_items': json.loads(stat.popular_items or '{}'),
-            'category_sales': json.loads(stat.category_sales or '{}'),
-            'peak_hours': json.loads(stat.peak_hours or '{}')
-        } for stat in stats])
+        return jsonify(DailySales.report(start_date, end_date))
     except Exception as e:
         app.logger.error(f"Error getting weekly stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/range', methods=['GET'])
+def get_range_stats():
+    """Estadísticas de un rango arbitrario desde las tablas pre-agregadas.
+
+    Parámetros: from, to (fechas ISO, inclusive), granularity=day|week|month
+    y top (cantidad de productos más vendidos).
+    """
+    try:
+        from datetime import date, timedelta
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'week', 'month'):
+            return jsonify({'error': 'granularity must be day, week or month'}), 400
+        try:
+            end_date = date.fromisoformat(request.args.get('to') or date.today().isoformat())
+            start_date = date.fromisoformat(request.args.get('from') or (end_date - timedelta(days=29)).isoformat())
+        except ValueError:
+            return jsonify({'error': 'from and to must be ISO dates'}), 400
+        if start_date > end_date:
+            return jsonify({'error': 'from must not be after to'}), 400
+        top = max(1, min(request.args.get('top', 10, type=int), 100))
+
+        return jsonify(SalesRollup.range_report(start_date, end_date, granularity, top))
+    except Exception as e:
+        app.logger.error(f"Error getting range stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/kitchen/metrics')
+def get_kitchen_metrics():
+    """Percentiles de espera en cola (pending -> preparing) y de preparación
+    (preparing -> ready), en total, por producto y por hora."""
+    try:
+        return jsonify(KitchenLatency.report())
+    except Exception as e:
+        app.logger.error(f"Error getting kitchen metrics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/kitchen/queue')
+def get_cook_queue():
+    """Items por cocinar de los pedidos pendientes y en preparación, agrupados
+    por producto y personalización (p. ej. 12 hamburguesas, 4 sin cebolla)."""
+    try:
+        return jsonify(CookQueueItem.snapshot())
+    except Exception as e:
+        app.logger.error(f"Error getting cook queue: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Eventos WebSocket
+@socketio.on('join')
+def handle_join(data):
+    data = data or {}
+    if data.get('room') in realtime.STATION_ROOMS:
+        room = data['room']
+    elif data.get('customer'):
+        room = realtime.customer_room(data['customer'])
+    else:
+        return {'error': 'Unknown room'}
+    join_room(room)
+    # El cliente toma esta secuencia como punto de partida para detectar saltos
+    return {'room': room, 'seq': realtime.current_sequence()}
+
+@app.cli.command('migrate-product-images')
+def migrate_product_images():
+    """Mueve a disco las imágenes guardadas en línea en Product.image."""
+    product_ids = [row.id for row in db.session.query(Product.id).filter(Product.image.like('data:%'))]
+    for product_id in product_ids:
+        product = db.session.get(Product, product_id)
+        try:
+            product.image, product.thumbnail = image_store.save(decode_data_uri(product.image))
+            db.session.commit()
+            app.logger.info(f"Imagen del producto {product_id} movida a {product.image}")
+        except ValueError as e:
+            db.session.rollback()
+            app.logger.error(f"Error migrating image of product {product_id}: {str(e)}")
+    catalog_cache.invalidate()
+
+@app.cli.command('refresh-availability')
+def refresh_availability():
+    """Recalcula las unidades disponibles de todos los productos."""
+    changed = ProductAvailability.refresh()
+    db.session.commit()
+    app.logger.info(f"Disponibilidad actualizada para {len(changed)} productos")
+
+@app.cli.command('build-recommendations')
+def build_recommendations_command():
+    """Recalcula las recomendaciones precalculadas de todos los clientes."""
+    count = build_recommendations()
+    app.logger.info(f"Recomendaciones calculadas para {count} clientes")
+
+@app.cli.command('rebuild-customer-profiles')
+def rebuild_customer_profiles():
+    """Reconstruye los perfiles de clientes desde todo el historial de pedidos."""
+    for model in (CustomerOrderLog, CustomerCategoryCount, CustomerCustomization):
+        model.query.delete(synchronize_session=False)
+    UserPreferences.query.update({'order_count': 0, 'total_spent': 0.0, 'last_order_date': None},
+                                 synchronize_session=False)
+    db.session.execute(CustomerOrderLog.__table__.insert().from_select(
+        ['order_id'], db.select(Order.id).order_by(Order.id)
+    ))
+    db.session.commit()
+    folded = 0
+    while True:
+        count = UserPreferences.fold_order_log()
+        if not count:
+            break
+        folded += count
+    app.logger.info(f"Perfiles reconstruidos con {folded} pedidos")
+
+@app.cli.command('rebuild-cook-queue')
+def rebuild_cook_queue():
+    """Recalcula la cola de cocción desde los pedidos activos."""
+    CookQueueItem.rebuild()
+    db.session.commit()
+    app.logger.info("Cola de cocción reconstruida")
+
+# Opciones que ofrecía el formulario de personalización antes del catálogo de modificadores
+DEFAULT_MODIFIER_GROUPS = [
+    {'code': 'cooking', 'name': 'Punto de cocción', 'min': 0, 'max': 1, 'options': [
+        ('medium', 'Término medio', 0), ('medium-rare', 'Medio rojo', 0), ('well-done', 'Bien cocido', 0)
+    ]},
+    {'code': 'extras', 'name': 'Extras', 'min': 0, 'max': None, 'options': [
+        ('cheese', 'Queso extra', 50), ('bacon', 'Tocino', 80)
+    ]},
+]
+
+@app.cli.command('seed-modifiers')
+@click.option('--category', 'category_id', default=1, help='Categoría cuyos productos se pueden personalizar')
+def seed_modifiers(category_id):
+    """Crea los grupos de modificadores por defecto y los asigna a una categoría."""
+    existing = {group.code: group for group in ModifierGroup.query.all()}
+    groups = []
+    for position, spec in enumerate(DEFAULT_MODIFIER_GROUPS):
+        group = existing.get(spec['code'])
+        if group is None:
+            group = ModifierGroup(code=spec['code'], name=spec['name'], min_selections=spec['min'],
+                                  max_selections=spec['max'], sort_order=position, options=[
+                ModifierOption(code=code, name=name, price_delta=price, sort_order=index)
+                for index, (code, name, price) in enumerate(spec['options'])
+            ])
+            db.session.add(group)
+        groups.append(group)
+    for product in Product.query.filter_by(category_id=category_id):
+        product.modifier_groups = sorted(set(product.modifier_groups) | set(groups), key=lambda g: g.sort_order)
+    db.session.commit()
+    catalog_cache.invalidate()
+    app.logger.info(f"Modificadores asignados a los productos de la categoría {category_id}")
+
+@app.cli.command('migrate-customizations')
+@click.option('--batch-size', default=1000)
+def migrate_customizations(batch_size):
+    """Pasa las personalizaciones JSON de los items antiguos a modificadores.
+
+    Los items con alguna opción que no está en el catálogo se dejan como están.
+    """
+    options = {(option.group.code, option.code): option for option in
+               ModifierOption.query.options(joinedload(ModifierOption.group))}
+    last_id, migrated, skipped = 0, 0, 0
+    while True:
+        items = OrderItem.query.filter(
+            OrderItem.customizations.isnot(None), OrderItem.id > last_id
+        ).order_by(OrderItem.id).limit(batch_size).all()
+        if not items:
+            break
+        for item in items:
+            customizations = legacy_customizations(item.customizations)
+            instructions = ' '.join(str(customizations.pop('instructions', None) or '').split()) or None
+            selected = [options.get((code, str(value)))
+                        for code, values in customizations.items()
+                        for value in (values if isinstance(values, list) else [values]) if value not in (None, '')]
+            if None in selected:
+                skipped += 1
+                continue
+            item.modifiers = [OrderItemModifier(option=option, price_delta=option.price_delta)
+                              for option in {option.id: option for option in selected}.values()]
+            item.instructions = instructions
+            item.customizations = None
+            migrated += 1
+        last_id = items[-1].id
+        db.session.commit()
+    app.logger.info(f"{migrated} items migrados a modificadores, {skipped} sin cambios")
+
+@app.cli.command('run-jobs')
+@click.option('--workers', default=1, help='Hilos que procesan la cola')
+def run_jobs(workers):
+    """Procesa la cola de trabajos en primer plano (worker dedicado)."""
+    import threading
+    threads = [threading.Thread(target=jobs.work, args=(app,), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Falla si alguna consulta frecuente recorre completa una tabla grande."""
+    from query_plans import check_plans
+    failures = check_plans()
+    for name, tables in failures:
+        app.logger.error(f"Consulta '{name}' sin índice: Seq Scan en {', '.join(tables)}")
+    if failures:
+        raise SystemExit(1)
+    app.logger.info("Todas las consultas frecuentes usan índices")
+
+@app.cli.command('analytics-snapshot')
+@click.argument('path')
+def analytics_snapshot(path):
+    """Exporta el historial de pedidos a columnas .npy en PATH (ver analytics.py)."""
+    try:
+        from analytics import SalesColumns
+    except ImportError as e:
+        app.logger.error(f"analytics-snapshot requires NumPy ({str(e)}); install the 'numpy' dependency")
+        raise SystemExit(1)
+    columns = SalesColumns.load(db.session)
+    columns.save(path)
+    app.logger.info(f"{len(columns.lines['order_id'])} items exportados a {path}")
+
 # Inicialización de la base de datos
 def init_db():
     with app.app_context():
         try:
-            db.create_all()
-            # Ejecutar migraciones si es necesario
-            from flask_migrate import upgrade
+            from flask_migrate import stamp, upgrade
+            tables = sa_inspect(db.engine).get_table_names()
+            if tables and 'alembic_version' not in tables:
+                # Base creada con db.create_all antes de que hubiera migraciones
+                stamp(revision='0001_baseline')
             upgrade()
         except Exception as e:
             app.logger.error(f"Error initializing database: {str(e)}")
@@ -662,4 +1410,8 @@ def init_db():
 
 if __name__ == '__main__':
     init_db()
+    # El recargador de debug ejecuta este bloque también en el proceso que
+    # vigila los archivos; los workers sólo arrancan en el que sirve
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.start_workers(app, socketio, app.config["JOB_WORKERS"])
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""Caché en memoria del catálogo del menú (productos y categorías).
+
+Cada worker guarda el JSON ya serializado junto con la versión del catálogo
+con la que se generó. Cualquier cambio de productos o categorías incrementa
+la versión; como el contador vive en SHARED_STATE_URL cuando hay varios
+workers, todos invalidan su copia a la vez. Una lectura con la caché
+caliente no hace ninguna consulta a la base de datos.
+"""
+import hashlib
+import json
+import threading
+
+from shared_state import make_counter
+
+VERSION_KEY = 'burgerapp:catalog-version'
+
+
+class CatalogCache:
+    def __init__(self):
+        self._version = make_counter(VERSION_KEY)
+        self._entries = {}
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def configure(self, state_url):
+        self._version = make_counter(VERSION_KEY, state_url)
+        with self._lock:
+            self._entries.clear()
+            self._objects.clear()
+
+    def version(self):
+        return self._version.value()
+
+    def get(self, key, build):
+        """Devuelve (cuerpo JSON, ETag) de 'key', regenerándolo si cambió la versión."""
+        version = self.version()
+        entry = self._entries.get(key)
+        if entry and entry[0] == version:
+            return entry[1], entry[2]
+
+        # Si se invalida mientras se construye, la entrada queda guardada con la
+        # versión anterior y la siguiente lectura la vuelve a generar
+        body = json.dumps(build())
+        digest = hashlib.sha1(body.encode()).hexdigest()[:16]
+        etag = f"{key}-{version}-{digest}"
+        with self._lock:
+            self._entries[key] = (version, body, etag)
+        return body, etag
+
+    def lookup(self, key, build):
+        """Objeto generado por 'build' sin serializar (p. ej. un índice por id)."""
+        version = self.version()
+        entry = self._objects.get(key)
+        if entry and entry[0] == version:
+            return entry[1]
+        value = build()
+        with self._lock:
+            self._objects[key] = (version, value)
+        return value
+
+    def invalidate(self):
+        self._version.incr()
+
+
+catalog_cache = CatalogCache()
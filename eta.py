@@ -0,0 +1,100 @@
+"""Hora estimada de entrega de los pedidos activos.
+
+La cola de cocina se simula con KITCHEN_STATIONS estaciones en paralelo: los
+pedidos en preparación ocupan una estación por el tiempo que les falta y los
+pendientes se asignan en orden de llegada a la primera estación libre. La
+duración de cada pedido es la mediana histórica de preparación (p50 de
+KitchenLatency) del producto más lento que contiene.
+
+Sólo se leen los pedidos pendientes y en preparación; las medianas se
+recalculan como mucho una vez cada PREP_CACHE_TTL segundos.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import db
+
+ACTIVE_STATUSES = ('pending', 'preparing')
+# Si todavía no hay historial de preparación
+DEFAULT_PREP_SECONDS = 600
+PREP_CACHE_TTL = 60
+
+
+class KitchenEstimator:
+    def __init__(self, stations=4):
+        self.stations = stations
+        self._prep = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def configure(self, stations):
+        self.stations = max(1, int(stations))
+
+    def prep_seconds(self):
+        """({product_id: p50 en segundos}, p50 general), en caché PREP_CACHE_TTL segundos."""
+        with self._lock:
+            if self._prep is None or time.monotonic() - self._loaded_at > PREP_CACHE_TTL:
+                from models import KitchenLatency
+                by_product, overall = {}, DEFAULT_PREP_SECONDS
+                for (metric, dimension, key), sketch in KitchenLatency.sketches('prep_time').items():
+                    if dimension == 'product':
+                        by_product[int(key)] = sketch.quantile(0.5)
+                    elif dimension == 'all':
+                        overall = sketch.quantile(0.5) or DEFAULT_PREP_SECONDS
+                self._prep = (by_product, overall)
+                self._loaded_at = time.monotonic()
+            return self._prep
+
+    def estimate(self, now=None):
+        """{order_id: {'estimatedReadyAt', 'waitSeconds', 'queuePosition'}} de los pedidos activos.
+
+        No incluye nombres de clientes: es la vista pública de la cola.
+        """
+        return {order_id: estimate
+                for estimates in self.estimate_by_customer(now).values()
+                for order_id, estimate in estimates.items()}
+
+    def estimate_by_customer(self, now=None):
+        """{customer_name: {order_id: estimación}}, para enviar a cada cliente sólo lo suyo."""
+        from models import Order, OrderItem
+        now = now or datetime.utcnow()
+        by_product, overall = self.prep_seconds()
+
+        rows = db.session.query(
+            Order.id, Order.customer_name, Order.status, Order.preparing_at, OrderItem.product_id
+        ).join(OrderItem, OrderItem.order_id == Order.id).filter(
+            Order.status.in_(ACTIVE_STATUSES)
+        ).order_by(Order.created_at, Order.id).all()
+
+        orders = {}
+        for order_id, customer_name, status, preparing_at, product_id in rows:
+            entry = orders.setdefault(order_id, {
+                'customer_name': customer_name, 'status': status, 'preparing_at': preparing_at, 'seconds': 0
+            })
+            entry['seconds'] = max(entry['seconds'], by_product.get(product_id) or overall)
+
+        # Cada estación se representa por el instante (segundos desde 'now') en que queda libre
+        stations = [0.0] * self.stations
+        for entry in orders.values():
+            if entry['status'] == 'preparing' and entry['preparing_at']:
+                elapsed = (now - entry['preparing_at']).total_seconds()
+                entry['ready_in'] = max(0.0, entry['seconds'] - elapsed)
+                heapq.heapreplace(stations, max(stations[0], entry['ready_in']))
+        by_customer = {}
+        position = 0
+        for order_id, entry in orders.items():
+            if 'ready_in' not in entry:
+                position += 1
+                entry['ready_in'] = heapq.heappop(stations) + entry['seconds']
+                heapq.heappush(stations, entry['ready_in'])
+            by_customer.setdefault(entry['customer_name'], {})[order_id] = {
+                'estimatedReadyAt': (now + timedelta(seconds=entry['ready_in'])).isoformat(),
+                'waitSeconds': round(entry['ready_in']),
+                'queuePosition': position if entry['status'] == 'pending' else 0
+            }
+        return by_customer
+
+
+kitchen_estimator = KitchenEstimator()
@@ -0,0 +1,101 @@
+"""Almacén de imágenes de productos en disco.
+
+Los archivos se guardan con un nombre derivado del hash de su contenido, así
+que una URL nunca cambia de contenido y se puede servir con caché de larga
+duración. Junto a cada imagen se genera una miniatura para el menú con Pillow
+(dependencia declarada); si falta, se registra un error en cada subida y la
+miniatura es la propia imagen.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (480, 480)
+
+# Firmas de los formatos aceptados; no se confía en la extensión enviada
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'png', 'PNG'),
+    (b'GIF87a', 'gif', 'GIF'),
+    (b'GIF89a', 'gif', 'GIF'),
+)
+
+
+def detect_format(data):
+    for signature, extension, pil_format in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return extension, pil_format
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp', 'WEBP'
+    raise ValueError("Unsupported image format (use JPEG, PNG, GIF or WebP)")
+
+
+def decode_data_uri(value):
+    """Contenido binario de un 'data:image/...;base64,...'."""
+    try:
+        header, encoded = value.split(',', 1)
+        if not header.startswith('data:image/') or ';base64' not in header:
+            raise ValueError("Only base64 image data URIs are supported")
+        return base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid image data: {str(e)}")
+
+
+class ImageStore:
+    def __init__(self, root, url_prefix, max_bytes):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_bytes = max_bytes
+
+    def url_for(self, filename):
+        return f"{self.url_prefix}/{filename}"
+
+    def save(self, data):
+        """Guarda la imagen y su miniatura; devuelve (url imagen, url miniatura)."""
+        if not data:
+            raise ValueError("Empty image")
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Image exceeds {self.max_bytes} bytes")
+        extension, pil_format = detect_format(data)
+
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        filename = f"{digest}.{extension}"
+        os.makedirs(self.root, exist_ok=True)
+        self._write(filename, data)
+
+        thumbnail = self._make_thumbnail(data, pil_format)
+        if thumbnail is None:
+            return self.url_for(filename), self.url_for(filename)
+        thumbnail_name = f"{digest}_thumb.{extension}"
+        self._write(thumbnail_name, thumbnail)
+        return self.url_for(filename), self.url_for(thumbnail_name)
+
+    def _write(self, filename, data):
+        path = os.path.join(self.root, filename)
+        if os.path.exists(path):
+            return
+        # Escritura atómica: otro worker nunca ve un archivo a medias
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _make_thumbnail(self, data, pil_format):
+        try:
+            from PIL import Image
+        except ImportError:
+            logger.error("Pillow is not installed; thumbnail falls back to the full-size image "
+                         "(install the 'pillow' dependency)")
+            return None
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, format=pil_format, optimize=True)
+            return output.getvalue()
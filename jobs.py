@@ -0,0 +1,179 @@
+"""Trabajo en segundo plano: tareas tras el commit y cola persistente.
+
+after_commit() registra una tarea efímera (p. ej. avisos por socket) que
+corre en segundo plano sólo si la transacción confirma; si se revierte se
+descarta. Si el proceso se reinicia antes de ejecutarla, se pierde.
+
+enqueue() guarda el trabajo en la tabla 'job' dentro de la misma
+transacción que lo origina (outbox), así que sobrevive a reinicios y nunca
+se ejecuta por un pedido que no llegó a confirmarse. Los workers
+(start_workers o 'flask run-jobs') toman los trabajos con SKIP LOCKED,
+ejecutan el handler registrado con @handler(kind) y, si falla, lo
+reintentan con espera exponencial hasta max_attempts. Un trabajo en
+ejecución queda reservado JOB_LEASE_SECONDS; si el worker muere, otro lo
+retoma al vencer la reserva. Los handlers deben tolerar ejecutarse más de
+una vez. Los trabajos terminados se borran pasadas JOB_RETENTION_HOURS
+(los fallidos se conservan para revisarlos).
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+
+PENDING_KEY = 'after_commit_jobs'
+WAKE_KEY = 'jobs_enqueued'
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF_SECONDS = 5
+JOB_LEASE_SECONDS = 300
+JOB_POLL_SECONDS = 1
+JOB_RETENTION_HOURS = 24
+JOB_PURGE_SECONDS = 3600
+
+_handlers = {}
+_wake = threading.Event()
+
+
+def after_commit(func, *args):
+    db.session.info.setdefault(PENDING_KEY, []).append((func, args))
+
+
+def handler(kind):
+    """Registra la función que ejecuta los trabajos de tipo 'kind'."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, key=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+    """Agrega un trabajo a la transacción actual; con 'key' repetida no se duplica."""
+    from models import Job, upsert_rows
+    upsert_rows(Job, [{
+        'kind': kind,
+        'payload': json.dumps(payload or {}),
+        'idempotency_key': key,
+        'status': 'pending',
+        'attempts': 0,
+        'max_attempts': max_attempts,
+        'run_after': datetime.utcnow() + timedelta(seconds=delay),
+        'created_at': datetime.utcnow()
+    }], keys=('idempotency_key',))
+    db.session.info[WAKE_KEY] = True
+
+
+def claim_job():
+    """Reserva el próximo trabajo vencido; devuelve (id, kind, payload, intento, máximo)."""
+    from models import Job
+    now = datetime.utcnow()
+    job = Job.query.filter(
+        Job.status.in_(('pending', 'running')), Job.run_after <= now
+    ).order_by(Job.run_after, Job.id).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    job.status = 'running'
+    job.attempts += 1
+    job.run_after = now + timedelta(seconds=JOB_LEASE_SECONDS)
+    claimed = (job.id, job.kind, json.loads(job.payload), job.attempts, job.max_attempts)
+    db.session.commit()
+    return claimed
+
+
+def run_next():
+    """Ejecuta un trabajo pendiente; devuelve False si no había ninguno."""
+    from models import Job
+    claimed = claim_job()
+    if claimed is None:
+        return False
+    job_id, kind, payload, attempt, max_attempts = claimed
+    try:
+        _handlers[kind](**payload)
+    except Exception as e:
+        db.session.rollback()
+        retry = attempt < max_attempts
+        delay = JOB_BACKOFF_SECONDS * 2 ** (attempt - 1)
+        Job.query.filter_by(id=job_id).update({
+            'status': 'pending' if retry else 'failed',
+            'run_after': datetime.utcnow() + timedelta(seconds=delay),
+            'last_error': str(e)[:2000]
+        }, synchronize_session=False)
+        db.session.commit()
+        logging.error(f"Error en trabajo {kind}#{job_id} (intento {attempt}/{max_attempts}): {str(e)}")
+    else:
+        # En un trabajo terminado run_after guarda cuándo terminó (ver purge_done)
+        Job.query.filter_by(id=job_id).update({
+            'status': 'done', 'run_after': datetime.utcnow(), 'last_error': None
+        }, synchronize_session=False)
+        db.session.commit()
+    return True
+
+
+def purge_done(retention_hours=JOB_RETENTION_HOURS):
+    """Borra los trabajos terminados hace más de retention_hours; devuelve cuántos."""
+    from models import Job
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    deleted = Job.query.filter(Job.status == 'done', Job.run_after < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def work(app, stop=None):
+    """Bucle de un worker: ejecuta trabajos y espera avisos cuando no hay.
+
+    Sin trabajos pendientes purga los terminados, como mucho cada JOB_PURGE_SECONDS.
+    """
+    purged_at = None
+    with app.app_context():
+        while stop is None or not stop.is_set():
+            try:
+                ran = run_next()
+                if not ran and (purged_at is None or time.monotonic() - purged_at > JOB_PURGE_SECONDS):
+                    purged_at = time.monotonic()
+                    deleted = purge_done()
+                    if deleted:
+                        logging.info(f"{deleted} trabajos terminados eliminados")
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error en el worker de trabajos: {str(e)}")
+                ran = False
+            finally:
+                db.session.remove()
+            if not ran:
+                _wake.wait(JOB_POLL_SECONDS)
+                _wake.clear()
+
+
+def start_workers(app, socketio, count):
+    for _ in range(count):
+        socketio.start_background_task(work, app)
+
+
+def _run(app, func, args):
+    with app.app_context():
+        try:
+            func(*args)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error en tarea {func.__name__}{args}: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def init_app(app, socketio):
+    @event.listens_for(Session, 'after_commit')
+    def start_pending_jobs(session):
+        for func, args in session.info.pop(PENDING_KEY, []):
+            socketio.start_background_task(_run, app, func, args)
+        if session.info.pop(WAKE_KEY, None):
+            _wake.set()
+
+    @event.listens_for(Session, 'after_rollback')
+    def discard_pending_jobs(session):
+        session.info.pop(PENDING_KEY, None)
+        session.info.pop(WAKE_KEY, None)
@@ -1,4 +1,21 @@
-from app import app
+import os
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+# eventlet y gevent deben parchear la librería estándar antes de importar la app
+if os.environ.get("SOCKETIO_ASYNC_MODE") == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+elif os.environ.get("SOCKETIO_ASYNC_MODE") == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app, socketio
+import jobs
+
+# Los workers de la cola arrancan sólo en el servidor, no en los comandos 'flask'
+jobs.start_workers(app, socketio, app.config["JOB_WORKERS"])
+
+# main.py sólo se sirve con gunicorn; el servidor de desarrollo de Werkzeug
+# (python app.py) no es apto para producción:
+#   gunicorn -k eventlet -w 1 --bind 0.0.0.0:5000 main:app
+# (un proceso por puerto detrás de un balanceador con sesiones persistentes
+# y SOCKETIO_MESSAGE_QUEUE apuntando a la misma cola en todos ellos)
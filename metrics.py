@@ -0,0 +1,67 @@
+"""Percentiles aproximados de tiempos de cocina con un sketch logarítmico.
+
+Cada duración se cuenta en un bucket cuyo límite crece geométricamente
+(gamma = (1 + a) / (1 - a)), así que cualquier percentil se obtiene con un
+error relativo de a lo sumo RELATIVE_ACCURACY sin guardar las duraciones.
+Dos sketches se combinan sumando los contadores de cada bucket, lo que
+permite guardarlos como filas (ver KitchenLatency en models.py) que se
+incrementan con upserts y agregarlos por producto, por hora o en total.
+"""
+import math
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_for(seconds):
+    """Bucket de una duración; todo lo menor a un segundo cae en el bucket 0."""
+    if seconds <= 1:
+        return 0
+    return math.ceil(math.log(seconds) / LOG_GAMMA)
+
+
+def bucket_value(bucket):
+    # Punto del bucket con error relativo mínimo respecto a sus límites
+    if bucket <= 0:
+        return 0.0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+class LogSketch:
+    def __init__(self, buckets=None):
+        self.buckets = dict(buckets or {})
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def add(self, seconds, count=1):
+        bucket = bucket_for(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return bucket_value(bucket)
+        return bucket_value(max(self.buckets))
+
+    def summary(self):
+        """{'count', 'p50', 'p90', 'p99'} en segundos redondeados."""
+        result = {'count': self.count}
+        for q in PERCENTILES:
+            value = self.quantile(q)
+            result[f"p{int(q * 100)}"] = round(value, 1) if value is not None else None
+        return result
@@ -0,0 +1,134 @@
+"""Esquema inicial (el que creaba db.create_all antes de las migraciones).
+
+Las instalaciones existentes se marcan con 'flask db stamp 0001_baseline'
+antes del primer 'flask db upgrade'; init_db lo hace automáticamente.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 14:36:02.537397
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('category',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('icon', sa.String(length=50), nullable=True),
+    sa.Column('order', sa.Integer(), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('inventory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('unit', sa.String(length=20), nullable=False),
+    sa.Column('minimum_stock', sa.Float(), nullable=False),
+    sa.Column('last_restock', sa.DateTime(), nullable=True),
+    sa.Column('category', sa.String(length=50), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('order',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_name', sa.String(length=100), nullable=False),
+    sa.Column('customer_phone', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('accepted_at', sa.DateTime(), nullable=True),
+    sa.Column('preparing_at', sa.DateTime(), nullable=True),
+    sa.Column('ready_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('sales_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=True),
+    sa.Column('order_count', sa.Integer(), nullable=True),
+    sa.Column('avg_order_value', sa.Float(), nullable=True),
+    sa.Column('popular_items', sa.Text(), nullable=True),
+    sa.Column('peak_hours', sa.Text(), nullable=True),
+    sa.Column('category_sales', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sales_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sales_stats_date'), ['date'], unique=True)
+
+    op.create_table('user_preferences',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_name', sa.String(length=100), nullable=False),
+    sa.Column('favorite_category', sa.String(length=50), nullable=True),
+    sa.Column('last_order_date', sa.DateTime(), nullable=True),
+    sa.Column('order_count', sa.Integer(), nullable=True),
+    sa.Column('avg_order_rating', sa.Float(), nullable=True),
+    sa.Column('preferred_customizations', sa.Text(), nullable=True),
+    sa.Column('total_spent', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('customer_name')
+    )
+    op.create_table('feedback',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=False),
+    sa.Column('comment', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('product',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('image', sa.Text(), nullable=True),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('available', sa.Boolean(), nullable=True),
+    sa.Column('stock', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('order_item',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('customizations', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('product_ingredient',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('inventory_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['inventory_id'], ['inventory.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('product_ingredient')
+    op.drop_table('order_item')
+    op.drop_table('product')
+    op.drop_table('feedback')
+    op.drop_table('user_preferences')
+    with op.batch_alter_table('sales_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sales_stats_date'))
+
+    op.drop_table('sales_stats')
+    op.drop_table('order')
+    op.drop_table('inventory')
+    op.drop_table('category')
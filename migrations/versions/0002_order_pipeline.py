@@ -0,0 +1,376 @@
+"""Pedidos, cocina, estadísticas y perfiles: columnas, índices y tablas nuevas.
+
+- order: updated_at (sincronización ?since=; en los pedidos anteriores toma
+  created_at), total_amount, stats_folded_at;
+  created_at pasa a NOT NULL con la hora UTC de la base como valor por defecto
+- order_item: instructions, unit_price y line_total, completados en los
+  pedidos anteriores con los precios actuales
+- product: thumbnail
+- índices de las consultas frecuentes (ver query_plans.hot_queries)
+- tablas de estadísticas, perfiles de clientes, cola de trabajos, avisos,
+  cola de cocina, disponibilidad y modificadores
+- sales_stats se elimina: la reemplazan daily_sales y sus tablas hermanas,
+  que se completan con 'POST /api/stats/regenerate'
+
+Revision ID: 0002_order_pipeline
+Revises: 0001_baseline
+Create Date: 2026-10-18 14:36:09.346006
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_order_pipeline'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def utc_now():
+    """La misma expresión que compila models.utc_now en cada base."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.text("timezone('utc', now())")
+    return sa.text('CURRENT_TIMESTAMP')
+
+
+def backfill_totals():
+    """unit_price, line_total y total_amount de los pedidos anteriores.
+
+    No hay registro del precio cobrado: se toma el precio actual del producto,
+    igual que calculaba los totales el esquema anterior (precio * cantidad).
+    Las columnas recién creadas ya bloquean las tablas, así que se completan
+    con un UPDATE cada una en vez de por lotes.
+    """
+    product = sa.table('product', sa.column('id', sa.Integer()), sa.column('price', sa.Float()))
+    item = sa.table('order_item', sa.column('order_id', sa.Integer()), sa.column('product_id', sa.Integer()),
+                    sa.column('quantity', sa.Integer()), sa.column('unit_price', sa.Float()),
+                    sa.column('line_total', sa.Float()))
+    order = sa.table('order', sa.column('id', sa.Integer()), sa.column('total_amount', sa.Float()))
+
+    op.execute(item.update().values(
+        unit_price=sa.select(product.c.price).where(product.c.id == item.c.product_id).scalar_subquery()
+    ))
+    op.execute(item.update().values(line_total=item.c.unit_price * item.c.quantity))
+    op.execute(order.update().values(
+        total_amount=sa.select(sa.func.coalesce(sa.func.sum(item.c.line_total), 0.0)).where(
+            item.c.order_id == order.c.id
+        ).scalar_subquery()
+    ))
+
+
+def upgrade():
+    order = sa.table('order', sa.column('created_at', sa.DateTime()), sa.column('updated_at', sa.DateTime()))
+    op.execute(order.update().where(order.c.created_at.is_(None)).values(created_at=utc_now()))
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('total_amount', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('stats_folded_at', sa.DateTime(), nullable=True))
+        batch_op.alter_column('created_at',
+               existing_type=sa.DateTime(),
+               server_default=utc_now(),
+               nullable=False)
+        batch_op.create_index('ix_order_completed_at', ['completed_at', 'id'], unique=False)
+        batch_op.create_index('ix_order_created_at', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_order_customer_name_created_at', ['customer_name', 'created_at'], unique=False)
+        batch_op.create_index('ix_order_status_created_at', ['status', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_order_updated_at', ['updated_at', 'id'], unique=False)
+
+    # Sin updated_at los pedidos anteriores nunca aparecerían en ?since=
+    op.execute(order.update().values(updated_at=order.c.created_at))
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('instructions', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('unit_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('line_total', sa.Float(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_order_item_order_id'), ['order_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_order_item_product_id'), ['product_id'], unique=False)
+
+    backfill_totals()
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnail', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_product_available'), ['available'], unique=False)
+        batch_op.create_index(batch_op.f('ix_product_category_id'), ['category_id'], unique=False)
+
+    with op.batch_alter_table('product_ingredient', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_ingredient_inventory_id'), ['inventory_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_product_ingredient_product_id'), ['product_id'], unique=False)
+
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_feedback_order_id'), ['order_id'], unique=False)
+
+    # Estadísticas
+    op.create_table('daily_sales',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('date')
+    )
+    op.create_table('daily_product_sales',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('product_name', sa.String(length=100), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('category_name', sa.String(length=50), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('date', 'product_id')
+    )
+    op.create_table('hourly_sales',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('date', 'hour')
+    )
+    op.create_table('sales_rollup',
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('granularity', 'period_start')
+    )
+    op.create_table('product_sales_rollup',
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('product_name', sa.String(length=100), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('category_name', sa.String(length=50), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('granularity', 'period_start', 'product_id')
+    )
+    op.create_table('stats_checkpoint',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('kitchen_latency',
+    sa.Column('metric', sa.String(length=20), nullable=False),
+    sa.Column('dimension', sa.String(length=10), nullable=False),
+    sa.Column('key', sa.String(length=20), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('metric', 'dimension', 'key', 'bucket')
+    )
+    with op.batch_alter_table('sales_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sales_stats_date'))
+    op.drop_table('sales_stats')
+
+    # Perfiles de clientes y recomendaciones
+    op.create_table('customer_order_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('customer_category_count',
+    sa.Column('customer_name', sa.String(length=100), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('customer_name', 'category_id')
+    )
+    op.create_table('customer_customization',
+    sa.Column('customer_name', sa.String(length=100), nullable=False),
+    sa.Column('option', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('customer_name', 'option', 'value')
+    )
+    op.create_table('customer_recommendation',
+    sa.Column('customer_name', sa.String(length=100), nullable=False),
+    sa.Column('product_ids', sa.Text(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('customer_name')
+    )
+    with op.batch_alter_table('customer_recommendation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_customer_recommendation_computed_at'), ['computed_at'], unique=False)
+
+    # Cola de trabajos y avisos
+    op.create_table('job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=200), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_status_run_after', ['status', 'run_after'], unique=False)
+
+    op.create_table('order_notification',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('sent_status', sa.String(length=20), nullable=True),
+    sa.Column('due_at', sa.DateTime(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+    with op.batch_alter_table('order_notification', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_notification_due_at'), ['due_at'], unique=False)
+
+    # Cocina y disponibilidad
+    op.create_table('cook_queue_item',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('customization_key', sa.String(length=40), nullable=False),
+    sa.Column('customizations', sa.Text(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'customization_key')
+    )
+    op.create_table('product_availability',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('max_units', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+
+    # Modificadores
+    op.create_table('modifier_group',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('min_selections', sa.Integer(), nullable=False),
+    sa.Column('max_selections', sa.Integer(), nullable=True),
+    sa.Column('sort_order', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('code')
+    )
+    op.create_table('modifier_option',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('price_delta', sa.Float(), nullable=False),
+    sa.Column('available', sa.Boolean(), nullable=False),
+    sa.Column('sort_order', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['modifier_group.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('group_id', 'code', name='uq_modifier_option_group_code')
+    )
+    with op.batch_alter_table('modifier_option', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_modifier_option_group_id'), ['group_id'], unique=False)
+
+    op.create_table('modifier_ingredient',
+    sa.Column('option_id', sa.Integer(), nullable=False),
+    sa.Column('inventory_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['inventory_id'], ['inventory.id'], ),
+    sa.ForeignKeyConstraint(['option_id'], ['modifier_option.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('option_id', 'inventory_id')
+    )
+    op.create_table('product_modifier_group',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['modifier_group.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'group_id')
+    )
+    op.create_table('order_item_modifier',
+    sa.Column('order_item_id', sa.Integer(), nullable=False),
+    sa.Column('option_id', sa.Integer(), nullable=False),
+    sa.Column('price_delta', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['option_id'], ['modifier_option.id'], ),
+    sa.ForeignKeyConstraint(['order_item_id'], ['order_item.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_item_id', 'option_id')
+    )
+    with op.batch_alter_table('order_item_modifier', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_item_modifier_option_id'), ['option_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_item_modifier', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_item_modifier_option_id'))
+    op.drop_table('order_item_modifier')
+    op.drop_table('product_modifier_group')
+    op.drop_table('modifier_ingredient')
+    with op.batch_alter_table('modifier_option', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_modifier_option_group_id'))
+    op.drop_table('modifier_option')
+    op.drop_table('modifier_group')
+
+    op.drop_table('product_availability')
+    op.drop_table('cook_queue_item')
+
+    with op.batch_alter_table('order_notification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_notification_due_at'))
+    op.drop_table('order_notification')
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_status_run_after')
+    op.drop_table('job')
+
+    with op.batch_alter_table('customer_recommendation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_customer_recommendation_computed_at'))
+    op.drop_table('customer_recommendation')
+    op.drop_table('customer_customization')
+    op.drop_table('customer_category_count')
+    op.drop_table('customer_order_log')
+
+    # Las estadísticas por día no se convierten de vuelta: sales_stats queda vacía
+    op.create_table('sales_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=True),
+    sa.Column('order_count', sa.Integer(), nullable=True),
+    sa.Column('avg_order_value', sa.Float(), nullable=True),
+    sa.Column('popular_items', sa.Text(), nullable=True),
+    sa.Column('peak_hours', sa.Text(), nullable=True),
+    sa.Column('category_sales', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sales_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sales_stats_date'), ['date'], unique=True)
+    op.drop_table('kitchen_latency')
+    op.drop_table('stats_checkpoint')
+    op.drop_table('product_sales_rollup')
+    op.drop_table('sales_rollup')
+    op.drop_table('hourly_sales')
+    op.drop_table('daily_product_sales')
+    op.drop_table('daily_sales')
+
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_feedback_order_id'))
+
+    with op.batch_alter_table('product_ingredient', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_ingredient_product_id'))
+        batch_op.drop_index(batch_op.f('ix_product_ingredient_inventory_id'))
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_category_id'))
+        batch_op.drop_index(batch_op.f('ix_product_available'))
+        batch_op.drop_column('thumbnail')
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_item_product_id'))
+        batch_op.drop_index(batch_op.f('ix_order_item_order_id'))
+        batch_op.drop_column('line_total')
+        batch_op.drop_column('unit_price')
+        batch_op.drop_column('instructions')
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_updated_at')
+        batch_op.drop_index('ix_order_status_created_at')
+        batch_op.drop_index('ix_order_customer_name_created_at')
+        batch_op.drop_index('ix_order_created_at')
+        batch_op.drop_index('ix_order_completed_at')
+        batch_op.alter_column('created_at',
+               existing_type=sa.DateTime(),
+               server_default=None,
+               nullable=True)
+        batch_op.drop_column('stats_folded_at')
+        batch_op.drop_column('total_amount')
+        batch_op.drop_column('updated_at')
@@ -1,5 +1,9 @@
 from database import db
-from datetime import datetime, date
+from datetime import datetime, timedelta
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.expression import FunctionElement
+import hashlib
 import json
 
 class Category(db.Model):
@@ -26,12 +30,15 @@ class Product(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     image = db.Column(db.Text)
+    thumbnail = db.Column(db.String(255))
     price = db.Column(db.Float, nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
-    available = db.Column(db.Boolean, default=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
+    available = db.Column(db.Boolean, default=True, index=True)
     stock = db.Column(db.Integer, default=0)
     ingredients = db.relationship('ProductIngredient', backref='product', lazy=True)
     category = db.relationship('Category', back_populates='products')
+    modifier_groups = db.relationship('ModifierGroup', secondary='product_modifier_group', lazy=True,
+                                      order_by='ModifierGroup.sort_order')
     
     def to_dict(self):
         return {
@@ -39,6 +46,7 @@ class Product(db.Model):
             'name': self.name,
             'description': self.description,
             'image': self.image,
+            'thumbnail': self.thumbnail,
             'price': float(self.price),
             'category_id': self.category_id,
             'category': self.category.to_dict() if self.category else None,
@@ -61,79 +69,344 @@ class Inventory(db.Model):
 
 class ProductIngredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
-    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False, index=True)
     quantity = db.Column(db.Float, nullable=False)
 
+class ProductAvailability(db.Model):
+    """Unidades que se pueden preparar de cada producto con el inventario actual.
+
+    Se mantiene de forma incremental: sólo se recalculan los productos cuya
+    receta usa un ingrediente que cambió. max_units es None si el producto
+    no tiene receta definida.
+    """
+    __tablename__ = 'product_availability'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    max_units = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    product = db.relationship('Product', backref=db.backref('availability', uselist=False, cascade='all, delete-orphan'))
+
+    @staticmethod
+    def refresh(inventory_ids=None, product_ids=None):
+        """Recalcula los productos afectados; sin argumentos recalcula todos.
+
+        El cálculo es una sola agregación en SQL sobre la matriz de recetas:
+        min(floor(stock / cantidad por unidad)) por producto.
+        Devuelve {product_id: max_units} de los valores que cambiaron.
+        """
+        affected = db.session.query(ProductIngredient.product_id)
+        if inventory_ids is not None:
+            affected = affected.filter(ProductIngredient.inventory_id.in_(list(inventory_ids)))
+        affected_ids = {row.product_id for row in affected.distinct()}
+        if product_ids is not None:
+            affected_ids.update(product_ids)
+        elif inventory_ids is None:
+            affected_ids.update(row.id for row in db.session.query(Product.id))
+        if not affected_ids:
+            return {}
+
+        rows = db.session.query(
+            ProductIngredient.product_id,
+            db.func.min(db.func.floor(Inventory.quantity / ProductIngredient.quantity))
+        ).join(
+            Inventory, Inventory.id == ProductIngredient.inventory_id
+        ).filter(
+            ProductIngredient.product_id.in_(affected_ids),
+            ProductIngredient.quantity > 0
+        ).group_by(ProductIngredient.product_id).all()
+        computed = {product_id: max(0, int(units)) for product_id, units in rows}
+
+        current = {row.product_id: row for row in ProductAvailability.query.filter(
+            ProductAvailability.product_id.in_(affected_ids)
+        )}
+        changed = {}
+        for product_id in affected_ids:
+            max_units = computed.get(product_id)
+            row = current.get(product_id)
+            if row is None:
+                db.session.add(ProductAvailability(product_id=product_id, max_units=max_units))
+            elif row.max_units == max_units:
+                continue
+            else:
+                row.max_units = max_units
+            changed[product_id] = max_units
+
+        if changed:
+            # La app invalida la caché del catálogo cuando la transacción confirma
+            db.session.info.setdefault('availability_changed', set()).update(changed)
+        return changed
+
+product_modifier_group = db.Table(
+    'product_modifier_group',
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('group_id', db.Integer, db.ForeignKey('modifier_group.id', ondelete='CASCADE'), primary_key=True)
+)
+
+class ModifierGroup(db.Model):
+    """Grupo de opciones que se pueden elegir para un producto (punto de cocción, extras...).
+
+    'code' es también la clave de las personalizaciones en formato anterior
+    ({'cooking': 'medium', 'extras': ['cheese']}), así que esos pedidos se
+    resuelven contra el catálogo.
+    """
+    __tablename__ = 'modifier_group'
+
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(50), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
+    min_selections = db.Column(db.Integer, nullable=False, default=0)
+    # None: sin límite
+    max_selections = db.Column(db.Integer)
+    sort_order = db.Column(db.Integer, nullable=False, default=0)
+    options = db.relationship('ModifierOption', backref='group', lazy=True,
+                              order_by='ModifierOption.sort_order', cascade='all, delete-orphan')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'code': self.code,
+            'name': self.name,
+            'minSelections': self.min_selections,
+            'maxSelections': self.max_selections,
+            'options': [option.to_dict() for option in self.options]
+        }
+
+class ModifierOption(db.Model):
+    __tablename__ = 'modifier_option'
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('modifier_group.id', ondelete='CASCADE'), nullable=False, index=True)
+    code = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    price_delta = db.Column(db.Float, nullable=False, default=0.0)
+    available = db.Column(db.Boolean, nullable=False, default=True)
+    sort_order = db.Column(db.Integer, nullable=False, default=0)
+    ingredients = db.relationship('ModifierIngredient', backref='option', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (db.UniqueConstraint('group_id', 'code', name='uq_modifier_option_group_code'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'code': self.code,
+            'name': self.name,
+            'priceDelta': float(self.price_delta),
+            'available': self.available
+        }
+
+    @staticmethod
+    def resolve(product, item_data):
+        """Opciones elegidas para un item del pedido, validadas contra los grupos del producto.
+
+        Acepta 'modifiers' (ids de opción) y/o 'customizations' en el formato
+        anterior ({código de grupo: código o [códigos], 'instructions': texto}).
+        Los códigos de grupos que el producto no tiene en el catálogo (p. ej.
+        sin 'flask seed-modifiers') se guardan como texto en las instrucciones.
+        Devuelve (opciones, instrucciones); lanza ValueError si algo no es válido.
+        """
+        groups = {group.id: group for group in product.modifier_groups}
+        offered_codes = {group.code for group in groups.values()}
+        by_id = {option.id: option for group in groups.values() for option in group.options}
+        by_code = {(group.code, option.code): option for group in groups.values() for option in group.options}
+
+        selected = {}
+        for option_id in item_data.get('modifiers') or ():
+            option = by_id.get(option_id)
+            if option is None:
+                raise ValueError(f"Modifier {option_id} is not offered for {product.name}")
+            selected[option.id] = option
+        customizations = dict(item_data.get('customizations') or {})
+        instructions = ' '.join(str(customizations.pop('instructions', None) or '').split()) or None
+        unlisted = []
+        for code, values in customizations.items():
+            for value in (values if isinstance(values, list) else [values]):
+                if value in (None, ''):
+                    continue
+                option = by_code.get((code, str(value)))
+                if option is None and code not in offered_codes:
+                    unlisted.append(f"{code}: {value}")
+                    continue
+                if option is None:
+                    raise ValueError(f"Modifier {code}={value} is not offered for {product.name}")
+                selected[option.id] = option
+        if unlisted:
+            instructions = '; '.join(unlisted + ([instructions] if instructions else []))
+
+        for option in selected.values():
+            if not option.available:
+                raise ValueError(f"Modifier {option.name} is not available")
+        for group in groups.values():
+            count = sum(1 for option in selected.values() if option.group_id == group.id)
+            if count < group.min_selections:
+                raise ValueError(f"{group.name} requires at least {group.min_selections} selection(s)")
+            if group.max_selections is not None and count > group.max_selections:
+                raise ValueError(f"{group.name} allows at most {group.max_selections} selection(s)")
+        return sorted(selected.values(), key=lambda option: (option.group.sort_order, option.sort_order)), instructions
+
+class ModifierIngredient(db.Model):
+    """Cambio de la receta por unidad del item al elegir la opción (negativo si quita)."""
+    __tablename__ = 'modifier_ingredient'
+
+    option_id = db.Column(db.Integer, db.ForeignKey('modifier_option.id', ondelete='CASCADE'), primary_key=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), primary_key=True)
+    quantity = db.Column(db.Float, nullable=False)
+
+class InsufficientInventoryError(ValueError):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ', '.join(shortage['name'] for shortage in shortages)
+        super().__init__(f"No hay suficiente inventario para procesar este pedido: {names}")
+
+# Estado al que puede pasar cada estado: sólo hacia adelante y de a un paso,
+# así cada marca de tiempo, reserva y métrica de cocina se registra una vez
+ORDER_TRANSITIONS = {
+    'pending': ('preparing',),
+    'preparing': ('ready',),
+    'ready': ('completed',),
+    'completed': (),
+}
+
+class utc_now(FunctionElement):
+    """Hora actual en UTC, para server_default de columnas DateTime sin zona."""
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(utc_now, 'postgresql')
+def _utc_now_postgresql(element, compiler, **kw):
+    # now() es la hora local del servidor; las columnas guardan UTC sin zona
+    return "timezone('utc', now())"
+
+@compiles(utc_now)
+def _utc_now_default(element, compiler, **kw):
+    # CURRENT_TIMESTAMP de SQLite ya está en UTC
+    return "CURRENT_TIMESTAMP"
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_phone = db.Column(db.String(20))
     status = db.Column(db.String(20), default='pending')
-    created_at = db.Column(db.DateTime, default=date.today())
+    # La hora se toma en cada inserción (en Python o, fuera del ORM, en la base de datos)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now(), nullable=False)
     accepted_at = db.Column(db.DateTime)
     preparing_at = db.Column(db.DateTime)
     ready_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Suma de line_total de los items, fijada al crear el pedido
+    total_amount = db.Column(db.Float)
+    # Momento en que se sumó a las estadísticas de ventas; nunca se suma dos veces
+    stats_folded_at = db.Column(db.DateTime)
     items = db.relationship('OrderItem', backref='order', lazy=True)
+    # Índices de los accesos frecuentes: cola de cocina y listados (status +
+    # created_at), pedidos de un cliente, sincronización (updated_at) y
+    # estadísticas (completed_at); 'id' desempata el orden de los cursores
+    __table_args__ = (
+        db.Index('ix_order_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_order_created_at', 'created_at', 'id'),
+        db.Index('ix_order_customer_name_created_at', 'customer_name', 'created_at'),
+        db.Index('ix_order_updated_at', 'updated_at', 'id'),
+        db.Index('ix_order_completed_at', 'completed_at', 'id'),
+    )
+
+    @classmethod
+    def query_with_items(cls):
+        # Carga pedidos, items, productos, categorías y modificadores con un
+        # número fijo de consultas sin importar cuántos items haya
+        return cls.query.options(
+            selectinload(cls.items).joinedload(OrderItem.product).joinedload(Product.category),
+            selectinload(cls.items).selectinload(OrderItem.modifiers)
+            .joinedload(OrderItemModifier.option).joinedload(ModifierOption.group)
+        )
+
+    @classmethod
+    def load_with_items(cls, order_id):
+        # populate_existing refresca también los objetos expirados tras un commit
+        return cls.query_with_items().execution_options(populate_existing=True).filter_by(id=order_id).first()
 
     def update_status(self, new_status):
         import logging
         logging.info(f"Actualizando estado del pedido #{self.id} de {self.status} a {new_status}")
+        if new_status not in ORDER_TRANSITIONS:
+            raise ValueError(f"Unknown order status: {new_status}")
+        if new_status not in ORDER_TRANSITIONS.get(self.status, ()):
+            raise ValueError(f"Order #{self.id} cannot change from {self.status} to {new_status}")
         
         if new_status == 'preparing' and self.status == 'pending':
-            logging.info(f"Verificando inventario para pedido #{self.id}")
-            try:
-                if not self.check_inventory():
-                    logging.error(f"Inventario insuficiente para pedido #{self.id}")
-                    raise ValueError("No hay suficiente inventario para procesar este pedido")
-                    
-                logging.info(f"Inventario verificado, actualizando para pedido #{self.id}")
-                self.update_inventory()
-                logging.info(f"Inventario actualizado exitosamente para pedido #{self.id}")
-            except Exception as e:
-                logging.error(f"Error al procesar inventario: {str(e)}")
-                raise
+            logging.info(f"Reservando inventario para pedido #{self.id}")
+            self.reserve_inventory()
+            logging.info(f"Inventario reservado exitosamente para pedido #{self.id}")
             
+        was_queued = self.status in COOK_QUEUE_STATUSES
         self.status = new_status
+        if was_queued != (new_status in COOK_QUEUE_STATUSES):
+            CookQueueItem.apply(self, -1 if was_queued else 1)
         timestamp_field = f"{new_status}_at"
-        if hasattr(self, timestamp_field):
-            setattr(self, timestamp_field, datetime.utcnow())
-            logging.info(f"Timestamp {timestamp_field} actualizado para pedido #{self.id}")
-            
-    def check_inventory(self):
-        for item in self.items:
-            for ingredient in item.product.ingredients:
-                inventory_item = ingredient.ingredient
-                required_quantity = ingredient.quantity * item.quantity
-                if inventory_item.quantity < required_quantity:
-                    return False
-        return True
-        
-    def update_inventory(self):
+        setattr(self, timestamp_field, datetime.utcnow())
+        logging.info(f"Timestamp {timestamp_field} actualizado para pedido #{self.id}")
+        KitchenLatency.record_transition(self, new_status)
+
+    def required_ingredients(self):
+        """Cantidad necesaria de cada ingrediente (inventory_id) para todo el pedido.
+
+        Suma las recetas de los productos y los cambios de los modificadores
+        elegidos (queso extra suma, sin cebolla resta) en una sola agregación.
+        """
+        recipes = db.select(
+            ProductIngredient.inventory_id.label('inventory_id'),
+            (ProductIngredient.quantity * OrderItem.quantity).label('quantity')
+        ).join(OrderItem, OrderItem.product_id == ProductIngredient.product_id).where(OrderItem.order_id == self.id)
+        modifiers = db.select(
+            ModifierIngredient.inventory_id,
+            ModifierIngredient.quantity * OrderItem.quantity
+        ).join(OrderItemModifier, OrderItemModifier.option_id == ModifierIngredient.option_id
+        ).join(OrderItem, OrderItem.id == OrderItemModifier.order_item_id).where(OrderItem.order_id == self.id)
+        lines = db.union_all(recipes, modifiers).subquery()
+        rows = db.session.execute(
+            db.select(lines.c.inventory_id, db.func.sum(lines.c.quantity)).group_by(lines.c.inventory_id)
+        )
+        return {inventory_id: float(required) for inventory_id, required in rows if required > 0}
+
+    def reserve_inventory(self):
+        """Descuenta del inventario los ingredientes del pedido de forma atómica.
+
+        Las filas de inventario se bloquean en orden de id (sin interbloqueos
+        entre pedidos concurrentes) y el descuento se expresa como
+        quantity = quantity - n, así que no hay actualizaciones perdidas.
+        Si falta algo no se descuenta nada y se informan todos los faltantes.
+        """
         import logging
-        logging.info(f"Actualizando inventario para pedido #{self.id}")
-        
-        for item in self.items:
-            logging.info(f"Procesando item: {item.product.name} x{item.quantity}")
-            if not item.product.ingredients:
-                logging.warning(f"Producto {item.product.name} no tiene ingredientes definidos")
-                continue
-                
-            for ingredient in item.product.ingredients:
-                inventory_item = ingredient.ingredient
-                required_quantity = ingredient.quantity * item.quantity
-                logging.info(f"Descontando {required_quantity} {inventory_item.unit} de {inventory_item.name}")
-                
-                if inventory_item.quantity < required_quantity:
-                    logging.error(f"Inventario insuficiente de {inventory_item.name}")
-                    raise ValueError(f"No hay suficiente {inventory_item.name} en inventario")
-                    
-                inventory_item.quantity -= required_quantity
-                logging.info(f"Nuevo stock de {inventory_item.name}: {inventory_item.quantity} {inventory_item.unit}")
-                
-                if inventory_item.needs_restock():
-                    logging.warning(f"Stock bajo de {inventory_item.name}: {inventory_item.quantity} {inventory_item.unit}")
+        required = self.required_ingredients()
+        if not required:
+            logging.warning(f"Pedido #{self.id} no tiene ingredientes definidos")
+            return {}
+
+        stock = Inventory.query.filter(
+            Inventory.id.in_(required.keys())
+        ).order_by(Inventory.id).with_for_update().populate_existing().all()
+
+        shortages = [{
+            'id': item.id,
+            'name': item.name,
+            'unit': item.unit,
+            'required': required[item.id],
+            'available': item.quantity
+        } for item in stock if item.quantity < required[item.id]]
+        if shortages:
+            for shortage in shortages:
+                logging.error(f"Inventario insuficiente de {shortage['name']}: "
+                              f"{shortage['available']} de {shortage['required']} {shortage['unit']}")
+            raise InsufficientInventoryError(shortages)
+
+        for item in stock:
+            remaining = item.quantity - required[item.id]
+            item.quantity = Inventory.quantity - required[item.id]
+            logging.info(f"Descontando {required[item.id]} {item.unit} de {item.name}")
+            if remaining <= item.minimum_stock:
+                logging.warning(f"Stock bajo de {item.name}: {remaining} {item.unit}")
+        db.session.flush()
+        ProductAvailability.refresh(inventory_ids=required.keys())
+        return required
 
     def to_dict(self):
         return {
@@ -146,29 +419,85 @@ class Order(db.Model):
             'preparingAt': self.preparing_at.isoformat() if self.preparing_at else None,
             'readyAt': self.ready_at.isoformat() if self.ready_at else None,
             'completedAt': self.completed_at.isoformat() if self.completed_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+            'totalAmount': float(self.total_amount) if self.total_amount is not None else None,
             'items': [item.to_dict() for item in self.items]
         }
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
+    # Formato anterior (JSON libre); los items nuevos usan modifiers e instructions
     customizations = db.Column(db.Text)
+    instructions = db.Column(db.Text)
+    # Precio unitario (producto + modificadores) y total de la línea al momento del pedido
+    unit_price = db.Column(db.Float)
+    line_total = db.Column(db.Float)
     product = db.relationship('Product')
+    modifiers = db.relationship('OrderItemModifier', backref='order_item', lazy=True, cascade='all, delete-orphan')
+
+    def customization_pairs(self):
+        """Pares (código de grupo, código de opción) del item, más ('instructions', texto)."""
+        if self.customizations is not None:
+            return customization_values(self.customizations)
+        pairs = [(modifier.option.group.code, modifier.option.code) for modifier in self.modifiers]
+        if self.instructions:
+            pairs.append(('instructions', self.instructions))
+        return pairs
 
     def to_dict(self):
-        customizations = json.loads(self.customizations) if self.customizations else {}
-        if 'extras' in customizations and isinstance(customizations['extras'], str):
-            customizations['extras'] = customizations['extras'].split(',') if customizations['extras'] else []
+        if self.customizations is not None:
+            customizations = legacy_customizations(self.customizations)
+        else:
+            # Mismo formato que antes ({grupo: opción o [opciones]}) para las pantallas existentes
+            customizations = {}
+            for modifier in self.modifiers:
+                group = modifier.option.group
+                if group.max_selections == 1:
+                    customizations[group.code] = modifier.option.code
+                else:
+                    customizations.setdefault(group.code, []).append(modifier.option.code)
+            if self.instructions:
+                customizations['instructions'] = self.instructions
         return {
             'id': self.id,
             'productId': self.product_id,
             'productName': self.product.name,
             'quantity': self.quantity,
-            'customizations': customizations
+            'unitPrice': float(self.unit_price) if self.unit_price is not None else None,
+            'lineTotal': float(self.line_total) if self.line_total is not None else None,
+            'customizations': customizations,
+            'modifiers': [{
+                'id': modifier.option_id,
+                'group': modifier.option.group.code,
+                'name': modifier.option.name,
+                'priceDelta': float(modifier.price_delta)
+            } for modifier in self.modifiers]
         }
 
+class OrderItemModifier(db.Model):
+    """Opción elegida para un item, con su precio al momento del pedido."""
+    __tablename__ = 'order_item_modifier'
+
+    order_item_id = db.Column(db.Integer, db.ForeignKey('order_item.id', ondelete='CASCADE'), primary_key=True)
+    option_id = db.Column(db.Integer, db.ForeignKey('modifier_option.id'), primary_key=True, index=True)
+    price_delta = db.Column(db.Float, nullable=False, default=0.0)
+    option = db.relationship('ModifierOption')
+
+def legacy_customizations(text):
+    """Personalizaciones en el formato anterior (JSON con los extras separados por comas)."""
+    try:
+        customizations = json.loads(text) if text else {}
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(customizations, dict):
+        return {}
+    if 'extras' in customizations and isinstance(customizations['extras'], str):
+        customizations['extras'] = customizations['extras'].split(',') if customizations['extras'] else []
+    return customizations
+
 class UserPreferences(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False, unique=True)
@@ -179,158 +508,976 @@ class UserPreferences(db.Model):
     preferred_customizations = db.Column(db.Text)
     total_spent = db.Column(db.Float, default=0.0)
 
-    def update_preferences(self, order, rating=None):
-        self.last_order_date = order.created_at
-        self.order_count = (self.order_count or 0) + 1
-        
-        # Update total spent
-        order_total = sum(item.product.price * item.quantity for item in order.items)
-        self.total_spent = (self.total_spent or 0.0) + order_total
-        
-        # Update favorite category based on order items
-        categories = {}
-        for item in order.items:
-            category = item.product.category
-            if category not in categories:
-                categories[category] = 0
-            categories[category] += item.quantity
-        
-        if categories:
-            most_ordered_category = max(categories.items(), key=lambda x: x[1])[0]
-            self.favorite_category = most_ordered_category.name if most_ordered_category else None
-        
-        # Update customization preferences
+    @staticmethod
+    def fold_order_log(batch_size=None):
+        """Incorpora un lote del registro de pedidos a los perfiles; devuelve cuántos.
+
+        Los lotes se toman con SKIP LOCKED, así que varios workers pueden
+        procesar el registro a la vez sin repetir pedidos. Todo se suma con
+        upserts por cliente; las personalizaciones y categorías se acumulan en
+        tablas de contadores y de ahí se derivan favorite_category y
+        preferred_customizations de los clientes afectados.
+        """
+        entries = CustomerOrderLog.query.order_by(CustomerOrderLog.id).limit(
+            batch_size or PROFILE_BATCH_SIZE
+        ).with_for_update(skip_locked=True).all()
+        if not entries:
+            return 0
+        order_ids = [entry.order_id for entry in entries]
+
+        profiles = {customer: {
+            'customer_name': customer, 'order_count': count, 'last_order_date': last_order,
+            'total_spent': float(total or 0)
+        } for customer, count, last_order, total in db.session.query(
+            Order.customer_name, db.func.count(Order.id), db.func.max(Order.created_at),
+            db.func.sum(Order.total_amount)
+        ).filter(Order.id.in_(order_ids)).group_by(Order.customer_name)}
+
+        categories = [{
+            'customer_name': customer, 'category_id': category_id, 'quantity': int(quantity)
+        } for customer, category_id, quantity in db.session.query(
+            Order.customer_name, Product.category_id, db.func.sum(OrderItem.quantity)
+        ).join(OrderItem, OrderItem.order_id == Order.id
+        ).join(Product, Product.id == OrderItem.product_id
+        ).filter(Order.id.in_(order_ids)
+        ).group_by(Order.customer_name, Product.category_id)]
+
+        customizations = {}
+        for customer, option, value, count in db.session.query(
+            Order.customer_name, ModifierGroup.code, ModifierOption.code, db.func.count()
+        ).join(OrderItem, OrderItem.order_id == Order.id
+        ).join(OrderItemModifier, OrderItemModifier.order_item_id == OrderItem.id
+        ).join(ModifierOption, ModifierOption.id == OrderItemModifier.option_id
+        ).join(ModifierGroup, ModifierGroup.id == ModifierOption.group_id
+        ).filter(Order.id.in_(order_ids)
+        ).group_by(Order.customer_name, ModifierGroup.code, ModifierOption.code):
+            customizations[(customer, option, value)] = count
+        # Items guardados con el formato anterior
+        for customer, text in db.session.query(Order.customer_name, OrderItem.customizations).join(
+            OrderItem, OrderItem.order_id == Order.id
+        ).filter(Order.id.in_(order_ids), OrderItem.customizations.isnot(None)):
+            for option, value in customization_values(text):
+                key = (customer, option, value)
+                customizations[key] = customizations.get(key, 0) + 1
+
+        upsert_rows(UserPreferences, list(profiles.values()), keys=('customer_name',),
+                    increments=('order_count', 'total_spent'), greatest=('last_order_date',))
+        upsert_rows(CustomerCategoryCount, categories,
+                    keys=('customer_name', 'category_id'), increments=('quantity',))
+        upsert_rows(CustomerCustomization, [{
+            'customer_name': customer, 'option': option, 'value': value, 'count': count
+        } for (customer, option, value), count in customizations.items()],
+            keys=('customer_name', 'option', 'value'), increments=('count',))
+        UserPreferences.refresh_derived(list(profiles))
+
+        CustomerOrderLog.query.filter(
+            CustomerOrderLog.id.in_([entry.id for entry in entries])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return len(entries)
+
+    @staticmethod
+    def refresh_derived(customer_names):
+        """Recalcula favorite_category y preferred_customizations desde los contadores."""
+        if not customer_names:
+            return
+        favorites = {}
+        for customer, category_name, quantity in db.session.query(
+            CustomerCategoryCount.customer_name, Category.name, CustomerCategoryCount.quantity
+        ).join(Category, Category.id == CustomerCategoryCount.category_id).filter(
+            CustomerCategoryCount.customer_name.in_(customer_names)
+        ):
+            if customer not in favorites or quantity > favorites[customer][1]:
+                favorites[customer] = (category_name, quantity)
+
         customizations = {}
+        for row in CustomerCustomization.query.filter(CustomerCustomization.customer_name.in_(customer_names)):
+            customizations.setdefault(row.customer_name, {}).setdefault(row.option, {})[row.value] = row.count
+
+        # executemany de Core: un UPDATE por cliente en un solo viaje
+        table = UserPreferences.__table__
+        db.session.connection().execute(
+            table.update().where(table.c.customer_name == db.bindparam('b_customer')).values(
+                favorite_category=db.bindparam('b_favorite'),
+                preferred_customizations=db.bindparam('b_customizations')
+            ),
+            [{
+                'b_customer': customer,
+                'b_favorite': favorites[customer][0] if customer in favorites else None,
+                'b_customizations': json.dumps(customizations[customer]) if customer in customizations else None
+            } for customer in customer_names]
+        )
+
+def customization_values(text):
+    """Pares (opción, valor) de las personalizaciones guardadas de un item."""
+    try:
+        customizations = json.loads(text) if text else {}
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(customizations, dict):
+        return []
+    pairs = []
+    for option, value in customizations.items():
+        for v in (value if isinstance(value, list) else [value]):
+            pairs.append((str(option)[:50], str(v)[:100]))
+    return pairs
+
+def normalize_customizations(pairs):
+    """Personalizaciones de un item en forma canónica, para agrupar items iguales.
+
+    Recibe los pares de OrderItem.customization_pairs() y devuelve (json con
+    opciones y valores ordenados, o None si no hay ninguna, y su clave sha1).
+    Los extras guardados separados por comas se separan y se ignoran los
+    valores vacíos.
+    """
+    options = {}
+    for option, value in pairs:
+        values = value.split(',') if option == 'extras' else [value]
+        values = {' '.join(v.split()) for v in values} - {'', 'None'}
+        if values:
+            options.setdefault(option, set()).update(values)
+    if not options:
+        return None, ''
+    canonical = json.dumps({option: sorted(values) for option, values in sorted(options.items())},
+                           separators=(',', ':'))
+    return canonical, hashlib.sha1(canonical.encode()).hexdigest()
+
+# Estados en los que los items de un pedido siguen por cocinar
+COOK_QUEUE_STATUSES = ('pending', 'preparing')
+COOK_QUEUE_CHANGES = 'cook_queue_changes'
+
+class CookQueueItem(db.Model):
+    """Items por cocinar de los pedidos activos, por producto y personalización.
+
+    Se mantiene con incrementos: create_order suma los items del pedido y
+    Order.update_status los resta cuando sale de pending/preparing, así que
+    leer la cola no recorre pedidos. Las claves tocadas en la transacción se
+    anotan en la sesión y changes() devuelve su nuevo valor para emitirlo.
+
+    Cada cambio sube 'version' de la fila por encima de todas las demás; la
+    cocina descarta los cambios con una versión que ya superó, así que los
+    eventos que llegan desordenados no pisan un valor más nuevo. Las filas
+    en cero se conservan (con su versión) hasta el próximo rebuild().
+    """
+    __tablename__ = 'cook_queue_item'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    # sha1 de las personalizaciones normalizadas ('' sin personalizaciones)
+    customization_key = db.Column(db.String(40), primary_key=True)
+    customizations = db.Column(db.Text)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def apply(order, sign):
+        """Suma (sign=1) o resta (sign=-1) los items del pedido a la cola."""
+        rows = {}
         for item in order.items:
-            if item.customizations:
-                try:
-                    item_customs = json.loads(item.customizations)
-                    for key, value in item_customs.items():
-                        if key not in customizations:
-                            customizations[key] = {}
-                        if isinstance(value, list):
-                            for v in value:
-                                customizations[key][v] = customizations[key].get(v, 0) + 1
-                        else:
-                            customizations[key][str(value)] = customizations[key].get(str(value), 0) + 1
-                except json.JSONDecodeError:
-                    continue
-        
-        if customizations:
-            self.preferred_customizations = json.dumps(customizations)
-        
-        if rating is not None:
-            if self.avg_order_rating is None:
-                self.avg_order_rating = float(rating)
-            else:
-                self.avg_order_rating = ((self.avg_order_rating * (self.order_count - 1)) + rating) / self.order_count
+            customizations, key = normalize_customizations(item.customization_pairs())
+            row = rows.setdefault((item.product_id, key), {
+                'product_id': item.product_id, 'customization_key': key,
+                'customizations': customizations, 'quantity': 0
+            })
+            row['quantity'] += sign * item.quantity
+        upsert_rows(CookQueueItem, list(rows.values()),
+                    keys=('product_id', 'customization_key'), increments=('quantity',))
+        db.session.info.setdefault(COOK_QUEUE_CHANGES, set()).update(rows)
+
+    @staticmethod
+    def changes():
+        """Estado y nueva versión de las filas tocadas en la transacción.
+
+        Se llama antes del commit y el resultado se emite después. Las filas
+        ya están bloqueadas por el upsert, así que otra transacción que toque
+        las mismas lee este commit y obtiene una versión mayor.
+        """
+        keys = db.session.info.pop(COOK_QUEUE_CHANGES, None)
+        if not keys:
+            return []
+        condition = db.tuple_(CookQueueItem.product_id, CookQueueItem.customization_key).in_(list(keys))
+        next_version = db.select(db.func.coalesce(db.func.max(CookQueueItem.version), 0) + 1).scalar_subquery()
+        CookQueueItem.query.filter(condition).update({'version': next_version}, synchronize_session=False)
+        rows = CookQueueItem.entries(condition)
+        for row in rows:
+            row['quantity'] = max(0, row['quantity'])
+        return rows
+
+    @staticmethod
+    def entries(*criteria):
+        return [{
+            'productId': product_id,
+            'productName': product_name,
+            'key': key,
+            'customizations': json.loads(customizations) if customizations else {},
+            'quantity': quantity,
+            'version': version
+        } for product_id, product_name, key, customizations, quantity, version in db.session.query(
+            CookQueueItem.product_id, Product.name, CookQueueItem.customization_key,
+            CookQueueItem.customizations, CookQueueItem.quantity, CookQueueItem.version
+        ).join(Product, Product.id == CookQueueItem.product_id).filter(*criteria)]
+
+    @staticmethod
+    def snapshot():
+        """Cola agrupada por producto, de mayor a menor cantidad, y la versión de cada fila.
+
+        'versions' ({"producto:clave": versión}) incluye las filas en cero y sale
+        de la misma lectura que 'products'.
+        """
+        products, versions = {}, {}
+        for entry in CookQueueItem.entries():
+            versions[f"{entry['productId']}:{entry['key']}"] = entry['version']
+            if entry['quantity'] <= 0:
+                continue
+            product = products.setdefault(entry['productId'], {
+                'productId': entry['productId'], 'productName': entry['productName'],
+                'quantity': 0, 'variants': []
+            })
+            product['quantity'] += entry['quantity']
+            product['variants'].append({
+                'key': entry['key'], 'customizations': entry['customizations'], 'quantity': entry['quantity']
+            })
+        for product in products.values():
+            product['variants'].sort(key=lambda variant: -variant['quantity'])
+        return {
+            'products': sorted(products.values(), key=lambda product: (-product['quantity'], product['productName'])),
+            'versions': versions
+        }
+
+    @staticmethod
+    def rebuild():
+        """Recalcula la cola desde los pedidos activos (puesta en marcha o reparación).
+
+        Descarta las filas en cero; las que quedan toman una versión mayor que
+        cualquier anterior, para que las versiones nunca retrocedan.
+        """
+        last_version = db.session.query(db.func.max(CookQueueItem.version)).scalar() or 0
+        CookQueueItem.query.delete(synchronize_session=False)
+        for order in Order.query_with_items().filter(Order.status.in_(COOK_QUEUE_STATUSES)).yield_per(500):
+            CookQueueItem.apply(order, 1)
+        CookQueueItem.query.filter(CookQueueItem.quantity <= 0).delete(synchronize_session=False)
+        CookQueueItem.query.update({'version': last_version + 1}, synchronize_session=False)
+        db.session.info.pop(COOK_QUEUE_CHANGES, None)
+
+# Pedidos por lote al actualizar perfiles de clientes
+PROFILE_BATCH_SIZE = 1000
+# Espera antes de procesar el registro, para agrupar pedidos cercanos
+PROFILE_FOLD_DELAY = 2
+
+class CustomerOrderLog(db.Model):
+    """Pedidos pendientes de incorporar al perfil del cliente (UserPreferences).
+
+    Se agrega una fila en la misma transacción que crea el pedido y
+    UserPreferences.fold_order_log las consume por lotes.
+    """
+    __tablename__ = 'customer_order_log'
 
-class SalesStats(db.Model):
-    __tablename__ = 'sales_stats'
-    
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False, unique=True, index=True)
-    total_sales = db.Column(db.Float, default=0.0)
-    order_count = db.Column(db.Integer, default=0)
-    avg_order_value = db.Column(db.Float, default=0.0)
-    popular_items = db.Column(db.Text, default='{}')
-    peak_hours = db.Column(db.Text, default='{}')
-    category_sales = db.Column(db.Text, default='{}')
-    
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
+
+class CustomerCategoryCount(db.Model):
+    __tablename__ = 'customer_category_count'
+
+    customer_name = db.Column(db.String(100), primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class CustomerCustomization(db.Model):
+    __tablename__ = 'customer_customization'
+
+    customer_name = db.Column(db.String(100), primary_key=True)
+    option = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CustomerRecommendation(db.Model):
+    """Productos recomendados a cada cliente, precalculados (ver recommendations.py)."""
+    __tablename__ = 'customer_recommendation'
+
+    customer_name = db.Column(db.String(100), primary_key=True)
+    product_ids = db.Column(db.Text, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def lookup(customer_name):
+        """(ids recomendados al cliente, ids de los más vendidos) con dos lecturas por clave."""
+        from recommendations import DEFAULT_CUSTOMER
+        row = db.session.get(CustomerRecommendation, customer_name)
+        default = db.session.get(CustomerRecommendation, DEFAULT_CUSTOMER)
+        return (json.loads(row.product_ids) if row else [],
+                json.loads(default.product_ids) if default else [])
+
+# Pedidos por lote al agregar estadísticas
+STATS_BATCH_SIZE = 5000
+# Margen para que confirmen las transacciones que completaron un pedido
+STATS_SETTLE_SECONDS = 5
+
+class StatsCheckpoint(db.Model):
+    """Último pedido completado incorporado a las estadísticas."""
+    __tablename__ = 'stats_checkpoint'
+
+    name = db.Column(db.String(50), primary_key=True)
+    completed_at = db.Column(db.DateTime, nullable=False)
+    order_id = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def acquire(name='sales'):
+        """Bloquea el punto de control, creándolo al principio de la historia.
+
+        La primera ejecución incremental recorre así todos los pedidos
+        completados; los ya marcados con stats_folded_at no se vuelven a sumar,
+        de modo que las estadísticas existentes nunca se borran. El bloqueo
+        serializa las ejecuciones concurrentes (varios workers).
+        """
+        upsert_rows(StatsCheckpoint, [{'name': name, 'completed_at': datetime.min, 'order_id': 0}], keys=('name',))
+        return StatsCheckpoint.query.filter_by(name=name).with_for_update().populate_existing().one()
+
+def upsert_rows(model, rows, keys, increments=(), replace=(), greatest=()):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE en una sola sentencia.
+
+    Sin columnas que actualizar equivale a ON CONFLICT DO NOTHING.
+    Las columnas de 'increments' se suman al valor existente (col = col + nuevo),
+    las de 'replace' se sobrescriben y las de 'greatest' conservan el mayor de
+    los dos valores. La cuenta la hace la base de datos, así que escrituras
+    concurrentes sobre la misma fila no se pisan.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert not supported for {dialect}")
+    stmt = insert(model).values(rows)
+    set_ = {column: getattr(model, column) + getattr(stmt.excluded, column) for column in increments}
+    set_.update({column: getattr(stmt.excluded, column) for column in replace})
+    # max(a, b) con dos argumentos es el escalar de SQLite; coalesce porque max() con un NULL da NULL
+    larger = db.func.greatest if dialect == 'postgresql' else db.func.max
+    set_.update({
+        column: larger(db.func.coalesce(getattr(model, column), getattr(stmt.excluded, column)),
+                       getattr(stmt.excluded, column))
+        for column in greatest
+    })
+    if not set_:
+        # Sin columnas que actualizar: la fila existente se deja como está
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=list(keys)))
+        return
+    db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_))
+
+class DailySales(db.Model):
+    """Totales de ventas por día, actualizados con incrementos atómicos."""
+    __tablename__ = 'daily_sales'
+
+    date = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+
+    @staticmethod
+    def fold_orders(order_ids):
+        """Suma un lote de pedidos a los contadores con agregaciones en SQL.
+
+        Los pedidos quedan marcados con stats_folded_at en la misma transacción.
+        """
+        if not order_ids:
+            return
+        # updated_at se conserva: sumar a las estadísticas no es un cambio del pedido
+        Order.query.filter(Order.id.in_(order_ids)).update(
+            {'stats_folded_at': datetime.utcnow(), 'updated_at': Order.updated_at}, synchronize_session=False)
+        # date() en vez de CAST: SQLite no tiene tipo DATE y el cast devolvería sólo el año
+        order_date = db.func.date(Order.created_at, type_=db.Date)
+        order_hour = db.extract('hour', Order.created_at)
+
+        # Importes guardados en el pedido: sin recalcular con el precio actual
+        sold = db.session.query(
+            order_date, OrderItem.product_id, db.func.sum(OrderItem.quantity), db.func.sum(OrderItem.line_total)
+        ).join(OrderItem, OrderItem.order_id == Order.id
+        ).filter(Order.id.in_(order_ids)
+        ).group_by(order_date, OrderItem.product_id).all()
+        names = {product_id: (name, category_id, category_name)
+                 for product_id, name, category_id, category_name in db.session.query(
+                     Product.id, Product.name, Category.id, Category.name
+                 ).outerjoin(Category, Category.id == Product.category_id
+                 ).filter(Product.id.in_({product_id for _, product_id, _, _ in sold}))}
+        lines = [(day, product_id, *names.get(product_id, (None, None, None)), quantity, total)
+                 for day, product_id, quantity, total in sold]
+
+        daily = {day: {'date': day, 'order_count': count, 'total_sales': float(total or 0)}
+                 for day, count, total in db.session.query(
+                     order_date, db.func.count(Order.id), db.func.sum(Order.total_amount)
+                 ).filter(Order.id.in_(order_ids)).group_by(order_date)}
+
+        hourly = db.session.query(order_date, order_hour, db.func.count(Order.id)).filter(
+            Order.id.in_(order_ids)
+        ).group_by(order_date, order_hour).all()
+
+        upsert_rows(DailySales, list(daily.values()),
+                    keys=('date',), increments=('order_count', 'total_sales'))
+        upsert_rows(DailyProductSales, [{
+            'date': day,
+            'product_id': product_id,
+            'product_name': product_name,
+            'category_id': category_id,
+            'category_name': category_name,
+            'quantity': int(quantity),
+            'total': float(total or 0)
+        } for day, product_id, product_name, category_id, category_name, quantity, total in lines],
+                    keys=('date', 'product_id'), increments=('quantity', 'total'),
+                    replace=('product_name', 'category_id', 'category_name'))
+        upsert_rows(HourlySales, [{
+            'date': day,
+            'hour': int(hour),
+            'order_count': count
+        } for day, hour, count in hourly],
+                    keys=('date', 'hour'), increments=('order_count',))
+
+        # Los mismos incrementos, agrupados por semana y por mes
+        for granularity, period_of in ROLLUP_PERIODS.items():
+            totals = {}
+            for row in daily.values():
+                period = totals.setdefault(period_of(row['date']), {
+                    'granularity': granularity,
+                    'period_start': period_of(row['date']),
+                    'order_count': 0,
+                    'total_sales': 0.0
+                })
+                period['order_count'] += row['order_count']
+                period['total_sales'] += row['total_sales']
+            products = {}
+            for day, product_id, product_name, category_id, category_name, quantity, total in lines:
+                period = products.setdefault((period_of(day), product_id), {
+                    'granularity': granularity,
+                    'period_start': period_of(day),
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'category_id': category_id,
+                    'category_name': category_name,
+                    'quantity': 0,
+                    'total': 0.0
+                })
+                period['quantity'] += int(quantity)
+                period['total'] += float(total or 0)
+            upsert_rows(SalesRollup, list(totals.values()),
+                        keys=('granularity', 'period_start'), increments=('order_count', 'total_sales'))
+            upsert_rows(ProductSalesRollup, list(products.values()),
+                        keys=('granularity', 'period_start', 'product_id'), increments=('quantity', 'total'),
+                        replace=('product_name', 'category_id', 'category_name'))
+
     @staticmethod
-    def create_or_update_daily_stats(order):
-        from datetime import date
+    def fold_completed_orders(batch_size=STATS_BATCH_SIZE):
+        """Suma a las estadísticas los pedidos completados desde la última ejecución.
+
+        El punto de control (completed_at, id) del último pedido procesado se
+        guarda en StatsCheckpoint y avanza con cada lote, en la misma
+        transacción que los contadores. Sólo se consideran pedidos completados
+        hace más de STATS_SETTLE_SECONDS, para no saltarse uno cuya
+        transacción confirme tarde con una marca de tiempo anterior. Los
+        pedidos ya marcados con stats_folded_at no se vuelven a sumar.
+        Devuelve la cantidad de pedidos procesados.
+        """
         import logging
-        
-        try:
-            order_date = order.created_at.date()
-            stats = SalesStats.query.filter_by(date=order_date).first()
-            
-            if not stats:
-                stats = SalesStats(date=order_date)
-                db.session.add(stats)
-                logging.info(f"Created new stats for date {order_date}")
-            
-            order_total = sum(item.product.price * item.quantity for item in order.items)
-            
-            stats.total_sales = float(stats.total_sales or 0) + order_total
-            stats.order_count = (stats.order_count or 0) + 1
-            stats.avg_order_value = stats.total_sales / stats.order_count
-            
-            try:
-                category_sales = json.loads(stats.category_sales) if stats.category_sales else {}
-            except json.JSONDecodeError:
-                category_sales = {}
-                
-            for item in order.items:
-                category = item.product.category
-                if category:
-                    category_key = str(category.id)
-                    if category_key not in category_sales:
-                        category_sales[category_key] = {
-                            'name': category.name,
-                            'total': 0.0
-                        }
-                category_sales[category_key]['total'] = float(category_sales[category_key]['total']) + (item.product.price * item.quantity)
-            stats.category_sales = json.dumps(category_sales)
-            
-            try:
-                popular_items = json.loads(stats.popular_items) if stats.popular_items else {}
-            except json.JSONDecodeError:
-                popular_items = {}
-                
-            for item in order.items:
-                item_key = str(item.product.id)
-                if item_key not in popular_items:
-                    popular_items[item_key] = {
-                        'name': item.product.name,
-                        'count': 0,
-                        'total': 0.0
-                    }
-                popular_items[item_key]['count'] += item.quantity
-                popular_items[item_key]['total'] = float(popular_items[item_key]['total']) + (item.product.price * item.quantity)
-            stats.popular_items = json.dumps(popular_items)
-            
-            try:
-                peak_hours = json.loads(stats.peak_hours) if stats.peak_hours else {}
-            except json.JSONDecodeError:
-                peak_hours = {}
-                
-            hour = str(order.created_at.hour)
-            peak_hours[hour] = int(peak_hours.get(hour, 0)) + 1
-            stats.peak_hours = json.dumps(peak_hours)
-            
-            logging.info(f"Updated stats for date {order_date}: total_sales={stats.total_sales}, order_count={stats.order_count}")
-            return stats
-            
-        except Exception as e:
-            logging.error(f"Error processing stats for order {order.id}: {str(e)}")
-            raise
+        processed = 0
+        settled = datetime.utcnow() - timedelta(seconds=STATS_SETTLE_SECONDS)
+        while True:
+            checkpoint = StatsCheckpoint.acquire()
+            batch = db.session.query(Order.id, Order.completed_at).filter(
+                Order.status == 'completed',
+                Order.completed_at <= settled,
+                Order.stats_folded_at.is_(None),
+                db.or_(
+                    Order.completed_at > checkpoint.completed_at,
+                    db.and_(Order.completed_at == checkpoint.completed_at, Order.id > checkpoint.order_id)
+                )
+            ).order_by(Order.completed_at, Order.id).limit(batch_size).all()
+            if not batch:
+                db.session.commit()
+                return processed
 
-    def get_recommendations(self, products, limit=3):
-        if not self.favorite_category:
-            return sorted(products, key=lambda p: p.id)[:limit]
-        
-        def score_product(product):
-            score = 0
-            if product.category == self.favorite_category:
-                score += 5
-            
-            if self.preferred_customizations and product.category == 'burgers':
-                try:
-                    customs = json.loads(self.preferred_customizations)
-                    if any(k in ['patty', 'extras'] for k in customs.keys()):
-                        score += 2
-                except:
-                    pass
-            
-            return score
-        
-        return sorted(products, key=score_product, reverse=True)[:limit]
+            DailySales.fold_orders([row.id for row in batch])
+            checkpoint.completed_at, checkpoint.order_id = batch[-1].completed_at, batch[-1].id
+            db.session.commit()
+            processed += len(batch)
+            logging.info(f"Estadísticas: {processed} pedidos incorporados hasta {checkpoint.completed_at}")
+
+    @staticmethod
+    def rebuild(start_date, end_date, batch_size=STATS_BATCH_SIZE):
+        """Recalcula desde cero los días entre start_date y end_date (inclusive).
+
+        Recorre los pedidos completados del rango por lotes de ids, sin cargarlos
+        todos en memoria. Se toma el punto de control para no contar pedidos que
+        la próxima ejecución incremental también sumaría.
+        """
+        checkpoint = StatsCheckpoint.acquire()
+        for model in (DailySales, DailyProductSales, HourlySales):
+            model.query.filter(model.date.between(start_date, end_date)).delete(synchronize_session=False)
+
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        processed = 0
+        last_id = 0
+        while True:
+            order_ids = [row.id for row in db.session.query(Order.id).filter(
+                Order.status == 'completed',
+                Order.created_at >= start,
+                Order.created_at < end,
+                Order.id > last_id,
+                db.or_(
+                    Order.completed_at < checkpoint.completed_at,
+                    db.and_(Order.completed_at == checkpoint.completed_at, Order.id <= checkpoint.order_id)
+                )
+            ).order_by(Order.id).limit(batch_size)]
+            if not order_ids:
+                break
+            DailySales.fold_orders(order_ids)
+            last_id = order_ids[-1]
+            processed += len(order_ids)
+        SalesRollup.refresh(start_date, end_date)
+        db.session.commit()
+        return processed
+
+    @staticmethod
+    def report(start_date, end_date):
+        """Resumen por día entre dos fechas (inclusive), con tres consultas.
+
+        Cada día tiene la forma histórica de /api/stats/daily: total_sales,
+        order_count, avg_order_value, popular_items, category_sales y peak_hours.
+        """
+        days = {}
+        for row in DailySales.query.filter(DailySales.date.between(start_date, end_date)).order_by(DailySales.date):
+            days[row.date] = {
+                'date': row.date.isoformat(),
+                'total_sales': float(row.total_sales or 0),
+                'order_count': int(row.order_count or 0),
+                'avg_order_value': float(row.total_sales or 0) / row.order_count if row.order_count else 0.0,
+                'popular_items': {},
+                'category_sales': {},
+                'peak_hours': {}
+            }
+
+        for row in DailyProductSales.query.filter(DailyProductSales.date.between(start_date, end_date)):
+            day = days.get(row.date)
+            if day is None:
+                continue
+            day['popular_items'][str(row.product_id)] = {
+                'name': row.product_name,
+                'count': row.quantity,
+                'total': row.total
+            }
+            if row.category_id is not None:
+                category = day['category_sales'].setdefault(str(row.category_id), {
+                    'name': row.category_name,
+                    'total': 0.0
+                })
+                category['total'] += row.total
+
+        for row in HourlySales.query.filter(HourlySales.date.between(start_date, end_date)):
+            day = days.get(row.date)
+            if day is not None:
+                day['peak_hours'][str(row.hour)] = row.order_count
+
+        return list(days.values())
+
+class DailyProductSales(db.Model):
+    __tablename__ = 'daily_product_sales'
+
+    date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    # Nombre y categoría al momento de la venta, para no depender del catálogo actual
+    product_name = db.Column(db.String(100))
+    category_id = db.Column(db.Integer)
+    category_name = db.Column(db.String(50))
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+class HourlySales(db.Model):
+    __tablename__ = 'hourly_sales'
+
+    date = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def month_start(day):
+    return day.replace(day=1)
+
+def next_period(granularity, period_start):
+    if granularity == 'day':
+        return period_start + timedelta(days=1)
+    if granularity == 'week':
+        return period_start + timedelta(days=7)
+    return (period_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+ROLLUP_PERIODS = {'week': week_start, 'month': month_start}
+PERIOD_START = {'day': lambda day: day, 'week': week_start, 'month': month_start}
+
+def cover_range(start_date, end_date):
+    """Divide [start_date, end_date] en meses completos, semanas completas y días sueltos.
+
+    Devuelve (meses, semanas, tramos de días). Sin importar el largo del rango
+    quedan a lo sumo unas decenas de filas que leer.
+    """
+    months, weeks, day_ranges = [], [], []
+
+    def cover_weeks(start, end):
+        if start > end:
+            return
+        first_week = start if start.weekday() == 0 else week_start(start) + timedelta(days=7)
+        week = first_week
+        while week + timedelta(days=6) <= end:
+            weeks.append(week)
+            week += timedelta(days=7)
+        if week == first_week:
+            day_ranges.append((start, end))
+            return
+        if start < first_week:
+            day_ranges.append((start, first_week - timedelta(days=1)))
+        if week <= end:
+            day_ranges.append((week, end))
+
+    first_month = start_date if start_date.day == 1 else next_period('month', month_start(start_date))
+    month = first_month
+    while next_period('month', month) - timedelta(days=1) <= end_date:
+        months.append(month)
+        month = next_period('month', month)
+    if months:
+        cover_weeks(start_date, first_month - timedelta(days=1))
+        cover_weeks(month, end_date)
+    else:
+        cover_weeks(start_date, end_date)
+    return months, weeks, day_ranges
+
+class SalesRollup(db.Model):
+    """Totales de ventas por semana y por mes, mantenidos junto a los diarios."""
+    __tablename__ = 'sales_rollup'
+
+    granularity = db.Column(db.String(10), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+
+    @staticmethod
+    def refresh(start_date, end_date):
+        """Recalcula desde las tablas diarias los periodos que tocan el rango."""
+        for granularity, period_of in ROLLUP_PERIODS.items():
+            first = period_of(start_date)
+            last = next_period(granularity, period_of(end_date)) - timedelta(days=1)
+            for model in (SalesRollup, ProductSalesRollup):
+                model.query.filter(
+                    model.granularity == granularity,
+                    model.period_start.between(first, last)
+                ).delete(synchronize_session=False)
+
+            totals = {}
+            for row in DailySales.query.filter(DailySales.date.between(first, last)):
+                period = totals.setdefault(period_of(row.date), SalesRollup(
+                    granularity=granularity, period_start=period_of(row.date), order_count=0, total_sales=0.0
+                ))
+                period.order_count += row.order_count
+                period.total_sales += row.total_sales
+            products = {}
+            for row in DailyProductSales.query.filter(DailyProductSales.date.between(first, last)):
+                period = products.setdefault((period_of(row.date), row.product_id), ProductSalesRollup(
+                    granularity=granularity, period_start=period_of(row.date), product_id=row.product_id,
+                    quantity=0, total=0.0
+                ))
+                period.product_name = row.product_name
+                period.category_id = row.category_id
+                period.category_name = row.category_name
+                period.quantity += row.quantity
+                period.total += row.total
+            db.session.add_all(list(totals.values()) + list(products.values()))
+
+    @staticmethod
+    def _totals(start_date, end_date):
+        """(pedidos, ventas) del rango leyendo la menor cantidad de filas posible."""
+        months, weeks, day_ranges = cover_range(start_date, end_date)
+        order_count, total_sales = 0, 0.0
+        for granularity, periods in (('month', months), ('week', weeks)):
+            if periods:
+                count, total = db.session.query(
+                    db.func.sum(SalesRollup.order_count), db.func.sum(SalesRollup.total_sales)
+                ).filter(SalesRollup.granularity == granularity, SalesRollup.period_start.in_(periods)).one()
+                order_count += count or 0
+                total_sales += total or 0.0
+        for start, end in day_ranges:
+            count, total = db.session.query(
+                db.func.sum(DailySales.order_count), db.func.sum(DailySales.total_sales)
+            ).filter(DailySales.date.between(start, end)).one()
+            order_count += count or 0
+            total_sales += total or 0.0
+        return int(order_count), float(total_sales)
+
+    @staticmethod
+    def _products(start_date, end_date):
+        """Ventas por producto del rango, agregadas en SQL por cada tramo."""
+        months, weeks, day_ranges = cover_range(start_date, end_date)
+        queries = []
+        for granularity, periods in (('month', months), ('week', weeks)):
+            if periods:
+                queries.append((ProductSalesRollup, [
+                    ProductSalesRollup.granularity == granularity,
+                    ProductSalesRollup.period_start.in_(periods)
+                ]))
+        for start, end in day_ranges:
+            queries.append((DailyProductSales, [DailyProductSales.date.between(start, end)]))
+
+        products = {}
+        for model, filters in queries:
+            rows = db.session.query(
+                model.product_id, db.func.max(model.product_name), db.func.max(model.category_id),
+                db.func.max(model.category_name), db.func.sum(model.quantity), db.func.sum(model.total)
+            ).filter(*filters).group_by(model.product_id)
+            for product_id, name, category_id, category_name, quantity, total in rows:
+                product = products.setdefault(product_id, {
+                    'id': product_id,
+                    'name': name,
+                    'category_id': category_id,
+                    'category_name': category_name,
+                    'count': 0,
+                    'total': 0.0
+                })
+                product['count'] += int(quantity or 0)
+                product['total'] += float(total or 0)
+        return products
+
+    @staticmethod
+    def range_report(start_date, end_date, granularity='day', top=10):
+        """Serie por periodo, totales, productos más vendidos y ventas por categoría."""
+        first = PERIOD_START[granularity](start_date)
+        series = []
+        if granularity == 'day':
+            rows = {row.date: row for row in DailySales.query.filter(DailySales.date.between(start_date, end_date))}
+        else:
+            rows = {row.period_start: row for row in SalesRollup.query.filter(
+                SalesRollup.granularity == granularity,
+                SalesRollup.period_start.between(first, end_date)
+            )}
+        period = first
+        while period <= end_date:
+            period_end = next_period(granularity, period) - timedelta(days=1)
+            if period < start_date or period_end > end_date:
+                # Periodo cortado por el rango: se suma sólo la parte incluida
+                order_count, total_sales = SalesRollup._totals(max(period, start_date), min(period_end, end_date))
+            else:
+                row = rows.get(period)
+                order_count = row.order_count if row else 0
+                total_sales = row.total_sales if row else 0.0
+            series.append({
+                'period': period.isoformat(),
+                'order_count': order_count,
+                'total_sales': total_sales,
+                'avg_order_value': total_sales / order_count if order_count else 0.0
+            })
+            period = next_period(granularity, period)
+
+        products = SalesRollup._products(start_date, end_date)
+        category_sales = {}
+        for product in products.values():
+            if product['category_id'] is not None:
+                category = category_sales.setdefault(str(product['category_id']), {
+                    'name': product['category_name'],
+                    'total': 0.0
+                })
+                category['total'] += product['total']
+
+        order_count = sum(point['order_count'] for point in series)
+        total_sales = sum(point['total_sales'] for point in series)
+        return {
+            'from': start_date.isoformat(),
+            'to': end_date.isoformat(),
+            'granularity': granularity,
+            'order_count': order_count,
+            'total_sales': total_sales,
+            'avg_order_value': total_sales / order_count if order_count else 0.0,
+            'series': series,
+            'top_products': sorted(products.values(), key=lambda p: p['total'], reverse=True)[:top],
+            'category_sales': category_sales
+        }
+
+class ProductSalesRollup(db.Model):
+    __tablename__ = 'product_sales_rollup'
+
+    granularity = db.Column(db.String(10), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    product_name = db.Column(db.String(100))
+    category_id = db.Column(db.Integer)
+    category_name = db.Column(db.String(50))
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+# métrica: (estado que la cierra, marca de inicio, marca de fin)
+KITCHEN_METRICS = {
+    'queue_wait': ('preparing', 'created_at', 'preparing_at'),
+    'prep_time': ('ready', 'preparing_at', 'ready_at'),
+}
+
+class KitchenLatency(db.Model):
+    """Contadores del sketch logarítmico de tiempos de cocina (ver metrics.py).
+
+    dimension es 'all' (key vacía), 'product' (key = product_id) u 'hour'
+    (key = hora UTC en que empezó el intervalo).
+    """
+    __tablename__ = 'kitchen_latency'
+
+    metric = db.Column(db.String(20), primary_key=True)
+    dimension = db.Column(db.String(10), primary_key=True)
+    key = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def record_transition(order, new_status):
+        """Cuenta la duración que cierra 'new_status' (en la misma transacción)."""
+        from metrics import bucket_for
+        for metric, (status, start_field, end_field) in KITCHEN_METRICS.items():
+            start, end = getattr(order, start_field), getattr(order, end_field)
+            if status != new_status or not start or not end:
+                continue
+            bucket = bucket_for((end - start).total_seconds())
+            keys = [('all', ''), ('hour', str(start.hour))]
+            keys += [('product', str(product_id)) for product_id in sorted({item.product_id for item in order.items})]
+            upsert_rows(KitchenLatency, [{
+                'metric': metric, 'dimension': dimension, 'key': key, 'bucket': bucket, 'count': 1
+            } for dimension, key in keys], keys=('metric', 'dimension', 'key', 'bucket'), increments=('count',))
+
+    @staticmethod
+    def sketches(metric=None, dimension=None):
+        """{(metric, dimension, key): LogSketch} con los contadores guardados."""
+        from metrics import LogSketch
+        query = KitchenLatency.query
+        if metric:
+            query = query.filter_by(metric=metric)
+        if dimension:
+            query = query.filter_by(dimension=dimension)
+        result = {}
+        for row in query:
+            sketch = result.setdefault((row.metric, row.dimension, row.key), LogSketch())
+            sketch.buckets[row.bucket] = row.count
+        return result
+
+    @staticmethod
+    def report():
+        """Percentiles p50/p90/p99 por métrica: total, por producto y por hora."""
+        sketches = KitchenLatency.sketches()
+        product_names = dict(db.session.query(Product.id, Product.name))
+        report = {}
+        for metric in KITCHEN_METRICS:
+            by_product = [
+                dict(productId=int(key), name=product_names.get(int(key)), **sketch.summary())
+                for (m, dimension, key), sketch in sketches.items()
+                if m == metric and dimension == 'product'
+            ]
+            by_hour = [
+                dict(hour=int(key), **sketch.summary())
+                for (m, dimension, key), sketch in sketches.items()
+                if m == metric and dimension == 'hour'
+            ]
+            overall = sketches.get((metric, 'all', ''))
+            report[metric] = {
+                'overall': overall.summary() if overall else {'count': 0, 'p50': None, 'p90': None, 'p99': None},
+                'by_product': sorted(by_product, key=lambda x: x['count'], reverse=True),
+                'by_hour': sorted(by_hour, key=lambda x: x['hour'])
+            }
+        return report
+
+# Avisos por lote, reintentos y reserva mientras se envían
+NOTIFY_BATCH_SIZE = 100
+NOTIFY_MAX_ATTEMPTS = 5
+NOTIFY_BACKOFF_SECONDS = 30
+NOTIFY_LEASE_SECONDS = 120
+
+class OrderNotification(db.Model):
+    """Último estado de cada pedido a avisar al cliente (ver notifications.py).
+
+    Los cambios de estado sobrescriben 'status' y corren 'due_at', así que
+    transiciones seguidas dentro de la ventana se avisan una sola vez.
+    Queda pendiente mientras status != sent_status.
+    """
+    __tablename__ = 'order_notification'
+
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    sent_status = db.Column(db.String(20))
+    due_at = db.Column(db.DateTime, nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+
+    @staticmethod
+    def schedule(order_id, status, delay):
+        due_at = datetime.utcnow() + timedelta(seconds=delay)
+        upsert_rows(OrderNotification, [{
+            'order_id': order_id, 'status': status, 'due_at': due_at, 'attempts': 0, 'last_error': None
+        }], keys=('order_id',), replace=('status', 'due_at', 'attempts', 'last_error'))
+        return due_at
+
+    @staticmethod
+    def claim_due(limit=NOTIFY_BATCH_SIZE):
+        """Reserva los avisos vencidos; devuelve ([(order_id, status)], fin de la reserva).
+
+        No confirma: quien reserva agenda en la misma transacción un envío
+        para cuando venza la reserva, por si muere antes de registrar el
+        resultado.
+        """
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=NOTIFY_LEASE_SECONDS)
+        rows = OrderNotification.query.filter(
+            OrderNotification.due_at <= now,
+            db.or_(OrderNotification.sent_status.is_(None), OrderNotification.sent_status != OrderNotification.status)
+        ).order_by(OrderNotification.due_at).limit(limit).with_for_update(skip_locked=True).all()
+        claimed = [(row.order_id, row.status) for row in rows]
+        for row in rows:
+            row.due_at = lease_until
+        return claimed, lease_until
+
+    @staticmethod
+    def record_results(results):
+        """Guarda el resultado de [(order_id, status, error)]; devuelve cuándo es el próximo reintento (o None)."""
+        now = datetime.utcnow()
+        next_retry = None
+        for order_id, status, error in results:
+            if error is None:
+                # Si el estado cambió mientras se enviaba, el nuevo sigue pendiente
+                OrderNotification.query.filter_by(order_id=order_id).update(
+                    {'sent_status': status, 'last_error': None}, synchronize_session=False)
+                continue
+            notification = db.session.get(OrderNotification, order_id)
+            if notification is None or notification.status != status:
+                continue
+            notification.attempts += 1
+            notification.last_error = error[:2000]
+            if notification.attempts >= NOTIFY_MAX_ATTEMPTS:
+                notification.sent_status = status
+            else:
+                notification.due_at = now + timedelta(seconds=NOTIFY_BACKOFF_SECONDS * 2 ** (notification.attempts - 1))
+                next_retry = min(next_retry or notification.due_at, notification.due_at)
+        db.session.commit()
+        return next_retry
+
+class Job(db.Model):
+    """Trabajo persistente de la cola en segundo plano (ver jobs.py)."""
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # Un mismo trabajo encolado dos veces con la misma clave se guarda una sola vez
+    idempotency_key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    # Pendiente: cuándo ejecutarlo; en ejecución: hasta cuándo lo reserva el
+    # worker; terminado: cuándo terminó
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
 
 class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False, index=True)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,153 @@
+"""Avisos a clientes sobre el estado de sus pedidos.
+
+El envío pasa por un transporte intercambiable:
+  fake    guarda los mensajes en memoria y los registra en el log
+          (desarrollo y pruebas; es el valor por defecto). Admite una
+          latencia y una tasa de fallos simuladas para pruebas de carga.
+  twilio  SMS reales con Twilio (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN y
+          TWILIO_FROM_NUMBER)
+
+Los cambios de estado no envían nada en la petición: se anotan en
+order_notification (una fila por pedido con el último estado) y un trabajo
+de la cola los envía pasado NOTIFY_COALESCE_SECONDS, así que si un pedido
+pasa de 'preparing' a 'ready' dentro de esa ventana sólo se avisa 'ready'.
+El Dispatcher envía cada lote en paralelo con un pool acotado de hilos y un
+límite de mensajes por segundo.
+
+Prueba de carga sin red:
+
+    python notifications.py --messages 1000 --latency 0.2
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STATUS_MESSAGES = {
+    'pending': "Hola {name}, recibimos tu pedido #{id}.",
+    'preparing': "Tu pedido #{id} se está preparando.",
+    'ready': "¡{name}, tu pedido #{id} está listo para retirar!",
+    'completed': "Gracias por tu compra, {name}. ¡Buen provecho!",
+}
+
+
+class FakeTransport:
+    """Transporte local: no envía nada, guarda (destino, mensaje) en 'sent'."""
+
+    def __init__(self, latency=0, failure_rate=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Simulated provider failure")
+        with self._lock:
+            self.sent.append((to, body))
+        logging.info(f"SMS (fake) a {to}: {body}")
+
+
+class TwilioTransport:
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    def send(self, to, body):
+        self.client.messages.create(to=to, from_=self.from_number, body=body)
+
+
+def make_transport(name, account_sid=None, auth_token=None, from_number=None):
+    if name == 'twilio':
+        if not (account_sid and auth_token and from_number):
+            raise ValueError("Twilio transport requires account SID, auth token and from number")
+        return TwilioTransport(account_sid, auth_token, from_number)
+    if name == 'fake':
+        return FakeTransport()
+    raise ValueError(f"Unknown notification transport: {name}")
+
+
+class RateLimiter:
+    """Reparte los envíos para no superar 'rate' por segundo entre todos los hilos."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Dispatcher:
+    def __init__(self, transport, max_workers=8, rate_per_second=10):
+        self.transport = transport
+        self.limiter = RateLimiter(rate_per_second)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='notifications')
+
+    def _send(self, to, body):
+        self.limiter.acquire()
+        try:
+            self.transport.send(to, body)
+            return None
+        except Exception as e:
+            logging.error(f"Error enviando aviso a {to}: {str(e)}")
+            return str(e) or e.__class__.__name__
+
+    def send_all(self, messages):
+        """Envía [(destino, mensaje)] en paralelo; devuelve el error de cada uno (None si salió)."""
+        return list(self.pool.map(lambda message: self._send(*message), messages))
+
+
+_dispatcher = Dispatcher(FakeTransport())
+
+
+def configure(transport, max_workers=8, rate_per_second=10):
+    global _dispatcher
+    _dispatcher = Dispatcher(transport, max_workers, rate_per_second)
+
+
+def get_transport():
+    return _dispatcher.transport
+
+
+def get_dispatcher():
+    return _dispatcher
+
+
+def status_message(order, status):
+    template = STATUS_MESSAGES.get(status)
+    return template.format(name=order.customer_name, id=order.id) if template else None
+
+
+def load_test(messages=1000, latency=0.2, failure_rate=0.0, max_workers=8, rate_per_second=50):
+    """Envía 'messages' avisos con el transporte fake; devuelve (segundos, fallidos)."""
+    dispatcher = Dispatcher(FakeTransport(latency, failure_rate), max_workers, rate_per_second)
+    started = time.perf_counter()
+    errors = dispatcher.send_all([(f"+5490000{i:04d}", f"Pedido #{i}") for i in range(messages)])
+    return time.perf_counter() - started, sum(1 for error in errors if error)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Prueba de carga de avisos con el transporte fake")
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    seconds, failed = load_test(args.messages, args.latency, args.failure_rate, args.workers, args.rate)
+    print(f"{args.messages} avisos en {seconds:.2f} s ({args.messages / seconds:.1f}/s), {failed} fallidos")
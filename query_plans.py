@@ -0,0 +1,76 @@
+"""Comprobación de planes de las consultas frecuentes (PostgreSQL).
+
+Cada consulta de HOT_QUERIES se pasa por EXPLAIN con enable_seqscan
+desactivado: así el planificador usa un índice siempre que exista uno
+aplicable, y si aun así elige un Seq Scan sobre una tabla grande es que
+falta el índice. El resultado no depende del volumen de datos, por lo que
+sirve igual contra una base vacía (CI) o una copia de producción:
+
+    flask --app app check-query-plans
+"""
+from datetime import datetime
+
+from database import db
+
+# Tablas que crecen con los pedidos; el resto (catálogo, inventario) son pequeñas
+LARGE_TABLES = {'order', 'order_item', 'order_item_modifier', 'user_preferences', 'feedback', 'customer_order_log', 'job'}
+
+
+def hot_queries():
+    """[(nombre, consulta)] con las consultas de las rutas y tareas frecuentes."""
+    from models import Order, OrderItem, OrderItemModifier, ProductIngredient, UserPreferences, Feedback, Job
+    since = datetime(2024, 1, 1)
+    return [
+        ('kitchen queue', Order.query.filter(
+            Order.status.in_(('pending', 'preparing'))).order_by(Order.created_at, Order.id)),
+        ('orders page', Order.query.order_by(Order.created_at.desc(), Order.id.desc()).limit(51)),
+        ('orders by status page', Order.query.filter(Order.status == 'completed').order_by(
+            Order.created_at.desc(), Order.id.desc()).limit(51)),
+        ('orders since cursor', Order.query.filter(db.or_(
+            Order.updated_at > since, db.and_(Order.updated_at == since, Order.id > 0)
+        )).order_by(Order.updated_at, Order.id).limit(201)),
+        ('customer orders', Order.query.filter(Order.customer_name == 'cliente').order_by(
+            Order.created_at.desc()).limit(20)),
+        ('stats checkpoint', db.session.query(Order.id, Order.completed_at).filter(
+            Order.status == 'completed',
+            Order.completed_at <= datetime(2030, 1, 1),
+            Order.stats_folded_at.is_(None),
+            db.or_(Order.completed_at > since, db.and_(Order.completed_at == since, Order.id > 0))
+        ).order_by(Order.completed_at, Order.id).limit(5000)),
+        ('order items', OrderItem.query.filter(OrderItem.order_id.in_((1, 2, 3)))),
+        ('item modifiers', OrderItemModifier.query.filter(OrderItemModifier.order_item_id.in_((1, 2, 3)))),
+        ('product sales', OrderItem.query.filter(OrderItem.product_id == 1)),
+        ('product recipe', ProductIngredient.query.filter(ProductIngredient.product_id == 1)),
+        ('customer profile', UserPreferences.query.filter(UserPreferences.customer_name == 'cliente')),
+        ('order feedback', Feedback.query.filter(Feedback.order_id == 1)),
+        ('due jobs', Job.query.filter(
+            Job.status.in_(('pending', 'running')), Job.run_after <= since
+        ).order_by(Job.run_after, Job.id).limit(1)),
+    ]
+
+
+def _seq_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in LARGE_TABLES:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _seq_scans(child)
+
+
+def check_plans():
+    """[(nombre, [tablas con Seq Scan])] de las consultas que no usan índices."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        raise NotImplementedError("Query plan checks require PostgreSQL")
+    failures = []
+    try:
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        for name, query in hot_queries():
+            statement = query.statement if hasattr(query, 'statement') else query
+            sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql).scalar()
+            tables = sorted(set(_seq_scans(plan[0]['Plan'])))
+            if tables:
+                failures.append((name, tables))
+    finally:
+        db.session.rollback()
+    return failures
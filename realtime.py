@@ -0,0 +1,82 @@
+"""Eventos de pedidos en tiempo real (Socket.IO).
+
+Los clientes se unen a una sala según la pantalla que muestran:
+  kitchen               cocina, recibe los pedidos nuevos completos y los deltas
+  board                 tablero de pedidos, recibe sólo deltas
+  customer:<nombre>     un cliente, recibe los deltas de sus propios pedidos
+
+Las horas estimadas de entrega ('order_eta') van sólo a la sala de cada
+cliente, con sus propios pedidos.
+
+Cada evento lleva un número de secuencia global. Las salas 'kitchen' y
+'board' reciben todos los eventos, así que un salto en la secuencia indica
+que se perdió alguno y el cliente debe resincronizar con /api/orders?since=.
+
+La cola de cocción (items por cocinar agrupados) se envía a 'kitchen' como
+'cook_queue_delta' con el valor actual y la versión de cada fila que cambió;
+no lleva secuencia: se descartan las filas con una versión ya vista y al
+reconectar se vuelve a pedir /api/kitchen/queue.
+"""
+from datetime import datetime
+
+from shared_state import make_counter
+
+KITCHEN_ROOM = 'kitchen'
+BOARD_ROOM = 'board'
+STATION_ROOMS = (KITCHEN_ROOM, BOARD_ROOM)
+
+_sequence = make_counter('burgerapp:order-events')
+
+
+def configure(state_url):
+    # Con varios workers la secuencia tiene que ser común a todos los procesos
+    global _sequence
+    _sequence = make_counter('burgerapp:order-events', state_url)
+
+
+def customer_room(customer_name):
+    return f"customer:{customer_name}"
+
+
+def next_sequence():
+    return _sequence.incr()
+
+
+def current_sequence():
+    return _sequence.value()
+
+
+def order_delta(seq, order_id, status, at):
+    return {
+        'seq': seq,
+        'id': order_id,
+        'status': status,
+        'at': at
+    }
+
+
+def emit_new_order(socketio, order_dict):
+    """La cocina recibe el pedido completo; el resto sólo el delta."""
+    seq = next_sequence()
+    socketio.emit('new_order', {'seq': seq, 'order': order_dict}, to=KITCHEN_ROOM)
+    delta = order_delta(seq, order_dict['id'], order_dict['status'], order_dict['updatedAt'])
+    socketio.emit('order_delta', delta, to=[BOARD_ROOM, customer_room(order_dict['customerName'])])
+
+
+def emit_status_change(socketio, order):
+    seq = next_sequence()
+    timestamp = order.updated_at or datetime.utcnow()
+    delta = order_delta(seq, order.id, order.status, timestamp.isoformat())
+    socketio.emit('order_delta', delta, to=[KITCHEN_ROOM, BOARD_ROOM, customer_room(order.customer_name)])
+
+
+def emit_etas(socketio, by_customer):
+    # Cada cliente recibe sólo las de sus propios pedidos activos; es una foto
+    # completa, así que no lleva secuencia porque reemplaza a la anterior
+    for customer_name, estimates in by_customer.items():
+        socketio.emit('order_eta', {'etas': estimates}, to=customer_room(customer_name))
+
+
+def emit_cook_queue(socketio, changes):
+    if changes:
+        socketio.emit('cook_queue_delta', {'changes': changes}, to=KITCHEN_ROOM)
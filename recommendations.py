@@ -0,0 +1,190 @@
+"""Recomendaciones precalculadas por cliente.
+
+Un proceso por lotes (flask build-recommendations, o POST
+/api/recommendations/rebuild) recorre el historial de pedidos una vez y
+calcula:
+
+- co-compra: similitud coseno entre productos que aparecen en los mismos
+  pedidos,
+- afinidad por categoría: qué parte de lo que compra cada cliente es de
+  cada categoría,
+- popularidad general.
+
+Con eso guarda los TOP_N productos de cada cliente en customer_recommendation
+(más una fila DEFAULT_CUSTOMER con los más vendidos para clientes nuevos), de
+modo que servir una recomendación es leer una fila por clave y filtrar lo que
+no está disponible en el catálogo.
+
+Benchmark del cálculo con datos sintéticos:
+
+    python recommendations.py --customers 100000
+"""
+import heapq
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+TOP_N = 10
+# Vecinos más similares que se conservan por producto
+NEIGHBORS = 20
+# Fila con los productos más vendidos, para clientes sin historial
+DEFAULT_CUSTOMER = ''
+REPEAT_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.1
+LOAD_BATCH_SIZE = 10000
+SAVE_BATCH_SIZE = 1000
+
+
+class HistoryAccumulator:
+    """Acumula co-compras y compras por cliente recorriendo los items por pedido."""
+
+    def __init__(self):
+        self.purchases = defaultdict(Counter)
+        self.order_counts = Counter()
+        self.pair_counts = defaultdict(Counter)
+        self.popularity = Counter()
+
+    def add_order(self, customer_name, lines):
+        """lines: [(product_id, quantity)] de un pedido."""
+        products = set()
+        for product_id, quantity in lines:
+            self.purchases[customer_name][product_id] += quantity
+            self.popularity[product_id] += quantity
+            products.add(product_id)
+        for product_id in products:
+            self.order_counts[product_id] += 1
+            for other in products:
+                if other != product_id:
+                    self.pair_counts[product_id][other] += 1
+
+    def similarity(self, neighbors=NEIGHBORS):
+        """{producto: {otro: similitud coseno}} con los 'neighbors' más parecidos."""
+        result = {}
+        for product_id, row in self.pair_counts.items():
+            scores = ((other, count / math.sqrt(self.order_counts[product_id] * self.order_counts[other]))
+                      for other, count in row.items())
+            result[product_id] = dict(heapq.nlargest(neighbors, scores, key=lambda x: x[1]))
+        return result
+
+
+def rank_customers(purchases, similarity, popularity, product_categories, top_n=TOP_N):
+    """{cliente: [product_id, ...]} con los top_n productos de cada cliente."""
+    max_popularity = max(popularity.values(), default=0) or 1
+    popularity_score = {product_id: count / max_popularity for product_id, count in popularity.items()}
+    # La afinidad por categoría sólo puede subir a los más vendidos de cada categoría
+    by_category = defaultdict(list)
+    for product_id in sorted(popularity, key=popularity.get, reverse=True):
+        category_id = product_categories.get(product_id)
+        if len(by_category[category_id]) < top_n:
+            by_category[category_id].append(product_id)
+
+    rankings = {}
+    for customer_name, bought in purchases.items():
+        total = sum(bought.values())
+        scores = defaultdict(float)
+        affinity = Counter()
+        for product_id, quantity in bought.items():
+            weight = quantity / total
+            scores[product_id] += REPEAT_WEIGHT * weight
+            affinity[product_categories.get(product_id)] += weight
+            for other, score in similarity.get(product_id, {}).items():
+                scores[other] += weight * score
+        for category_id, weight in affinity.items():
+            for product_id in by_category.get(category_id, ()):
+                scores[product_id] += CATEGORY_WEIGHT * weight
+        for product_id in scores:
+            scores[product_id] += POPULARITY_WEIGHT * popularity_score.get(product_id, 0)
+        rankings[customer_name] = [product_id for product_id, _ in
+                                   heapq.nlargest(top_n, scores.items(), key=lambda x: x[1])]
+    rankings[DEFAULT_CUSTOMER] = [product_id for product_id, _ in popularity.most_common(top_n)]
+    return rankings
+
+
+def load_history(batch_size=LOAD_BATCH_SIZE):
+    """Recorre una vez los items de todos los pedidos, agrupados por pedido."""
+    from database import db
+    from models import Order, OrderItem
+
+    history = HistoryAccumulator()
+    rows = db.session.query(
+        Order.id, Order.customer_name, OrderItem.product_id, OrderItem.quantity
+    ).join(OrderItem, OrderItem.order_id == Order.id).order_by(Order.id).yield_per(batch_size)
+    current_id, current_customer, lines = None, None, []
+    for order_id, customer_name, product_id, quantity in rows:
+        if order_id != current_id:
+            if lines:
+                history.add_order(current_customer, lines)
+            current_id, current_customer, lines = order_id, customer_name, []
+        lines.append((product_id, quantity))
+    if lines:
+        history.add_order(current_customer, lines)
+    return history
+
+
+def build_recommendations(top_n=TOP_N):
+    """Recalcula y guarda las recomendaciones de todos los clientes; devuelve cuántos."""
+    from database import db
+    from models import CustomerRecommendation, Product, upsert_rows
+
+    history = load_history()
+    product_categories = dict(db.session.query(Product.id, Product.category_id))
+    rankings = rank_customers(history.purchases, history.similarity(), history.popularity,
+                              product_categories, top_n)
+
+    computed_at = datetime.utcnow()
+    rows = [{'customer_name': customer_name, 'product_ids': json.dumps(product_ids), 'computed_at': computed_at}
+            for customer_name, product_ids in rankings.items()]
+    for start in range(0, len(rows), SAVE_BATCH_SIZE):
+        upsert_rows(CustomerRecommendation, rows[start:start + SAVE_BATCH_SIZE],
+                    keys=('customer_name',), replace=('product_ids', 'computed_at'))
+    # Clientes que ya no tienen pedidos
+    CustomerRecommendation.query.filter(
+        CustomerRecommendation.computed_at < computed_at
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return len(rankings) - 1
+
+
+def synthetic_history(customers, products=200, categories=8, orders_per_customer=5, seed=0):
+    rng = random.Random(seed)
+    history = HistoryAccumulator()
+    # Unos pocos productos concentran la mayoría de las ventas
+    weights = [1 / (rank + 1) for rank in range(products)]
+    product_ids = list(range(1, products + 1))
+    for customer in range(customers):
+        for _ in range(rng.randint(1, orders_per_customer * 2 - 1)):
+            items = rng.choices(product_ids, weights, k=rng.randint(1, 4))
+            history.add_order(f"customer-{customer}", [(product_id, rng.randint(1, 2)) for product_id in items])
+    product_categories = {product_id: product_id % categories for product_id in product_ids}
+    return history, product_categories
+
+
+def benchmark(customers=100000, top_n=TOP_N):
+    """Segundos de cada etapa del cálculo con 'customers' clientes sintéticos."""
+    timings = {}
+    started = time.perf_counter()
+    history, product_categories = synthetic_history(customers)
+    timings['history'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    similarity = history.similarity()
+    timings['similarity'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rank_customers(history.purchases, similarity, history.popularity, product_categories, top_n)
+    timings['rank_customers'] = time.perf_counter() - started
+    return timings
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark del cálculo de recomendaciones")
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--top', type=int, default=TOP_N)
+    args = parser.parse_args()
+    for name, seconds in benchmark(args.customers, args.top).items():
+        print(f"{name:<16} {seconds:8.2f} s")
@@ -0,0 +1,107 @@
+"""Estado compartido entre procesos workers.
+
+Con un solo proceso todo vive en memoria. Para correr varios workers se
+configura SOCKETIO_MESSAGE_QUEUE (redis://, amqp://, ...) de modo que los
+eventos emitidos en un proceso lleguen a los clientes conectados a otro, y
+SHARED_STATE_URL (redis://) para los contadores compartidos. Si no se indica
+SHARED_STATE_URL se reutiliza la cola de mensajes cuando ésta es Redis.
+
+'local://<canal>' usa LocalPubSubManager, una cola en memoria que permite
+probar varios servidores Socket.IO dentro de un mismo proceso.
+'filesystem:///<directorio>' usa el transporte de archivos de Kombu (requiere
+el paquete kombu): reparte eventos entre procesos de una misma máquina sin
+Redis, para pruebas y benchmarks.
+"""
+import queue
+import threading
+
+import socketio
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """Gestor pub/sub en memoria para pruebas y desarrollo (modo threading)."""
+    name = 'local'
+
+    _subscribers = {}
+    _subscribers_lock = threading.Lock()
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue = queue.Queue()
+        if not write_only:
+            with self._subscribers_lock:
+                self._subscribers.setdefault(channel, []).append(self._queue)
+
+    def _publish(self, data):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers.get(self.channel, []))
+        for subscriber in subscribers:
+            subscriber.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+
+def socketio_queue_options(url):
+    """Argumentos para SocketIO() según la URL de la cola de mensajes."""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalPubSubManager(channel=url[len('local://'):] or 'socketio')}
+    if url.startswith('filesystem://'):
+        return {'client_manager': filesystem_manager(url[len('filesystem://'):])}
+    return {'message_queue': url}
+
+
+def filesystem_manager(folder):
+    """KombuManager sobre archivos en 'folder', compartido por los procesos que lo usen."""
+    import os
+    control = os.path.join(folder, 'control')
+    os.makedirs(control, exist_ok=True)
+    return socketio.KombuManager('filesystem://', connection_options={'transport_options': {
+        'data_folder_in': folder, 'data_folder_out': folder, 'control_folder': control
+    }})
+
+
+class LocalCounter:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def incr(self, amount=1):
+        with self._lock:
+            self._value += amount
+            return self._value
+
+    def value(self):
+        return self._value
+
+
+class RedisCounter:
+    def __init__(self, key, url):
+        import redis
+        self.key = key
+        self._redis = redis.Redis.from_url(url)
+
+    def incr(self, amount=1):
+        return int(self._redis.incrby(self.key, amount))
+
+    def value(self):
+        value = self._redis.get(self.key)
+        return int(value) if value else 0
+
+
+def shared_state_url(state_url=None, message_queue=None):
+    if state_url:
+        return state_url
+    if message_queue and message_queue.startswith(('redis://', 'rediss://')):
+        return message_queue
+    return None
+
+
+def make_counter(key, url=None):
+    """Contador atómico: Redis si hay URL compartida, en memoria si no."""
+    if url:
+        return RedisCounter(key, url)
+    return LocalCounter()
@@ -1,20 +1,86 @@
 let orders = [];
+let syncCursor = null;
+let fetchingChanges = false;
+let lastSeq = null;
+// Cola de cocción: {productId: {productName, variants: {key: {customizations, quantity}}}}
+let cookQueue = {};
+// Última versión vista de cada fila de la cola ("productId:key")
+let cookQueueVersions = {};
+const ACTIVE_STATUSES = ['pending', 'preparing', 'ready'];
 const socket = io();
 
 // Listen for real-time updates
 socket.on('connect', function() {
     console.log('Connected to WebSocket server');
-    updateOrders(); // Update orders when connection is established
+    socket.emit('join', { room: 'kitchen' }, function(ack) {
+        lastSeq = ack.seq;
+        fetchCookQueue();
+        // Resincronizar: carga completa la primera vez, incremental al reconectar
+        if (syncCursor) {
+            fetchOrderChanges();
+        } else {
+            updateOrders();
+        }
+    });
 });
 
-socket.on('order_update', function(data) {
-    console.log('Order update received:', data);
-    updateOrders();
+// Devuelve false si se perdió algún evento y hay que resincronizar
+function checkSequence(seq) {
+    const inOrder = lastSeq !== null && seq === lastSeq + 1;
+    lastSeq = seq;
+    return inOrder;
+}
+
+socket.on('new_order', function(data) {
+    console.log('New order received:', data);
+    if (!checkSequence(data.seq)) {
+        fetchOrderChanges();
+        return;
+    }
+    orders = orders.filter(order => order.id !== data.order.id);
+    orders.unshift(data.order);
+    displayOrders();
 });
 
-socket.on('order_status_changed', function(data) {
-    console.log('Order status changed:', data);
-    updateOrders();
+socket.on('order_delta', function(delta) {
+    console.log('Order delta received:', delta);
+    const order = orders.find(o => o.id === delta.id);
+    if (!checkSequence(delta.seq) || (!order && ACTIVE_STATUSES.includes(delta.status))) {
+        fetchOrderChanges();
+        return;
+    }
+    if (!order) return;
+    if (ACTIVE_STATUSES.includes(delta.status)) {
+        order.status = delta.status;
+        order[`${delta.status}At`] = delta.at;
+        order.updatedAt = delta.at;
+    } else {
+        orders = orders.filter(o => o.id !== delta.id);
+    }
+    displayOrders();
+});
+
+// Cada cambio trae la cantidad actual de la fila; 0 significa que ya no queda nada.
+// Un cambio con una versión ya vista llegó tarde y se descarta
+socket.on('cook_queue_delta', function(data) {
+    data.changes.forEach(change => {
+        const versionKey = `${change.productId}:${change.key}`;
+        if ((cookQueueVersions[versionKey] || 0) >= change.version) {
+            return;
+        }
+        cookQueueVersions[versionKey] = change.version;
+        const product = cookQueue[change.productId];
+        if (change.quantity > 0) {
+            const entry = product || (cookQueue[change.productId] = { productName: change.productName, variants: {} });
+            entry.variants[change.key] = { customizations: change.customizations, quantity: change.quantity };
+        } else if (product) {
+            delete product.variants[change.key];
+            if (Object.keys(product.variants).length === 0) {
+                delete cookQueue[change.productId];
+            }
+        }
+    });
+    renderCookQueue();
 });
 
 socket.on('disconnect', function() {
@@ -37,54 +103,141 @@ socket.on('connect_error', function(error) {
     `;
 });
 
+async function fetchOrdersPage(params) {
+    const response = await fetch(`/api/orders?${new URLSearchParams(params)}`);
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const data = await response.json();
+    if (!data || !Array.isArray(data.orders)) {
+        throw new Error('Invalid data format received from server');
+    }
+    return data;
+}
+
+function showKitchenError(error) {
+    document.getElementById('kitchen-error').innerHTML = `
+        <div class="alert alert-danger alert-dismissible fade show" role="alert">
+            Error al cargar los pedidos: ${error.message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
+        </div>
+    `;
+}
+
+// Carga completa: sólo los pedidos activos, página a página
 async function updateOrders() {
     try {
-        console.log('Fetching orders...');
-        const response = await fetch('/api/orders');
+        console.log('Fetching active orders...');
+        const activeOrders = [];
+        let cursor = null;
+        let firstSyncCursor = null;
+        do {
+            const params = { status: ACTIVE_STATUSES.join(','), limit: 200 };
+            if (cursor) params.cursor = cursor;
+            const data = await fetchOrdersPage(params);
+            activeOrders.push(...data.orders);
+            firstSyncCursor = firstSyncCursor || data.syncCursor;
+            cursor = data.nextCursor;
+        } while (cursor);
+
+        orders = activeOrders;
+        syncCursor = firstSyncCursor;
+        console.log('Active orders:', orders);
+        displayOrders();
+    } catch (error) {
+        console.error('Error fetching orders:', error);
+        showKitchenError(error);
+    }
+}
+
+// Carga incremental: sólo los pedidos creados o modificados desde el último cursor
+async function fetchOrderChanges() {
+    if (!syncCursor) {
+        return updateOrders();
+    }
+    if (fetchingChanges) return;
+    fetchingChanges = true;
+    try {
+        let hasMore = true;
+        while (hasMore) {
+            const data = await fetchOrdersPage({ since: syncCursor, limit: 200 });
+            data.orders.forEach(changed => {
+                orders = orders.filter(order => order.id !== changed.id);
+                if (ACTIVE_STATUSES.includes(changed.status)) {
+                    orders.push(changed);
+                }
+            });
+            syncCursor = data.syncCursor;
+            hasMore = data.hasMore;
+        }
+        orders.sort((a, b) => new Date(b.createdAt) - new Date(a.createdAt) || b.id - a.id);
+        displayOrders();
+    } catch (error) {
+        console.error('Error fetching order changes:', error);
+        showKitchenError(error);
+    } finally {
+        fetchingChanges = false;
+    }
+}
+
+async function fetchCookQueue() {
+    try {
+        const response = await fetch('/api/kitchen/queue');
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         const data = await response.json();
-        console.log('Received orders data:', data);
-        
-        if (Array.isArray(data)) {
-            // Filtrar solo pedidos pendientes y en preparación
-            orders = data.filter(order => 
-                order.status === 'pending' || 
-                order.status === 'preparing' ||
-                order.status === 'ready'
-            );
-            
-            console.log('Active orders after filtering:', orders);
-            
-            // Actualizar contadores inmediatamente
-            const pendingOrders = orders.filter(order => order.status === 'pending');
-            const preparingOrders = orders.filter(order => order.status === 'preparing');
-            const readyOrders = orders.filter(order => order.status === 'ready');
-            
-            document.getElementById('new-orders-count').textContent = pendingOrders.length.toString();
-            document.getElementById('in-progress-count').textContent = preparingOrders.length.toString();
-            document.getElementById('ready-count').textContent = readyOrders.length.toString();
-            document.getElementById('active-orders-count').textContent = `${orders.length} Activos`;
-            
-            // Mostrar los pedidos en sus respectivas secciones
-            displayOrders();
-            
-            // Actualizar el mapa de cocina
-            updateKitchenMap(orders);
-        } else {
-            throw new Error('Invalid data format received from server');
-        }
+        cookQueue = {};
+        cookQueueVersions = data.versions;
+        data.products.forEach(product => {
+            const variants = {};
+            product.variants.forEach(variant => {
+                variants[variant.key] = { customizations: variant.customizations, quantity: variant.quantity };
+            });
+            cookQueue[product.productId] = { productName: product.productName, variants };
+        });
+        renderCookQueue();
     } catch (error) {
-        console.error('Error fetching orders:', error);
-        // Mostrar mensaje de error al usuario
-        document.getElementById('kitchen-error').innerHTML = `
-            <div class="alert alert-danger alert-dismissible fade show" role="alert">
-                Error al cargar los pedidos: ${error.message}
-                <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
-            </div>
-        `;
+        console.error('Error fetching cook queue:', error);
+    }
+}
+
+function describeCustomizations(customizations) {
+    return Object.entries(customizations)
+        .map(([key, values]) => `${key}: ${values.join(', ')}`)
+        .join(' · ');
+}
+
+function renderCookQueue() {
+    const container = document.getElementById('cook-queue');
+    if (!container) return;
+    const products = Object.values(cookQueue).map(product => {
+        const variants = Object.values(product.variants).sort((a, b) => b.quantity - a.quantity);
+        const total = variants.reduce((sum, variant) => sum + variant.quantity, 0);
+        return { productName: product.productName, variants, total };
+    }).sort((a, b) => b.total - a.total);
+
+    document.getElementById('cook-queue-count').textContent = products.reduce((sum, p) => sum + p.total, 0);
+    if (products.length === 0) {
+        container.innerHTML = '<div class="col-12 text-muted text-center">No hay items por cocinar</div>';
+        return;
     }
+    container.innerHTML = products.map(product => `
+        <div class="col-md-3">
+            <div class="border rounded p-2 h-100">
+                <div class="d-flex justify-content-between align-items-center mb-1">
+                    <strong>${product.productName}</strong>
+                    <span class="badge bg-primary">${product.total}</span>
+                </div>
+                ${product.variants.map(variant => `
+                    <small class="d-block text-muted">
+                        ${variant.quantity}x ${Object.keys(variant.customizations).length > 0
+                            ? describeCustomizations(variant.customizations) : 'sin cambios'}
+                    </small>
+                `).join('')}
+            </div>
+        </div>
+    `).join('');
 }
 
 function displayOrders() {
@@ -444,7 +597,7 @@ function updateOrderStatus(orderId, status) {
     .then(data => {
         console.log('Order status updated:', data);
         // Actualizar la vista
-        updateOrders();
+        fetchOrderChanges();
         // Mostrar notificación de éxito
         showNotification(`Pedido #${orderId} actualizado a ${getStatusText(status)}`, 'success');
         
@@ -486,10 +639,3 @@ function showFeedbackModal(orderId) {
     //  of that feedback to your backend.
     alert(`Order ${orderId} completed! Show feedback modal here.`);
 }
-
-
-// Initial load and periodic updates
-document.addEventListener('DOMContentLoaded', () => {
-    updateOrders();
-    setInterval(updateOrders, 10000); // Update every 10 seconds
-});
\ No newline at end of file
@@ -286,7 +286,7 @@ function renderMenuItems(items) {
         <div class="col-12 col-md-6 mb-4">
             <div class="card h-100 menu-item-card shadow-sm border-0">
                 <div class="position-relative overflow-hidden">
-                    <img src="${item.image}?w=500&h=400&fit=crop&auto=format" 
+                    <img src="${item.thumbnail || `${item.image}?w=500&h=400&fit=crop&auto=format`}" 
                          class="card-img-top img-fluid" 
                          alt="${item.name}" 
                          loading="lazy"
@@ -391,33 +391,9 @@ async function addToCart(item, customizations = {}) {
         // Guardar el nombre del cliente para futuras referencias
         localStorage.setItem('customerName', customerName);
 
-        // Conectar con WebSocket si no está conectado
-        if (!window.socket) {
-            window.socket = io();
-            
-            // Configurar manejadores de eventos WebSocket
-            window.socket.on('connect', () => {
-                console.log('WebSocket conectado');
-            });
-            
-            window.socket.on('order_update', (data) => {
-                console.log('Actualización de pedido recibida:', data);
-            });
-            
-            window.socket.on('new_order', (data) => {
-                console.log('Nuevo pedido recibido:', data);
-            });
-        }
-
-        // Emitir evento de nuevo pedido
-        window.socket.emit('new_order', result);
-
         alert('¡Pedido creado con éxito! Redirigiendo a la página de pedidos...');
         
-        // Esperar un momento antes de redirigir para asegurar que el WebSocket se conecte
-        setTimeout(() => {
-            window.location.href = '/orders';
-        }, 1000);
+        window.location.href = '/orders';
         
     } catch (error) {
         console.error('Error al crear el pedido:', error);
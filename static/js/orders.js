@@ -1,37 +1,118 @@
-// Variable para almacenar los pedidos
+// Pedidos del cliente: el nombre se guarda en localStorage al hacer un pedido
+const customerName = localStorage.getItem('customerName');
 let orders = [];
+let ordersEtag = null;
+const orderEtags = {};
+// Hora estimada de entrega (ms) por id de pedido activo
+let etas = {};
 
 // Conectar con WebSocket para actualizaciones en tiempo real
 const socket = io();
 
-// Escuchar actualizaciones de pedidos
-socket.on('order_update', function(data) {
-    console.log('Order update received:', data);
-    updateOrders();
+socket.on('connect', function() {
+    if (!customerName) return;
+    socket.emit('join', { customer: customerName }, function() {
+        // Al (re)conectar se revalida la lista; si nada cambió responde 304
+        fetchCustomerOrders();
+    });
 });
 
-socket.on('order_status_changed', function(data) {
-    console.log('Order status changed:', data);
-    updateOrders();
+// Sin conexión en tiempo real se sigue con long-poll sobre la misma lista
+socket.on('disconnect', function() {
+    pollWhileDisconnected();
 });
 
-// Función para cargar los pedidos
-async function updateOrders() {
+// La sala del cliente sólo recibe deltas de sus pedidos: se trae ese pedido
+socket.on('order_delta', function(delta) {
+    console.log('Order delta received:', delta);
+    if (orders.some(o => o.id === delta.id)) {
+        fetchOrder(delta.id);
+    } else {
+        fetchCustomerOrders();
+    }
+});
+
+// Las estimaciones llegan completas en cada cambio de la cola de cocina
+socket.on('order_eta', function(data) {
+    setEtas(data.etas);
+    displayOrders();
+});
+
+function setEtas(estimates) {
+    // waitSeconds es relativo al servidor; se convierte a hora local al recibirlo
+    const now = Date.now();
+    etas = {};
+    Object.entries(estimates).forEach(([orderId, estimate]) => {
+        etas[orderId] = now + estimate.waitSeconds * 1000;
+    });
+}
+
+// Lista de pedidos del cliente; con 'wait' el servidor espera cambios (long-poll)
+async function fetchCustomerOrders(wait = 0) {
+    const url = `/api/customers/${encodeURIComponent(customerName)}/orders${wait ? `?wait=${wait}` : ''}`;
+    const response = await fetch(url, { headers: ordersEtag ? { 'If-None-Match': ordersEtag } : {} });
+    if (response.status === 304) {
+        return;
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    ordersEtag = response.headers.get('ETag');
+    const data = await response.json();
+    orders = data.orders;
+    // La lista trae la estimación de cada pedido activo; luego llegan por 'order_eta'
+    setEtas(Object.fromEntries(orders.filter(order => order.eta).map(order => [order.id, order.eta])));
+    displayOrders();
+}
+
+// Un solo pedido, revalidado con su propio ETag
+async function fetchOrder(orderId) {
     try {
-        const response = await fetch('/api/orders');
+        const etag = orderEtags[orderId];
+        const response = await fetch(`/api/orders/${orderId}`, { headers: etag ? { 'If-None-Match': etag } : {} });
+        if (response.status === 304) {
+            return;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        orders = await response.json();
+        orderEtags[orderId] = response.headers.get('ETag');
+        const changed = await response.json();
+        orders = orders.map(order => order.id === changed.id ? changed : order);
         displayOrders();
     } catch (error) {
-        console.error('Error fetching orders:', error);
+        console.error('Error fetching order:', error);
+    }
+}
+
+let polling = false;
+async function pollWhileDisconnected() {
+    if (polling || !customerName) return;
+    polling = true;
+    while (!socket.connected) {
+        try {
+            await fetchCustomerOrders(25);
+        } catch (error) {
+            console.error('Error polling orders:', error);
+            await new Promise(resolve => setTimeout(resolve, 5000));
+        }
     }
+    polling = false;
 }
 
 // Función para mostrar los pedidos
 function displayOrders() {
     const ordersList = document.getElementById('orders-list');
+    if (!customerName) {
+        ordersList.innerHTML = `
+            <div class="col-12">
+                <div class="alert alert-info text-center">
+                    <i class="bi bi-info-circle me-2"></i>
+                    Haz un pedido desde el menú para seguirlo aquí
+                </div>
+            </div>`;
+        return;
+    }
     if (!orders.length) {
         ordersList.innerHTML = `
             <div class="col-12">
@@ -59,6 +140,12 @@ function displayOrders() {
                             <i class="bi bi-clock me-2"></i>
                             ${new Date(order.createdAt).toLocaleString()}
                         </p>
+                        ${etas[order.id] && ['pending', 'preparing'].includes(order.status) ? `
+                            <p class="mb-2 text-primary">
+                                <i class="bi bi-hourglass-split me-2"></i>
+                                Listo aprox. a las ${new Date(etas[order.id]).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}
+                            </p>
+                        ` : ''}
                         <h6 class="mb-3">Items:</h6>
                         <ul class="list-unstyled">
                             ${order.items.map(item => `
@@ -113,7 +200,9 @@ function getStatusText(status) {
 
 // Cargar pedidos al iniciar la página
 document.addEventListener('DOMContentLoaded', function() {
-    updateOrders();
-    // Actualizar cada 30 segundos
-    setInterval(updateOrders, 30000);
+    if (!customerName) {
+        displayOrders();
+        return;
+    }
+    fetchCustomerOrders().catch(error => console.error('Error fetching orders:', error));
 });
@@ -0,0 +1,128 @@
+"""Configuración común de las pruebas.
+
+Las pruebas usan una base SQLite temporal. Las que dependen de PostgreSQL
+(bloqueos de filas, EXPLAIN) se saltan salvo que TEST_DATABASE_URL apunte a
+una base de pruebas, que se vacía en cada prueba:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/burger-test pytest
+"""
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Nunca la base configurada para la app: create_all/drop_all la vaciarían
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ['ORDER_RATE_LIMIT'] = '0'
+os.environ['ADMISSION_MAX_WAIT_MINUTES'] = '1000000'
+os.environ['NOTIFICATION_TRANSPORT'] = 'fake'
+os.environ['PROXY_FIX_HOPS'] = '1'
+
+from app import app as flask_app  # noqa: E402
+from database import db  # noqa: E402
+
+requires_postgres = pytest.mark.skipif(
+    not os.environ['DATABASE_URL'].startswith('postgresql'),
+    reason="requires TEST_DATABASE_URL pointing to PostgreSQL"
+)
+
+
+def wait_for_background_tasks(timeout=5):
+    # Tareas tras el commit (ETAs, avisos) corren en hilos propios; los del
+    # pool de envío de avisos quedan vivos esperando trabajo
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon \
+                and not thread.name.startswith('notifications'):
+            thread.join(timeout)
+
+
+@pytest.fixture
+def app():
+    from admission import admission_controller, IN_FLIGHT_TTL
+    from eta import kitchen_estimator
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        admission_controller._in_flight = (0, -IN_FLIGHT_TTL)
+        admission_controller._buckets.clear()
+        kitchen_estimator._prep = None
+        yield flask_app
+        wait_for_background_tasks()
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_product(app):
+    """Crea un producto (y su categoría) con una receta opcional {nombre: (stock, cantidad)}."""
+    from models import Category, Product, Inventory, ProductIngredient
+
+    def make(name='Classic', price=5.0, recipe=None, category_name='Hamburguesas'):
+        category = Category.query.filter_by(name=category_name).first()
+        if category is None:
+            category = Category(name=category_name)
+            db.session.add(category)
+            db.session.flush()
+        product = Product(name=name, price=price, category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        for ingredient_name, (stock, quantity) in (recipe or {}).items():
+            inventory = Inventory.query.filter_by(name=ingredient_name).first()
+            if inventory is None:
+                inventory = Inventory(name=ingredient_name, quantity=stock, unit='u', minimum_stock=0)
+                db.session.add(inventory)
+                db.session.flush()
+            db.session.add(ProductIngredient(product_id=product.id, inventory_id=inventory.id, quantity=quantity))
+        db.session.commit()
+        return product.id
+
+    return make
+
+
+@pytest.fixture
+def place_order(client):
+    def place(product_ids, customer='cliente', quantity=1):
+        response = client.post('/api/orders', json={
+            'customerName': customer,
+            'items': [{'productId': product_id, 'quantity': quantity} for product_id in product_ids]
+        })
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    return place
+
+
+@pytest.fixture
+def count_statements(app):
+    """Contexto que cuenta las sentencias SQL emitidas por el hilo actual."""
+    from contextlib import contextmanager
+    from sqlalchemy import event
+
+    @contextmanager
+    def counting():
+        thread_id = threading.get_ident()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread_id:
+                statements.append(statement)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counting
@@ -0,0 +1,43 @@
+"""Control de admisión de pedidos: límite por cliente (429) y carga de cocina (503)."""
+import pytest
+
+
+def post_order(client, product_id, ip):
+    return client.post('/api/orders', json={
+        'customerName': 'ana', 'items': [{'productId': product_id, 'quantity': 1}]
+    }, headers={'X-Forwarded-For': ip})
+
+
+@pytest.fixture
+def admission(app, monkeypatch):
+    from admission import admission_controller
+    monkeypatch.setattr(admission_controller, 'rate_per_minute', 6)
+    monkeypatch.setattr(admission_controller, 'burst', 2)
+    return admission_controller
+
+
+def test_rate_limit_is_per_forwarded_client(client, make_product, admission):
+    product_id = make_product()
+    assert [post_order(client, product_id, '203.0.113.1').status_code for _ in range(2)] == [200, 200]
+
+    rejected = post_order(client, product_id, '203.0.113.1')
+    assert rejected.status_code == 429
+    assert int(rejected.headers['Retry-After']) == rejected.get_json()['retryAfter'] > 0
+    # Otro cliente detrás del mismo proxy conserva su propio límite
+    assert post_order(client, product_id, '203.0.113.2').status_code == 200
+
+
+def test_busy_kitchen_rejects_without_spending_tokens(client, make_product, admission, monkeypatch):
+    from admission import IN_FLIGHT_TTL
+    product_id = make_product()
+    assert post_order(client, product_id, '203.0.113.1').status_code == 200
+
+    monkeypatch.setattr(admission, 'max_in_flight', 1)
+    admission._in_flight = (0, -IN_FLIGHT_TTL)
+    for _ in range(3):
+        busy = post_order(client, product_id, '203.0.113.1')
+        assert busy.status_code == 503
+        assert int(busy.headers['Retry-After']) >= 60
+
+    monkeypatch.setattr(admission, 'max_in_flight', None)
+    assert post_order(client, product_id, '203.0.113.1').status_code == 200
@@ -0,0 +1,48 @@
+"""Benchmark: latencia de POST /api/orders (p50/p99).
+
+Mide el alta de pedidos tal como queda (una transacción, perfiles de cliente
+en un trabajo posterior) y, como referencia, el mismo alta con el
+plegado de perfiles ejecutado dentro de la petición, que es el trabajo que
+antes pagaba el cliente al pagar. Con 'pytest -s' se imprimen los números:
+
+    CHECKOUT_ORDERS=1000 CHECKOUT_ITEMS=8 pytest -s tests/test_checkout_latency.py
+"""
+import os
+import statistics
+import time
+
+ORDERS = int(os.environ.get('CHECKOUT_ORDERS', 100))
+ITEMS = int(os.environ.get('CHECKOUT_ITEMS', 5))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return statistics.median(samples) * 1000, p99 * 1000
+
+
+def test_checkout_latency(app, client, make_product):
+    from app import update_customer_profiles
+    product_ids = [make_product(name=f"Producto {i}", recipe={f"Ingrediente {i}": (10 ** 6, 1)})
+                   for i in range(ITEMS)]
+    body = {'items': [{'productId': product_id, 'quantity': 1} for product_id in product_ids]}
+
+    def checkout(n, inline_profiles=False):
+        started = time.perf_counter()
+        response = client.post('/api/orders', json={'customerName': f"cliente-{n % 20}", **body})
+        if inline_profiles:
+            update_customer_profiles(response.get_json()['id'])
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.get_json()
+        return elapsed
+
+    # Calentamiento: cachés de pedidos en curso y medianas de preparación
+    for n in range(5):
+        checkout(n)
+    request_path = [checkout(n) for n in range(ORDERS)]
+    with_analytics = [checkout(n, inline_profiles=True) for n in range(ORDERS)]
+
+    p50, p99 = percentiles(request_path)
+    inline_p50, inline_p99 = percentiles(with_analytics)
+    print(f"\n{ORDERS} pedidos de {ITEMS} items: p50 {p50:.1f} ms, p99 {p99:.1f} ms "
+          f"(con perfiles en la petición: p50 {inline_p50:.1f} ms, p99 {inline_p99:.1f} ms)")
@@ -0,0 +1,46 @@
+"""Cola de cocción: cantidades por producto y versiones que nunca retroceden."""
+from database import db
+
+
+def queue(client):
+    return client.get('/api/kitchen/queue').get_json()
+
+
+def test_versions_grow_with_each_change(client, make_product, place_order):
+    product_id = make_product()
+    first = place_order([product_id])
+    versions = [queue(client)['versions'][f"{product_id}:"]]
+    place_order([product_id], quantity=2)
+    versions.append(queue(client)['versions'][f"{product_id}:"])
+    for status in ('preparing', 'ready'):
+        client.put(f"/api/orders/{first['id']}/status", json={'status': status})
+    snapshot = queue(client)
+    versions.append(snapshot['versions'][f"{product_id}:"])
+
+    assert versions == sorted(set(versions))
+    assert [product['quantity'] for product in snapshot['products']] == [2]
+
+
+def test_rows_left_at_zero_keep_their_version(client, make_product, place_order):
+    product_id = make_product()
+    order = place_order([product_id])
+    for status in ('preparing', 'ready'):
+        client.put(f"/api/orders/{order['id']}/status", json={'status': status})
+
+    snapshot = queue(client)
+    assert snapshot['products'] == []
+    assert snapshot['versions'][f"{product_id}:"] > 0
+
+
+def test_rebuild_never_lowers_versions(app, client, make_product, place_order):
+    from models import CookQueueItem
+    product_id = make_product()
+    place_order([product_id])
+    place_order([product_id])
+    before = queue(client)['versions'][f"{product_id}:"]
+
+    CookQueueItem.rebuild()
+    db.session.commit()
+    snapshot = queue(client)
+    assert snapshot['versions'][f"{product_id}:"] > before
+    assert snapshot['products'][0]['quantity'] == 2
@@ -0,0 +1,100 @@
+"""Reserva de inventario al pasar un pedido a 'preparing'.
+
+Las pruebas concurrentes necesitan bloqueos de filas reales (PostgreSQL):
+dos transacciones que reservan la última unidad no pueden dejar el stock en
+negativo ni perder un descuento.
+"""
+import threading
+import time
+
+from conftest import flask_app, requires_postgres
+from database import db
+
+
+def stock_of(name):
+    from models import Inventory
+    db.session.expire_all()
+    return Inventory.query.filter_by(name=name).one().quantity
+
+
+def test_shortage_rejects_order_without_touching_stock(app, client, make_product, place_order):
+    bun = make_product(name='Classic', recipe={'Pan': (1, 1), 'Carne': (5, 1)})
+    first = place_order([bun], customer='uno')
+    second = place_order([bun], customer='dos')
+
+    assert client.put(f"/api/orders/{first['id']}/status", json={'status': 'preparing'}).status_code == 200
+    response = client.put(f"/api/orders/{second['id']}/status", json={'status': 'preparing'})
+
+    assert response.status_code == 400
+    assert [shortage['name'] for shortage in response.get_json()['shortages']] == ['Pan']
+    assert stock_of('Pan') == 0
+    # Nada del pedido rechazado se descuenta, tampoco lo que sí alcanzaba
+    assert stock_of('Carne') == 4
+
+
+@requires_postgres
+def test_two_transactions_reserving_the_last_unit(app, make_product, place_order):
+    from models import Order, InsufficientInventoryError
+    product_id = make_product(recipe={'Pan': (1, 1)})
+    order_ids = [place_order([product_id], customer=name)['id'] for name in ('uno', 'dos')]
+
+    first_locked = threading.Event()
+    release_first = threading.Event()
+    outcomes = {}
+
+    def reserve(order_id, hold):
+        with flask_app.app_context():
+            try:
+                order = db.session.get(Order, order_id)
+                order.reserve_inventory()
+                if hold:
+                    # Mantiene el bloqueo de la fila hasta que la otra transacción espere
+                    first_locked.set()
+                    release_first.wait(10)
+                db.session.commit()
+                outcomes[order_id] = 'reserved'
+            except InsufficientInventoryError:
+                db.session.rollback()
+                outcomes[order_id] = 'shortage'
+            finally:
+                db.session.remove()
+
+    first = threading.Thread(target=reserve, args=(order_ids[0], True))
+    second = threading.Thread(target=reserve, args=(order_ids[1], False))
+    first.start()
+    assert first_locked.wait(10)
+    second.start()
+    # La segunda transacción queda bloqueada en SELECT ... FOR UPDATE
+    time.sleep(0.5)
+    assert second.is_alive()
+    release_first.set()
+    first.join(10)
+    second.join(10)
+
+    assert outcomes == {order_ids[0]: 'reserved', order_ids[1]: 'shortage'}
+    assert stock_of('Pan') == 0
+
+
+@requires_postgres
+def test_concurrent_status_updates_never_oversell(app, make_product, place_order):
+    stock = 3
+    product_id = make_product(recipe={'Pan': (stock, 1)})
+    order_ids = [place_order([product_id], customer=f"cliente-{n}")['id'] for n in range(stock * 2)]
+
+    barrier = threading.Barrier(len(order_ids))
+    statuses = []
+
+    def accept(order_id):
+        client = flask_app.test_client()
+        barrier.wait(10)
+        response = client.put(f"/api/orders/{order_id}/status", json={'status': 'preparing'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=accept, args=(order_id,)) for order_id in order_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(statuses) == [200] * stock + [400] * stock
+    assert stock_of('Pan') == 0
@@ -0,0 +1,34 @@
+"""Cola persistente de trabajos: ejecución, reintentos y retención."""
+from datetime import datetime, timedelta
+
+import jobs
+from database import db
+
+calls = []
+
+
+@jobs.handler('test_job')
+def record(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+
+
+def test_done_jobs_are_purged_after_retention(app):
+    from models import Job
+    calls.clear()
+    jobs.enqueue('test_job', {'value': 1})
+    jobs.enqueue('test_job', {'value': 2, 'fail': True}, max_attempts=1)
+    db.session.commit()
+
+    while jobs.run_next():
+        pass
+    assert sorted(calls) == [1, 2]
+    assert sorted(job.status for job in Job.query) == ['done', 'failed']
+
+    # Recién terminado se conserva; pasado el plazo se borra, salvo el fallido
+    assert jobs.purge_done() == 0
+    Job.query.filter_by(status='done').update({'run_after': datetime.utcnow() - timedelta(hours=25)})
+    db.session.commit()
+    assert jobs.purge_done() == 1
+    assert [job.status for job in Job.query] == ['failed']
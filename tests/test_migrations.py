@@ -0,0 +1,65 @@
+"""Las migraciones (migrations/versions) construyen el mismo esquema que los modelos."""
+import os
+import subprocess
+import sys
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+from conftest import ROOT
+from database import db
+
+
+def flask_db(database_url, *args):
+    env = dict(os.environ, DATABASE_URL=database_url, JOB_WORKERS='0')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', *args],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'migrations.db'}"
+
+
+def schema_diff(database_url):
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            return compare_metadata(MigrationContext.configure(connection), db.metadata)
+    finally:
+        engine.dispose()
+
+
+def test_upgrade_builds_the_models_schema(database_url):
+    flask_db(database_url, 'upgrade')
+    assert schema_diff(database_url) == []
+
+
+def test_downgrade_to_baseline_and_back(database_url):
+    flask_db(database_url, 'upgrade')
+    flask_db(database_url, 'downgrade', '0001_baseline')
+    flask_db(database_url, 'upgrade')
+    assert schema_diff(database_url) == []
+
+
+def test_upgrade_fills_data_of_existing_orders(database_url):
+    flask_db(database_url, 'upgrade', '0001_baseline')
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO category (id, name) VALUES (1, 'Hamburguesas')"))
+        connection.execute(text("INSERT INTO product (id, name, price, category_id) VALUES (1, 'Classic', 5.5, 1)"))
+        connection.execute(text("INSERT INTO \"order\" (id, customer_name, created_at) VALUES "
+                                "(1, 'ana', '2024-01-01 12:00:00'), (2, 'beto', '2024-01-02 12:00:00')"))
+        connection.execute(text("INSERT INTO order_item (order_id, product_id, quantity) VALUES (1, 1, 2)"))
+    engine.dispose()
+
+    flask_db(database_url, 'upgrade')
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT unit_price, line_total FROM order_item")).all() == [(5.5, 11.0)]
+        assert connection.execute(text("SELECT id, total_amount FROM \"order\" ORDER BY id")).all() == [(1, 11.0), (2, 0.0)]
+        # Visibles para la sincronización incremental desde su creación
+        assert connection.execute(text("SELECT count(*) FROM \"order\" WHERE updated_at = created_at")).scalar() == 2
+    engine.dispose()
@@ -0,0 +1,40 @@
+"""Personalizaciones del formulario del menú, con y sin catálogo de modificadores."""
+from database import db
+
+MENU_FORM = {'cooking': 'medium', 'extras': ['cheese'], 'instructions': 'sin  sal'}
+
+
+def order_item(client, product_id, customizations):
+    return client.post('/api/orders', json={
+        'customerName': 'ana',
+        'items': [{'productId': product_id, 'quantity': 1, 'customizations': customizations}]
+    })
+
+
+def test_menu_form_without_catalog_keeps_choices_as_instructions(client, make_product):
+    response = order_item(client, make_product(), MENU_FORM)
+    assert response.status_code == 200, response.get_json()
+
+    from models import OrderItem
+    item = OrderItem.query.one()
+    assert item.modifiers == []
+    assert item.instructions == 'cooking: medium; extras: cheese; sin sal'
+
+
+def test_menu_form_with_catalog_uses_modifiers(client, make_product):
+    from models import ModifierGroup, ModifierOption, OrderItem, Product
+    product_id = make_product(price=5.0)
+    group = ModifierGroup(code='extras', name='Extras', min_selections=0, max_selections=None, sort_order=0,
+                          options=[ModifierOption(code='cheese', name='Queso extra', price_delta=0.5, sort_order=0)])
+    db.session.get(Product, product_id).modifier_groups = [group]
+    db.session.commit()
+
+    response = order_item(client, product_id, MENU_FORM)
+    assert response.status_code == 200, response.get_json()
+    item = OrderItem.query.one()
+    assert [modifier.option.code for modifier in item.modifiers] == ['cheese']
+    assert item.instructions == 'cooking: medium; sin sal'
+    assert item.line_total == 5.5
+
+    # Un código de un grupo que el producto sí ofrece tiene que existir
+    assert order_item(client, product_id, {'extras': ['bacon']}).status_code == 400
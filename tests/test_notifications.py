@@ -0,0 +1,47 @@
+"""Avisos por SMS: un worker que muere con avisos reservados no los pierde."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from database import db
+
+
+def test_expired_lease_is_dispatched_again(app, client, make_product, monkeypatch):
+    from app import send_notifications
+    from models import Job, OrderNotification
+    import notifications
+    response = client.post('/api/orders', json={
+        'customerName': 'ana', 'customerPhone': '+5491100000000',
+        'items': [{'productId': make_product(), 'quantity': 1}]
+    })
+    order_id = response.get_json()['id']
+    Job.query.delete()
+    OrderNotification.query.update({'due_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    # El worker reserva los avisos y muere mientras los envía
+    def crash(messages):
+        raise RuntimeError('worker died')
+    monkeypatch.setattr(notifications.get_dispatcher(), 'send_all', crash)
+    with pytest.raises(RuntimeError):
+        send_notifications()
+    db.session.rollback()
+    monkeypatch.undo()
+
+    notification = db.session.get(OrderNotification, order_id)
+    assert notification.sent_status is None and notification.due_at > datetime.utcnow()
+    retry, = Job.query.filter_by(kind='send_notifications').all()
+    assert retry.run_after >= notification.due_at
+
+    # Al vencer la reserva, el envío agendado los retoma
+    past = datetime.utcnow() - timedelta(seconds=1)
+    OrderNotification.query.update({'due_at': past})
+    Job.query.update({'run_after': past})
+    db.session.commit()
+    sent_before = len(notifications.get_dispatcher().transport.sent)
+    assert jobs.run_next()
+
+    db.session.expire_all()
+    assert db.session.get(OrderNotification, order_id).sent_status == 'pending'
+    assert len(notifications.get_dispatcher().transport.sent) == sent_before + 1
@@ -0,0 +1,24 @@
+"""Horas estimadas de entrega: públicas sin nombres, completas sólo para cada cliente."""
+
+
+def test_public_etas_do_not_expose_customers(client, make_product, place_order):
+    product_id = make_product()
+    order = place_order([product_id], customer='ana')
+
+    etas = client.get('/api/orders/eta').get_json()['etas']
+    assert set(etas) == {str(order['id'])}
+    assert 'customerName' not in etas[str(order['id'])]
+
+
+def test_customer_orders_include_only_their_etas(client, make_product, place_order):
+    product_id = make_product()
+    first = place_order([product_id], customer='ana')
+    place_order([product_id], customer='beto')
+    done = place_order([product_id], customer='ana')
+    for status in ('preparing', 'ready', 'completed'):
+        client.put(f"/api/orders/{done['id']}/status", json={'status': status})
+
+    orders = {order['id']: order for order in client.get('/api/customers/ana/orders').get_json()['orders']}
+    assert set(orders) == {first['id'], done['id']}
+    assert orders[first['id']]['eta']['queuePosition'] == 1
+    assert orders[done['id']]['eta'] is None
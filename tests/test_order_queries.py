@@ -0,0 +1,82 @@
+"""Las rutas de pedidos hacen un número fijo de consultas, sin importar
+cuántos pedidos o items serialicen."""
+
+
+def create_orders(make_product, place_order, orders, items_per_order):
+    product_ids = [make_product(name=f"Producto {i}", price=1.0 + i) for i in range(items_per_order)]
+    return [place_order(product_ids, customer=f"cliente-{n}") for n in range(orders)]
+
+
+def test_orders_list_statement_count_does_not_grow(app, client, make_product, place_order, count_statements):
+    create_orders(make_product, place_order, orders=2, items_per_order=1)
+    with count_statements() as small:
+        assert client.get('/api/orders').status_code == 200
+
+    create_orders(make_product, place_order, orders=30, items_per_order=8)
+    with count_statements() as large:
+        response = client.get('/api/orders')
+    assert response.status_code == 200
+    assert len(response.get_json()['orders']) == 32
+    assert len(large) == len(small)
+
+
+def test_status_update_statement_count_does_not_grow(app, client, make_product, place_order, count_statements):
+    small_order, = create_orders(make_product, place_order, orders=1, items_per_order=1)
+    large_order, = create_orders(make_product, place_order, orders=1, items_per_order=15)
+
+    counts = []
+    for order in (small_order, large_order):
+        with count_statements() as statements:
+            response = client.put(f"/api/orders/{order['id']}/status", json={'status': 'preparing'})
+        assert response.status_code == 200, response.get_json()
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_create_order_statement_count_does_not_grow(app, client, make_product, place_order, count_statements):
+    product_ids = [make_product(name=f"Producto {i}") for i in range(12)]
+    # La primera llamada llena las cachés (pedidos en curso, medianas de preparación)
+    place_order(product_ids[:1])
+
+    counts = []
+    for items in (product_ids[:1], product_ids):
+        with count_statements() as statements:
+            place_order(items)
+        # Los INSERT de items van en lote donde el driver lo permite
+        # (insertmanyvalues en PostgreSQL); SQLite inserta fila por fila
+        counts.append(sum(1 for statement in statements if not statement.startswith('INSERT INTO order_item')))
+    assert counts[0] == counts[1]
+
+
+def add_modifiers(product_ids):
+    from database import db
+    from models import ModifierGroup, ModifierOption, Product
+    group = ModifierGroup(code='extras', name='Extras', min_selections=0, max_selections=None, sort_order=0,
+                          options=[ModifierOption(code=code, name=code, price_delta=0.5, sort_order=index)
+                                   for index, code in enumerate(('cheese', 'bacon'))])
+    for product_id in product_ids:
+        db.session.get(Product, product_id).modifier_groups = [group]
+    db.session.commit()
+
+
+def test_later_transitions_statement_count_does_not_grow(app, client, make_product, count_statements):
+    product_ids = [make_product(name=f"Producto {i}") for i in range(15)]
+    add_modifiers(product_ids)
+
+    def place(items):
+        response = client.post('/api/orders', json={'customerName': 'cliente', 'items': [
+            {'productId': product_id, 'quantity': 1, 'customizations': {'extras': ['cheese', 'bacon']}}
+            for product_id in items
+        ]})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['id']
+
+    small_order, large_order = place(product_ids[:1]), place(product_ids)
+    for status in ('preparing', 'ready', 'completed'):
+        counts = []
+        for order_id in (small_order, large_order):
+            with count_statements() as statements:
+                response = client.put(f"/api/orders/{order_id}/status", json={'status': status})
+            assert response.status_code == 200, response.get_json()
+            counts.append(len(statements))
+        assert counts[0] == counts[1], status
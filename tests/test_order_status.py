@@ -0,0 +1,82 @@
+"""Transiciones de estado de un pedido y lo que registran una sola vez."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+
+
+def set_status(client, order_id, status):
+    return client.put(f"/api/orders/{order_id}/status", json={'status': status})
+
+
+def complete(client, order_id):
+    for status in ('preparing', 'ready', 'completed'):
+        assert set_status(client, order_id, status).status_code == 200
+
+
+@pytest.mark.parametrize('status', ['created', 'cancelled', 'accepted', 'pending', 'ready'])
+def test_rejects_unknown_same_and_skipped_statuses(client, make_product, place_order, status):
+    order = place_order([make_product()])
+    response = set_status(client, order['id'], status)
+    assert response.status_code == 400
+    assert client.get(f"/api/orders/{order['id']}").get_json()['createdAt'] == order['createdAt']
+
+
+def test_rejects_going_back_without_reserving_again(client, make_product, place_order):
+    from models import Inventory
+    order = place_order([make_product(recipe={'Pan': (5, 1)})])
+    complete(client, order['id'])
+
+    for status in ('completed', 'pending', 'preparing'):
+        assert set_status(client, order['id'], status).status_code == 400
+    db.session.expire_all()
+    assert Inventory.query.filter_by(name='Pan').one().quantity == 4
+
+
+def test_kitchen_latency_counts_each_order_once(client, make_product, place_order):
+    from models import KitchenLatency
+    order = place_order([make_product()])
+    complete(client, order['id'])
+    set_status(client, order['id'], 'ready')
+    set_status(client, order['id'], 'preparing')
+
+    counts = {metric: sketch.count for (metric, dimension, _), sketch in KitchenLatency.sketches().items()
+              if dimension == 'all'}
+    assert counts == {'queue_wait': 1, 'prep_time': 1}
+
+
+def test_fold_skips_orders_already_folded(client, make_product, place_order):
+    from models import Order, DailySales, StatsCheckpoint
+    order = place_order([make_product(price=7.5)])
+    complete(client, order['id'])
+    # Fuera de la ventana de asentamiento
+    Order.query.filter_by(id=order['id']).update({'completed_at': datetime.utcnow() - timedelta(minutes=1)})
+    db.session.commit()
+
+    assert DailySales.fold_completed_orders() == 1
+    # Un punto de control atrasado no vuelve a sumar el pedido
+    StatsCheckpoint.query.update({'completed_at': datetime.min, 'order_id': 0})
+    db.session.commit()
+    assert DailySales.fold_completed_orders() == 0
+
+    day, = DailySales.query.all()
+    assert (day.order_count, day.total_sales) == (1, 7.5)
+
+
+def test_first_fold_keeps_existing_stats_and_counts_history(client, make_product, place_order):
+    from models import Order, DailySales, StatsCheckpoint
+    product_id = make_product(price=7.5)
+    folded, pending = place_order([product_id]), place_order([product_id])
+    for order in (folded, pending):
+        complete(client, order['id'])
+    Order.query.update({'completed_at': datetime.utcnow() - timedelta(minutes=1)})
+    db.session.commit()
+    DailySales.fold_orders([folded['id']])
+    db.session.commit()
+
+    # Sin punto de control: se suma la historia pendiente, sin borrar lo ya sumado
+    assert StatsCheckpoint.query.count() == 0
+    assert DailySales.fold_completed_orders() == 1
+    day, = DailySales.query.all()
+    assert (day.order_count, day.total_sales) == (2, 15.0)
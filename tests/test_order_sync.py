@@ -0,0 +1,97 @@
+"""Listado de pedidos: páginas por cursor y sincronización incremental (?since=)."""
+from datetime import datetime, timedelta
+
+from database import db
+
+
+def get_orders(client, **params):
+    response = client.get('/api/orders', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def backdate(order_ids, seconds):
+    from models import Order
+    Order.query.filter(Order.id.in_(order_ids)).update(
+        {'updated_at': datetime.utcnow() - timedelta(seconds=seconds)}, synchronize_session=False)
+    db.session.commit()
+
+
+def test_empty_store_sync_cursor_can_be_followed(client):
+    page = get_orders(client)
+    assert page['orders'] == []
+    changes = get_orders(client, since=page['syncCursor'])
+    assert changes['orders'] == [] and changes['hasMore'] is False
+    assert get_orders(client, since=changes['syncCursor'])['orders'] == []
+
+
+def test_old_empty_store_cursor_is_accepted(client):
+    from app import encode_cursor
+    assert get_orders(client, since=encode_cursor(datetime.min, 0))['orders'] == []
+
+
+def test_cursor_pages_cover_every_order_once(client, make_product, place_order):
+    product_id = make_product()
+    created = [place_order([product_id], customer=f"cliente-{n}")['id'] for n in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        page = get_orders(client, limit=3, **({'cursor': cursor} if cursor else {}))
+        seen += [order['id'] for order in page['orders']]
+        cursor = page['nextCursor']
+        if not cursor:
+            break
+    assert seen == sorted(created, reverse=True)
+
+
+def test_since_returns_only_later_changes(client, make_product, place_order):
+    product_id = make_product()
+    old = [place_order([product_id])['id'] for _ in range(3)]
+    backdate(old, 3600)
+    cursor = get_orders(client)['syncCursor']
+    # Fuera de la ventana de asentamiento del cursor
+    backdate(old, 7200)
+
+    changed = old[0]
+    client.put(f"/api/orders/{changed}/status", json={'status': 'preparing'})
+    new = place_order([product_id])['id']
+
+    ids = [order['id'] for order in get_orders(client, since=cursor)['orders']]
+    assert ids == [changed, new]
+
+
+def test_since_rereads_the_settle_window(client, make_product, place_order):
+    from app import SYNC_SETTLE_SECONDS
+    from models import Order
+    product_id = make_product()
+    old, first = place_order([product_id])['id'], place_order([product_id])['id']
+    backdate([old], 3600)
+    cursor = get_orders(client)['syncCursor']
+
+    # Una transacción que confirma después de leer el cursor con una marca anterior
+    late = place_order([product_id])['id']
+    synced_at = db.session.get(Order, first).updated_at
+    Order.query.filter_by(id=late).update(
+        {'updated_at': synced_at - timedelta(seconds=SYNC_SETTLE_SECONDS / 2)})
+    db.session.commit()
+
+    assert [order['id'] for order in get_orders(client, since=cursor)['orders']] == [late, first]
+
+
+def test_since_pages_continue_exactly(client, make_product, place_order):
+    product_id = make_product()
+    old = [place_order([product_id])['id'] for _ in range(2)]
+    backdate(old, 3600)
+    cursor = get_orders(client)['syncCursor']
+    backdate(old, 7200)
+    new = [place_order([product_id])['id'] for _ in range(5)]
+
+    seen, pages = [], 0
+    while True:
+        page = get_orders(client, since=cursor, limit=2)
+        seen += [order['id'] for order in page['orders']]
+        cursor, pages = page['syncCursor'], pages + 1
+        if not page['hasMore']:
+            break
+    assert seen == new and pages == 3
+    assert get_orders(client, since=cursor)['orders'][-1]['id'] == new[-1]
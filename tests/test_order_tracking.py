@@ -0,0 +1,19 @@
+"""Seguimiento de un pedido con GET condicional."""
+
+
+def test_missing_order_is_404(client):
+    response = client.get('/api/orders/999')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Order not found'}
+
+
+def test_unchanged_order_is_304(client, make_product, place_order):
+    order = place_order([make_product()])
+    first = client.get(f"/api/orders/{order['id']}")
+    assert first.status_code == 200 and first.get_json()['id'] == order['id']
+
+    again = client.get(f"/api/orders/{order['id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    client.put(f"/api/orders/{order['id']}/status", json={'status': 'preparing'})
+    changed = client.get(f"/api/orders/{order['id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.get_json()['status'] == 'preparing'
@@ -0,0 +1,30 @@
+"""Las consultas frecuentes (query_plans.hot_queries) usan índices.
+
+El EXPLAIN sólo tiene sentido en PostgreSQL; en SQLite se comprueba al menos
+que cada consulta de la lista sigue siendo válida contra el esquema actual.
+"""
+import pytest
+
+from conftest import flask_app, requires_postgres
+from database import db
+
+
+def hot_query_names():
+    from query_plans import hot_queries
+    with flask_app.app_context():
+        return [name for name, _ in hot_queries()]
+
+
+@pytest.mark.parametrize('name', hot_query_names())
+def test_hot_query_runs(app, name):
+    from query_plans import hot_queries
+    query = dict(hot_queries())[name]
+    statement = query.statement if hasattr(query, 'statement') else query
+    db.session.execute(statement).all()
+
+
+@requires_postgres
+def test_hot_queries_use_indexes(app):
+    from query_plans import check_plans
+    failures = check_plans()
+    assert failures == [], '\n'.join(f"{name}: Seq Scan en {', '.join(tables)}" for name, tables in failures)
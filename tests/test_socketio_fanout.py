@@ -0,0 +1,126 @@
+"""Benchmark: eventos de pedidos entre dos procesos servidores.
+
+Levanta dos servidores (gunicorn main:app) que comparten una cola de mensajes, conecta
+clientes WebSocket a cada uno en la sala 'kitchen' y crea pedidos alternando
+el servidor. Todos los clientes deben recibir todos los pedidos, sin importar
+a qué proceso estén conectados. Por defecto usa la cola de archivos de Kombu
+(filesystem://); con FANOUT_MESSAGE_QUEUE se puede medir contra Redis:
+
+    FANOUT_MESSAGE_QUEUE=redis://localhost:6379/0 FANOUT_CLIENTS=50 pytest -s tests/test_socketio_fanout.py
+"""
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip('kombu')
+pytest.importorskip('gunicorn')
+socketio_client = pytest.importorskip('socketio')
+
+CLIENTS_PER_SERVER = int(os.environ.get('FANOUT_CLIENTS', 5))
+ORDERS = int(os.environ.get('FANOUT_ORDERS', 10))
+DELIVERY_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/api/categories", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def post_order(url, product_id, customer):
+    body = json.dumps({'customerName': customer, 'items': [{'productId': product_id, 'quantity': 1}]}).encode()
+    request = urllib.request.Request(f"{url}/api/orders", body, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())['id']
+
+
+@pytest.fixture
+def servers(app, tmp_path):
+    queue = os.environ.get('FANOUT_MESSAGE_QUEUE') or f"filesystem://{tmp_path / 'queue'}"
+    processes, urls = [], []
+    for _ in range(2):
+        port = free_port()
+        env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=queue,
+                   SOCKETIO_ASYNC_MODE='threading', JOB_WORKERS='0')
+        command = [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', '100', '--graceful-timeout', '1',
+                   '--bind', f"127.0.0.1:{port}", 'main:app']
+        processes.append(subprocess.Popen(command, cwd=ROOT, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        urls.append(f"http://127.0.0.1:{port}")
+    try:
+        for url in urls:
+            wait_until_up(url)
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+def test_events_reach_clients_on_both_processes(servers, make_product):
+    product_id = make_product()
+    sent_at = {}
+    received = []
+    lock = threading.Lock()
+    clients = []
+
+    for server_index, url in enumerate(servers):
+        for client_index in range(CLIENTS_PER_SERVER):
+            client = socketio_client.Client()
+            name = (server_index, client_index)
+
+            def on_new_order(data, name=name):
+                with lock:
+                    received.append((name, data['order']['id'], time.monotonic()))
+
+            client.on('new_order', on_new_order)
+            client.connect(url, wait_timeout=10)
+            client.call('join', {'room': 'kitchen'}, timeout=10)
+            clients.append(client)
+
+    try:
+        for n in range(ORDERS):
+            # Se alternan los servidores: cada evento cruza de un proceso al otro
+            started = time.monotonic()
+            order_id = post_order(servers[n % 2], product_id, f"cliente-{n}")
+            sent_at[order_id] = started
+
+        expected = len(clients) * ORDERS
+        deadline = time.monotonic() + DELIVERY_TIMEOUT
+        while len(received) < expected and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        # Cada desconexión espera a que termine su transporte: en paralelo
+        closing = [threading.Thread(target=client.disconnect) for client in clients]
+        for thread in closing:
+            thread.start()
+        for thread in closing:
+            thread.join(10)
+
+    deliveries = {(name, order_id) for name, order_id, _ in received}
+    assert len(deliveries) == len(clients) * ORDERS
+    latencies = sorted(at - sent_at[order_id] for _, order_id, at in received)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"\n{len(clients)} clientes en 2 procesos, {ORDERS} pedidos: "
+          f"p50 {statistics.median(latencies) * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms")
@@ -0,0 +1,76 @@
+"""Benchmark: estadísticas de ventas sobre un año sintético de pedidos.
+
+Compara el plegado completo del año (lo que antes costaba cada carga de la
+página de estadísticas) con la ejecución incremental que sólo suma el
+último día y con la reconstrucción de un mes. Con 'pytest -s' se imprimen
+los tiempos:
+
+    STATS_YEAR_ORDERS=200000 pytest -s tests/test_stats_benchmark.py
+"""
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from database import db
+
+YEAR_ORDERS = int(os.environ.get('STATS_YEAR_ORDERS', 20000))
+PRODUCTS = 20
+
+
+def insert_orders(first_id, count, start, span):
+    """Pedidos completados con created_at repartido en [start, start + span)."""
+    from models import Order, OrderItem
+    rng = random.Random(first_id)
+    orders, items = [], []
+    for order_id in range(first_id, first_id + count):
+        created_at = start + timedelta(seconds=rng.randrange(int(span.total_seconds())))
+        lines = [(rng.randrange(1, PRODUCTS + 1), rng.randrange(1, 3)) for _ in range(rng.randrange(1, 4))]
+        for product_id, quantity in lines:
+            items.append({'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+                          'unit_price': float(product_id), 'line_total': float(product_id * quantity)})
+        orders.append({'id': order_id, 'customer_name': f"cliente-{order_id % 500}", 'status': 'completed',
+                       'created_at': created_at, 'completed_at': created_at + timedelta(minutes=10),
+                       'updated_at': created_at + timedelta(minutes=10),
+                       'total_amount': float(sum(product_id * quantity for product_id, quantity in lines))})
+    db.session.execute(db.insert(Order), orders)
+    db.session.execute(db.insert(OrderItem), items)
+    db.session.commit()
+    return sum(order['total_amount'] for order in orders)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def test_synthetic_year(app, make_product):
+    from models import DailySales
+    for n in range(1, PRODUCTS + 1):
+        make_product(name=f"Producto {n}", price=float(n))
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    year_start = today - timedelta(days=366)
+    year_total = insert_orders(1, YEAR_ORDERS, year_start, timedelta(days=365))
+    processed, full_seconds = timed(DailySales.fold_completed_orders)
+    assert processed == YEAR_ORDERS
+
+    # Un día más de pedidos, ya fuera de la ventana de asentamiento
+    day_orders = max(1, YEAR_ORDERS // 365)
+    day_start = datetime.utcnow() - timedelta(hours=2)
+    day_total = insert_orders(YEAR_ORDERS + 1, day_orders, day_start, timedelta(hours=1))
+    processed, incremental_seconds = timed(DailySales.fold_completed_orders)
+    assert processed == day_orders
+
+    month_start = (year_start + timedelta(days=180)).date()
+    _, month_seconds = timed(DailySales.rebuild, month_start, month_start + timedelta(days=30))
+
+    order_count, total_sales = db.session.query(
+        db.func.sum(DailySales.order_count), db.func.sum(DailySales.total_sales)).one()
+    assert order_count == YEAR_ORDERS + day_orders
+    assert round(total_sales, 2) == round(year_total + day_total, 2)
+
+    print(f"\n{YEAR_ORDERS} pedidos en un año: completo {full_seconds:.2f} s, "
+          f"incremental ({day_orders} pedidos) {incremental_seconds * 1000:.0f} ms "
+          f"({full_seconds / incremental_seconds:.0f}x), un mes reconstruido {month_seconds:.2f} s")